@@ -51,6 +51,7 @@ class DeveloperPlugin:
 
     def teardown(self, exaile):
         event.remove_callback(self.on_events)
+        self.set_profiling(False)
         if self.window:
             self.window.destroy()
         if self.menu:
@@ -105,6 +106,27 @@ class DeveloperPlugin:
             if all_count != last_count:
                 return self.events.copy(), all_count
 
+    #
+    # Event profiler
+    #
+
+    def set_profiling(self, enabled):
+        event.EVENT_MANAGER.set_profiling(enabled)
+
+    def clear_profile(self):
+        profiler = event.EVENT_MANAGER.profiler
+        if profiler is not None:
+            profiler.clear()
+
+    def get_profile_data(self):
+        """
+        :returns: the data of :meth:`xl.event.EventProfiler.get_stats`, or
+            None if profiling is off
+        """
+        profiler = event.EVENT_MANAGER.profiler
+        if profiler is not None:
+            return profiler.get_stats()
+
 
 plugin_class = DeveloperPlugin
 
@@ -118,7 +140,11 @@ class DeveloperWindow(Gtk.Window):
         event_model_filter,
         event_tree,
         event_store,
-    ) = GtkTemplate.Child.widgets(4)
+        profile_tree,
+        profile_store,
+        profile_status_label,
+        profile_toggle,
+    ) = GtkTemplate.Child.widgets(8)
 
     def __init__(self, parent, plugin):
         Gtk.Window.__init__(self)
@@ -143,6 +169,17 @@ class DeveloperWindow(Gtk.Window):
 
         self.event_timeout_id = GLib.timeout_add(250, self.on_event_update)
 
+        # key: (event name, callback name), value: iter
+        self.profile_model_idx = {}
+        # the columns are in the same order as the model
+        for idx, fmt in ((3, '%.1f'), (4, '%.1f'), (5, '%.3f'), (6, '%.3f')):
+            column = self.profile_tree.get_column(idx)
+            renderer = column.get_cells()[0]
+            renderer.props.xalign = 1.0
+            column.set_cell_data_func(renderer, self._format_float_cell, (idx, fmt))
+        self.profile_toggle.set_active(self.plugin.get_profile_data() is not None)
+        self.profile_timeout_id = GLib.timeout_add(1000, self.on_profile_update)
+
     @GtkTemplate.Callback
     def on_clear_events(self, widget):
         self.plugin.clear_events()
@@ -153,6 +190,7 @@ class DeveloperWindow(Gtk.Window):
     @GtkTemplate.Callback
     def on_delete(self, widget, event):
         GLib.source_remove(self.event_timeout_id)
+        GLib.source_remove(self.profile_timeout_id)
 
     def on_event_filter_row(self, model, titer, unused):
         row = model.get(titer, 0)
@@ -182,3 +220,63 @@ class DeveloperWindow(Gtk.Window):
                     self.event_model_idx[name] = titer
 
         return True
+
+    #
+    # Event profiler
+    #
+
+    @staticmethod
+    def _format_float_cell(column, cell, model, titer, data):
+        idx, fmt = data
+        cell.props.text = fmt % model.get_value(titer, idx)
+
+    @GtkTemplate.Callback
+    def on_profile_toggle(self, widget):
+        self.plugin.set_profiling(widget.get_active())
+        self.on_profile_update()
+
+    @GtkTemplate.Callback
+    def on_clear_profile(self, widget):
+        self.plugin.clear_profile()
+        self.profile_model_idx.clear()
+        self.profile_store.clear()
+        self.on_profile_update()
+
+    def on_profile_update(self):
+        '''Periodically updates the displayed event profile'''
+        queue = event.EVENT_MANAGER.get_ui_queue_stats()
+        queue_text = _('UI queue: %(depth)d waiting, %(latency).1f ms maximum wait') % {
+            'depth': queue['depth'],
+            'latency': queue['max_latency'] * 1000,
+        }
+
+        data = self.plugin.get_profile_data()
+        if data is None:
+            self.profile_status_label.set_text(
+                '%s. %s' % (_('Profiling is off'), queue_text)
+            )
+            return True
+
+        elapsed, events, callbacks = data
+        self.profile_status_label.set_text(
+            '%s. %s' % (_('Profiling for %d seconds') % elapsed, queue_text)
+        )
+        rows = [((name, ''), stats) for name, stats in events.items()]
+        rows.extend(callbacks.items())
+        for key, (count, total, maximum) in rows:
+            values = [
+                key[0],
+                key[1],
+                count,
+                count / elapsed if elapsed else 0.0,
+                total * 1000,
+                total * 1000 / count if count else 0.0,
+                maximum * 1000,
+            ]
+            titer = self.profile_model_idx.get(key)
+            if titer:
+                self.profile_store.set(titer, list(range(7)), values)
+            else:
+                self.profile_model_idx[key] = self.profile_store.append(values)
+
+        return True
@@ -791,7 +791,7 @@ class PlaylistButtonControl(Gtk.ToggleButton, BaseControl, QueueAdapter):
         self.connect('drag-data-received', self.on_drag_data_received)
         self.view.connect('drag-motion', self.on_drag_motion)
         self.view.connect('drag-leave', self.on_drag_leave)
-        event.add_ui_callback(self.on_track_tags_changed, 'track_tags_changed')
+        event.add_ui_callback(self.on_tracks_tags_changed, 'tracks_tags_changed')
         event.add_ui_callback(self.on_option_set, 'plugin_minimode_option_set')
         self.on_option_set(
             'plugin_minimode_option_set', settings, 'plugin/minimode/track_title_format'
@@ -947,17 +947,14 @@ class PlaylistButtonControl(Gtk.ToggleButton, BaseControl, QueueAdapter):
 
         GLib.idle_add(self.label.set_text, text)
 
-    def on_track_tags_changed(self, event, track, tags):
+    def on_tracks_tags_changed(self, event, obj, changes):
         """
         Updates the button on tag changes
         """
         playlist = self.view.playlist
+        track = playlist.current
 
-        if track not in playlist:
-            return
-
-        track_position = playlist.index(track)
-        if track_position == playlist.current_position:
+        if track is not None and track in changes:
             self.label.set_text(self.formatter.format(track))
 
     def on_option_set(self, event, settings, option):
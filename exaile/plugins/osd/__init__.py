@@ -134,6 +134,7 @@ class OSDPlugin:
         self.__window.destroy_osd()
         event.remove_callback(self.__on_option_set, 'plugin_osd_option_set')
         event.remove_callback(self.__on_playback_track_start, 'playback_track_start')
+        event.remove_callback(self.__on_tracks_tags_changed, 'tracks_tags_changed')
         event.remove_callback(self.__on_playback_toggle_pause, 'playback_toggle_pause')
         event.remove_callback(self.__on_playback_player_end, 'playback_player_end')
         event.remove_callback(self.__on_playback_error, 'playback_error')
@@ -155,7 +156,7 @@ class OSDPlugin:
         # TODO: OSD looks ugly with CSS not applied on first show. Why is that?
 
         event.add_callback(self.__on_playback_track_start, 'playback_track_start')
-        event.add_callback(self.__on_playback_track_start, 'track_tags_changed')
+        event.add_callback(self.__on_tracks_tags_changed, 'tracks_tags_changed')
         event.add_callback(self.__on_playback_toggle_pause, 'playback_toggle_pause')
         event.add_callback(self.__on_playback_player_end, 'playback_player_end')
         event.add_callback(self.__on_playback_error, 'playback_error')
@@ -276,6 +277,9 @@ class OSDPlugin:
     def __on_playback_track_start(self, _event, _player, _track):
         self.__window.show_for_a_while()
 
+    def __on_tracks_tags_changed(self, _event, _obj, _changes):
+        self.__window.show_for_a_while()
+
     def __on_playback_toggle_pause(self, _event, _player, _track):
         self.__window.show_for_a_while()
 
@@ -324,7 +328,7 @@ class OSDWindow(Gtk.Window):
         Initializes the OSD Window.
         Important: Do not call this constructor before Exaile finished loading,
             otherwise the internal TrackInfoPane will re-render label and icon on each
-            `track_tags_changed` event, which causes unnecessary CPU load and delays startup.
+            `tracks_tags_changed` event, which causes unnecessary CPU load and delays startup.
 
         Apply the options after this object was initialized.
         """
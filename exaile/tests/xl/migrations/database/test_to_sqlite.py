@@ -0,0 +1,37 @@
+from unittest.mock import patch
+
+from xl.migrations.database.to_sqlite import migrate
+
+
+def test_migrate_existing_sqlite(tmp_path):
+    new_path = tmp_path / "music.sqlite"
+    new_path.write_bytes(b"")
+    with patch("xl.trax.trackdb.TrackDB") as mock_trackdb:
+        assert migrate(str(tmp_path / "music.db"), str(new_path)) is True
+        mock_trackdb.assert_not_called()
+
+def test_migrate_without_shelf(tmp_path):
+    with patch("xl.trax.trackdb.TrackDB") as mock_trackdb:
+        assert migrate(str(tmp_path / "music.db"), str(tmp_path / "music.sqlite")) is True
+        mock_trackdb.assert_not_called()
+
+def test_migrate_shelf(tmp_path):
+    path = tmp_path / "music.db"
+    path.write_bytes(b"shelf")
+    new_path = tmp_path / "music.sqlite"
+    with patch("xl.trax.trackdb.TrackDB") as mock_trackdb:
+        mock_trackdb.return_value._save_to_sqlite.side_effect = lambda p: open(p, 'w').close()
+        assert migrate(str(path), str(new_path), ['_serial_libraries']) is True
+    mock_trackdb.assert_called_once_with(pickle_attrs=['_serial_libraries'], lazy=True)
+    mock_trackdb.return_value.load_from_location.assert_called_once_with(str(path))
+    assert new_path.exists()
+    assert path.exists()
+
+def test_migrate_failure(tmp_path):
+    path = tmp_path / "music.db"
+    path.write_bytes(b"shelf")
+    new_path = tmp_path / "music.sqlite"
+    with patch("xl.trax.trackdb.TrackDB") as mock_trackdb:
+        mock_trackdb.return_value.load_from_location.side_effect = Exception("corrupt")
+        assert migrate(str(path), str(new_path)) is False
+    assert not new_path.exists()
@@ -1,6 +1,7 @@
 import pytest
 import os
 from xl import common, event, settings, trax
+import xl.collection
 from collections import deque
 import logging
 import threading
@@ -282,10 +283,12 @@ def test_rescan():
     with patch('gi.repository.Gio.File.new_for_uri') as mock_new_for_uri:
         mock_file = MagicMock()
         mock_new_for_uri.return_value = mock_file
-        mock_file.query_info.return_value.get_file_type.return_value = Gio.FileType.REGULAR
-        with patch('xl.collection.common.walk') as mock_walk:
-            mock_walk.return_value = [mock_file]
+        mock_info = MagicMock()
+        mock_info.get_file_type.return_value = Gio.FileType.REGULAR
+        with patch('xl.collection.common.walk_with_info') as mock_walk:
+            mock_walk.return_value = [(mock_file, mock_info)]
             assert library.rescan() is False
+            mock_file.query_info.assert_not_called()
 
 def test_delete():
     library = Library("file:///test/library")
@@ -338,34 +341,114 @@ def test_count_files_scanStopped():
         mock_walk.return_value = [MagicMock(), MagicMock(), MagicMock()]
         assert library._count_files() == 0
 
-def test_check_compilation():
+def make_compilation_track(basedir, album, artist):
+    track = MagicMock()
+    tags = {'__basedir': basedir, 'album': album, 'artist': artist, '__compilation': None}
+    track.get_tag_raw.side_effect = lambda tag: tags[tag]
+    track.set_tag_raw.side_effect = tags.__setitem__
+    return track
+
+def make_compilation_library(tracks):
     library = Library("file:///test/library")
-    ccheck = {}
-    compilations = []
-    track1 = MagicMock()
-    track1.get_tag_raw.side_effect = lambda tag: {
-        '__basedir': 'dir1',
-        'album': 'album1',
-        'artist': 'artist1'
-    }[tag]
-    track2 = MagicMock()
-    track2.get_tag_raw.side_effect = lambda tag: {
-        '__basedir': 'dir1',
-        'album': 'album1',
-        'artist': 'artist2'
-    }[tag]
-    library._check_compilation(ccheck, compilations, track1)
-    library._check_compilation(ccheck, compilations, track2)
-    assert ('dir1', 'album1') in compilations
-
-def test_check_no_compilation():
+    library.collection = MagicMock()
+    library.collection.get_track_by_loc.side_effect = tracks.get
+    for loc, track in tracks.items():
+        library._index_compilation_track(loc, track)
+    return library
+
+def test_detect_compilations():
+    tracks = {
+        'loc1': make_compilation_track('dir1', ['Album1'], ['artist1']),
+        'loc2': make_compilation_track('dir1', ['album1'], ['artist2']),
+        'loc3': make_compilation_track('dir1', ['album1'], None),
+        'loc4': make_compilation_track('dir1', ['album2'], ['artist1']),
+        'loc5': make_compilation_track('dir2', ['album1'], ['artist3']),
+    }
+    library = make_compilation_library(tracks)
+    library._detect_compilations()
+    compilations = {loc: track.get_tag_raw('__compilation') for loc, track in tracks.items()}
+    assert compilations == {
+        'loc1': ('dir1', 'album1'),
+        'loc2': ('dir1', 'album1'),
+        'loc3': ('dir1', 'album1'),
+        'loc4': None,
+        'loc5': None,
+    }
+    assert library._compilation_dirs == set()
+
+def test_detect_compilations_large_directory():
+    tracks = {
+        'loc%d' % i: make_compilation_track('dir1', ['album1'], ['artist%d' % i])
+        for i in range(500)
+    }
+    library = make_compilation_library(tracks)
+    library._detect_compilations()
+    assert all(
+        track.get_tag_raw('__compilation') == ('dir1', 'album1')
+        for track in tracks.values()
+    )
+
+def test_detect_compilations_only_changed_directories():
+    tracks = {
+        'loc1': make_compilation_track('dir1', ['album1'], ['artist1']),
+        'loc2': make_compilation_track('dir1', ['album1'], ['artist2']),
+        'loc3': make_compilation_track('dir2', ['album1'], ['artist1']),
+        'loc4': make_compilation_track('dir2', ['album1'], ['artist2']),
+    }
+    library = make_compilation_library(tracks)
+    library._detect_compilations()
+    for track in tracks.values():
+        track.set_tag_raw.reset_mock()
+
+    # unchanged tracks don't need checking again
+    library._index_compilation_track('loc3', tracks['loc3'])
+    assert library._compilation_dirs == set()
+
+    # removing a track ends the compilation of its directory
+    library._index_compilation_track('loc2', None)
+    library._detect_compilations()
+    tracks['loc1'].set_tag_raw.assert_called_once_with('__compilation', None)
+    tracks['loc3'].set_tag_raw.assert_not_called()
+    tracks['loc4'].set_tag_raw.assert_not_called()
+
+def test_load_compilation_index():
+    from xl.trax.trackdb import TrackHolder
     library = Library("file:///test/library")
-    ccheck = {}
-    compilations = []
-    track = MagicMock()
-    with patch('xl.collection.settings.get_option', return_value=False):
-        library._check_compilation(ccheck, compilations, track)
-        assert compilations == []
+    library.collection = MagicMock()
+    library.collection.tracks = {}
+    for num, (loc, artist) in enumerate([
+        ('file:///test/library/dir1/a.mp3', 'artist1'),
+        ('file:///test/library/dir1/b.mp3', 'artist2'),
+        ('file:///other/library/dir1/c.mp3', 'artist3'),
+    ]):
+        tags = {'__loc': loc, '__basedir': 'dir1', 'album': ['album1'], 'artist': [artist]}
+        library.collection.tracks[loc] = TrackHolder.lazy(tags, num)
+    library._load_compilation_index(Gio.File.new_for_uri(library.location))
+    assert library._compilation_keys == {
+        'file:///test/library/dir1/a.mp3': ('dir1', 'album1', 'artist1'),
+        'file:///test/library/dir1/b.mp3': ('dir1', 'album1', 'artist2'),
+    }
+    assert library._compilation_dirs == set()
+    assert not any(h._is_loaded() for h in library.collection.tracks.values())
+
+    # a rescan only checks directories that changed since
+    track = make_compilation_track('dir1', ['album1'], ['artist1'])
+    library._index_compilation_track('file:///test/library/dir1/a.mp3', track)
+    assert library._compilation_dirs == set()
+
+def test_rescan_without_compilations():
+    library = Library("file:///test/library")
+    library.collection = MagicMock()
+    library.collection._scan_stopped = False
+    library._index_compilation_track('loc1', make_compilation_track('dir1', ['album1'], ['artist1']))
+    with patch('gi.repository.Gio.File.new_for_uri'), \
+         patch('xl.collection.common.walk_with_info', return_value=[]), \
+         patch.object(xl.collection._FILE_BASED_COMPILATIONS, 'value', False), \
+         patch.object(library, '_detect_compilations') as mock_detect:
+        assert library.rescan() is False
+    mock_detect.assert_not_called()
+    assert library._compilation_keys == {}
+    assert library._compilation_dirs == set()
 
 def test_update_track():
     library = Library("file:///test/library")
@@ -376,7 +459,7 @@ def test_update_track():
     library.collection.get_track_by_loc.return_value = track
     with patch('xl.trax.Track') as mock_track:
         result = library.update_track(gfile, force_update=True)
-        track.read_tags.assert_called_once_with(force=True)
+        track.read_tags.assert_called_once_with(force=True, mtime=None)
         assert result is track
 
 def test_update_track_no_uri():
@@ -426,3 +509,77 @@ def test_dequeue_nonexistent_track():
     queue.enqueue([track1])
     queue.dequeue([track2])
     assert queue.queue == [track1]
+
+def test_update_tracks_parallel_keeps_walk_order():
+    library = Library("file:///test/library")
+    library.collection = MagicMock()
+    library.collection.get_track_by_loc.return_value = None
+    files = []
+    for i in range(50):
+        fil = MagicMock()
+        fil.get_uri.return_value = "file:///test/library/%02d.mp3" % i
+        files.append(fil)
+    fileinfo = MagicMock()
+    fileinfo.get_file_type.return_value = Gio.FileType.REGULAR
+    entries = [(fil, fileinfo) for fil in files]
+    tracks = {}
+
+    def make_track(uri, scan=True):
+        track = MagicMock()
+        track._init = True
+        track._scan_valid = True
+        track._fetch_disk_tags.return_value = (MagicMock(), {'title': [uri]})
+        tracks[uri] = track
+        return track
+
+    with patch('xl.collection.settings.get_option', return_value=4), \
+         patch('xl.collection.trax.Track', side_effect=make_track):
+        result = list(library._update_tracks(entries, False))
+
+    assert [fil for fil, type, tr in result] == files
+    assert [tr for fil, type, tr in result] == [
+        tracks[fil.get_uri()] for fil in files
+    ]
+    assert library.collection.add.call_args_list == [
+        call(tracks[fil.get_uri()]) for fil in files
+    ]
+    mtime = fileinfo.get_modification_date_time.return_value.to_unix.return_value
+    for track in tracks.values():
+        track._fetch_disk_tags.assert_called_once_with(True, mtime)
+        track._apply_disk_tags.assert_called_once_with(
+            track._fetch_disk_tags.return_value, notify_changed=False
+        )
+
+def test_update_tracks_serial():
+    library = Library("file:///test/library")
+    library.collection = MagicMock()
+    directory = MagicMock()
+    directory_info = MagicMock()
+    directory_info.get_file_type.return_value = Gio.FileType.DIRECTORY
+    fil = MagicMock()
+    fileinfo = MagicMock()
+    fileinfo.get_file_type.return_value = Gio.FileType.REGULAR
+    entries = [(directory, directory_info), (fil, fileinfo)]
+    with patch('xl.collection.settings.get_option', return_value=1), \
+         patch.object(library, 'update_track') as mock_update:
+        result = list(library._update_tracks(entries, True))
+    mock_update.assert_called_once_with(fil, force_update=True, fileinfo=fileinfo)
+    assert result == [
+        (directory, Gio.FileType.DIRECTORY, None),
+        (fil, Gio.FileType.REGULAR, mock_update.return_value),
+    ]
+
+def test_update_tracks_parallel_skips_unmodified():
+    library = Library("file:///test/library")
+    library.collection = MagicMock()
+    track = MagicMock()
+    track._is_modified.return_value = False
+    library.collection.get_track_by_loc.return_value = track
+    fil = MagicMock()
+    fileinfo = MagicMock()
+    fileinfo.get_file_type.return_value = Gio.FileType.REGULAR
+    with patch('xl.collection.settings.get_option', return_value=4):
+        result = list(library._update_tracks([(fil, fileinfo)], False))
+    assert result == [(fil, Gio.FileType.REGULAR, track)]
+    track._fetch_disk_tags.assert_not_called()
+    track._apply_disk_tags.assert_called_once_with((True, None))
@@ -149,3 +149,129 @@ def test_emit_async(event_manager):
 def test_emit_no_callbacks(event_manager):
     event = Event('test_event', 'test_object', 'test_data')
     event_manager.emit(event)
+
+def test_emit_calls_general_and_object_callbacks_in_order(event_manager):
+    obj = TestObject()
+    other = TestObject()
+    calls = []
+    on_any = lambda *a: calls.append('any')
+    on_obj = lambda *a: calls.append('obj')
+    on_type = lambda *a: calls.append('type')
+    event_manager.add_callback(on_any, None, None, (), {})
+    event_manager.add_callback(on_obj, 'test_event', obj, (), {})
+    event_manager.add_callback(on_type, 'test_event', None, (), {})
+
+    event_manager.emit(Event('test_event', obj, None))
+    assert calls == ['any', 'obj', 'type']
+    calls.clear()
+    event_manager.emit(Event('test_event', other, None))
+    assert calls == ['any', 'type']
+    calls.clear()
+    event_manager.emit(Event('test_event', 'not weakly referenceable', None))
+    assert calls == ['any', 'type']
+
+def test_emit_snapshot_invalidated_on_add_and_remove(event_manager):
+    obj = TestObject()
+    callback1 = MagicMock()
+    callback2 = MagicMock()
+    event_manager.add_callback(callback1, 'test_event', obj, (), {})
+    event_manager.emit(Event('test_event', obj, None))
+    remove = event_manager.add_callback(callback2, 'test_event', None, (), {})
+    event_manager.emit(Event('test_event', obj, None))
+    remove()
+    event_manager.emit(Event('test_event', obj, None))
+    assert callback1.call_count == 3
+    assert callback2.call_count == 1
+
+def test_emit_removes_dead_callbacks(event_manager):
+    obj = SomeClass(1)
+    event_manager.add_callback(obj.method, 'test_event', None, (), {})
+    del obj
+    gc.collect()
+    event_manager.emit(Event('test_event', TestObject(), None))
+    assert 'test_event' not in event_manager.callbacks
+    assert 'test_event' not in event_manager.all_callbacks
+
+def test_event_profiler(event_manager):
+    callback = MagicMock()
+    event_manager.add_callback(callback, 'test_event', None, (), {})
+    event_manager.emit(Event('test_event', TestObject(), None))
+    assert event_manager.profiler is None
+
+    profiler = event_manager.set_profiling(True)
+    event_manager.emit(Event('test_event', TestObject(), None))
+    event_manager.emit(Event('test_event', TestObject(), None))
+    elapsed, events, callbacks = profiler.get_stats()
+    assert events['test_event'][0] == 2
+    assert list(callbacks) == [('test_event', repr(callback))]
+    assert callbacks[('test_event', repr(callback))][0] == 2
+
+    profiler.clear()
+    assert profiler.get_stats()[1] == {}
+    assert event_manager.set_profiling(False) is None
+
+def _emit_from_thread(event_manager, *events):
+    import threading
+    thread = threading.Thread(target=lambda: [event_manager.emit(e) for e in events])
+    thread.start()
+    thread.join()
+
+def test_emit_pending_ui_events_in_slices(event_manager):
+    callback = MagicMock()
+    event_manager.add_callback(callback, 'test_event', None, (), {}, ui=True)
+    event_manager.ui_budget = 0
+    with patch('xl.event.GLib.idle_add') as idle_add:
+        _emit_from_thread(event_manager, *[Event('test_event', TestObject(), n) for n in range(3)])
+    idle_add.assert_called_once_with(event_manager._emit_pending)
+    assert event_manager.get_ui_queue_stats()['depth'] == 3
+
+    assert event_manager._emit_pending() is True
+    assert callback.call_count == 1
+    assert event_manager._emit_pending() is True
+    assert event_manager._emit_pending() is True
+    assert event_manager._emit_pending() is False
+    assert [c.args[2] for c in callback.call_args_list] == [0, 1, 2]
+    stats = event_manager.get_ui_queue_stats()
+    assert stats['depth'] == 0
+    assert stats['max_depth'] == 3
+    assert stats['delivered'] == 3
+
+def test_emit_pending_ui_events_coalesced(event_manager):
+    callback = MagicMock()
+    obj = TestObject()
+    other = TestObject()
+    event_manager.add_callback(callback, 'test_event', None, (), {}, ui=True)
+    event_manager.coalesce_ui_events('test_event', lambda old, new: old + new)
+    with patch('xl.event.GLib.idle_add'):
+        _emit_from_thread(
+            event_manager,
+            Event('test_event', obj, [1]),
+            Event('test_event', other, [2]),
+            Event('test_event', obj, [3]),
+        )
+    assert event_manager._emit_pending() is False
+    assert callback.call_args_list == [
+        call('test_event', obj, [1, 3]),
+        call('test_event', other, [2]),
+    ]
+    assert event_manager.get_ui_queue_stats()['coalesced'] == 1
+
+def test_emit_without_ui_callbacks_is_not_queued(event_manager):
+    callback = MagicMock()
+    event_manager.add_callback(callback, 'test_event', None, (), {})
+    with patch('xl.event.GLib.idle_add') as idle_add:
+        _emit_from_thread(event_manager, Event('test_event', TestObject(), None))
+    idle_add.assert_not_called()
+    callback.assert_called_once()
+
+def test_has_callbacks(event_manager):
+    obj = TestObject()
+    callback = MagicMock()
+    assert not event_manager.has_callbacks('test_event')
+    remove = event_manager.add_callback(callback, 'test_event', obj, (), {})
+    assert event_manager.has_callbacks('test_event')
+    assert not event_manager.has_callbacks('other_event')
+    remove()
+    assert not event_manager.has_callbacks('test_event')
+    event_manager.add_callback(callback, None, None, (), {}, ui=True)
+    assert event_manager.has_callbacks('other_event')
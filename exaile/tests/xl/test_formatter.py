@@ -0,0 +1,60 @@
+import pytest
+from xl import formatter, providers
+from xl.trax import Track
+
+
+@pytest.fixture
+def track():
+    tr = Track('file:///foo/bar.mp3', scan=False)
+    tr.set_tags(notify_changed=False, artist='A & B', title='T', tracknumber='3/12')
+    return tr
+
+def test_TrackFormatter_format(track):
+    fmt = formatter.TrackFormatter('$tracknumber - ${title:prefix=[, suffix=]} $$ $nope')
+    assert fmt.format(track) == '3 - [T] $ '
+    assert fmt.format(track, markup_escape=True) == '3 - [T] $ '
+    assert formatter.TrackFormatter('$artist').format(track, markup_escape=True) == 'A &amp; B'
+
+def test_TrackFormatter_pad(track):
+    fmt = formatter.TrackFormatter('${tracknumber:pad=4, padstring=0}')
+    assert fmt.format(track) == '0003'
+
+def test_TrackFormatter_format_many(track):
+    fmt = formatter.TrackFormatter('$title')
+    assert fmt.format_many([track, track]) == ['T', 'T']
+    with pytest.raises(TypeError):
+        fmt.format_many([track, None])
+
+def test_TrackFormatter_format_property(track):
+    fmt = formatter.TrackFormatter('$title')
+    assert fmt.format(track) == 'T'
+    fmt.set_property('format', '$artist')
+    assert fmt.format(track) == 'A & B'
+
+def test_TrackFormatter_provider_added(track):
+    class TitleFormatter(formatter.TagFormatter):
+        def format(self, track, parameters):
+            return 'formatted'
+
+    fmt = formatter.TrackFormatter('$title')
+    assert fmt.format(track) == 'T'
+    provider = TitleFormatter('title')
+    providers.register('tag-formatting', provider)
+    try:
+        assert fmt.format(track) == 'formatted'
+    finally:
+        providers.unregister('tag-formatting', provider)
+    assert fmt.format(track) == 'T'
+
+def test_Formatter_extract():
+    fmt = formatter.Formatter('$a ${b:x=1\\,2, y} ${b}')
+    assert fmt.extract() == {
+        'a': ('a', {}),
+        'b:x=1\\,2, y': ('b', {'x': '1,2', 'y': True}),
+        'b': ('b', {}),
+    }
+
+def test_Formatter_format_callable():
+    fmt = formatter.Formatter('${a:prefix=<, foo=bar} $b')
+    fmt._substitutions = {'a': lambda foo: foo, 'b': 'text'}
+    assert fmt.format() == '<bar text'
@@ -8,6 +8,15 @@ import sys
 from unittest.mock import patch, MagicMock, call
 from xl.logger_setup import FilterLogger, SafePrettyPrinter, VerboseExceptionFormatter, MAX_VARS_LINES, MAX_LINE_LENGTH, start_logging, stop_logging
 
+@pytest.fixture(autouse=True)
+def restore_root_logger():
+    # start_logging adds handlers to the root logger, some of them mocks
+    handlers = logging.root.handlers[:]
+    level = logging.root.level
+    yield
+    logging.root.handlers[:] = handlers
+    logging.root.setLevel(level)
+
 def test_filterlogger_noModule_noLevel():
     logger = FilterLogger('test_logger')
     record = logging.LogRecord('test_logger', logging.INFO, '', 0, 'test message', [], None)
@@ -224,6 +224,38 @@ def test_set_spat_position(playlist):
     playlist.set_spat_position(1)
     assert playlist.spat_position == 1
 
+def test_unset_spat_position(playlist):
+    playlist.set_spat_position(0)
+    playlist.set_spat_position(-1)
+    playlist.append(MagicMock(spec=trax.Track))
+    assert playlist.spat_position == -1
+
+def test_positions_follow_changes(playlist, sample_tracks):
+    playlist.set_current_position(1)
+    playlist.set_spat_position(0)
+    playlist[0:0] = [MagicMock(spec=trax.Track)]
+    assert playlist.current_position == 2
+    assert playlist.spat_position == 1
+    del playlist[1]
+    assert playlist.current_position == 1
+    assert playlist.spat_position == -1
+    assert playlist.current == sample_tracks[1]
+
+def test_delete_last_keeps_position(playlist):
+    playlist.set_current_position(0)
+    del playlist[-1]
+    assert playlist.current_position == 0
+
+def test_positions_not_shared(playlist):
+    other = Playlist(name="Other Playlist")
+    playlist.set_current_position(1)
+    other.extend(playlist[:])
+    other.set_current_position(0)
+    assert playlist.current_position == 1
+    assert other.current_position == 0
+    del other[0]
+    assert playlist.current_position == 1
+
 def test_get_current(playlist):
     assert playlist.get_current() is None
     playlist.set_current_position(0)
@@ -369,6 +401,32 @@ def test_count(playlist, sample_tracks):
 def test_index(playlist, sample_tracks):
     assert playlist.index(sample_tracks[0]) == 0
 
+def test_index_follows_changes(playlist, sample_tracks):
+    track = MagicMock(spec=trax.Track)
+    assert track not in playlist
+    playlist.extend([track, sample_tracks[0]])
+    assert track in playlist
+    assert playlist.count(sample_tracks[0]) == 2
+    assert playlist.index(sample_tracks[0], 1) == 3
+    assert playlist.index(sample_tracks[0], -1) == 3
+    with pytest.raises(ValueError):
+        playlist.index(sample_tracks[0], 1, 3)
+    playlist[0:0] = [track]
+    assert playlist.index(track) == 0
+    assert playlist.index(sample_tracks[0]) == 1
+    del playlist[-2:]
+    assert playlist.count(sample_tracks[0]) == 1
+    assert playlist.index(sample_tracks[1]) == 2
+    assert playlist.count(track) == 1
+    playlist[:] = []
+    assert track not in playlist
+    assert playlist.count(track) == 0
+
+def test_get_unique_tracks(playlist, sample_tracks):
+    playlist.append(sample_tracks[0])
+    assert set(playlist.get_unique_tracks()) == set(sample_tracks)
+    assert [] not in playlist
+
 def test_pop(playlist, sample_tracks):
     track = playlist.pop(0)
     assert track == sample_tracks[0]
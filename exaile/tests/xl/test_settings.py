@@ -4,7 +4,7 @@ import tempfile
 import shelve
 from io import BytesIO
 from xl import event, xdg
-from xl.settings import SettingsManager
+from xl.settings import LiveOption, SettingsManager
 
 def test_SettingsManager_init():
     manager = SettingsManager()
@@ -54,3 +54,28 @@ def test__str_to_val():
 def test_delayed_save():
     manager = SettingsManager()
     manager.delayed_save()
+
+def test_get_option_cache_invalidated():
+    manager = SettingsManager()
+    assert manager.get_option("section/key", "default") == "default"
+    manager.set_option("section/key", 1)
+    assert manager.get_option("section/key") == 1
+    manager.set_option("section/KEY", 2)
+    assert manager.get_option("section/key") == 2
+    manager.remove_option("section/key")
+    assert manager.get_option("section/key", "default") == "default"
+
+def test_get_option_returns_copies():
+    manager = SettingsManager()
+    manager.set_option("section/key", [1, 2])
+    manager.get_option("section/key").append(3)
+    assert manager.get_option("section/key") == [1, 2]
+
+def test_LiveOption():
+    manager = SettingsManager()
+    live = LiveOption("section/key", True, manager)
+    assert live.value is True
+    manager.set_option("section/key", False)
+    assert live.value is False
+    manager.remove_option("section/key")
+    assert live.value is True
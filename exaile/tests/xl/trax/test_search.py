@@ -3,7 +3,7 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
-from xl.trax.search import _ExactMatcher, _GtMatcher, _InMatcher, _LtMatcher, _ManyMultiMetaMatcher, _Matcher, _MultiMetaMatcher, _NotMetaMatcher, _OrMetaMatcher, _RegexMatcher, SearchResultTrack, TracksInList, TracksMatcher, TracksNotInList, match_track_from_string, search_tracks, search_tracks_from_string
+from xl.trax.search import _order_matchers, _plan_cache, _ExactMatcher, _GtMatcher, _InMatcher, _LtMatcher, _ManyMultiMetaMatcher, _Matcher, _MultiMetaMatcher, _NotMetaMatcher, _OrMetaMatcher, _RegexMatcher, MatcherPlanCache, SearchResultTrack, TracksInList, TracksMatcher, TracksNotInList, is_search_refinement, match_track_from_string, search_tracks, search_tracks_from_string
 
 
 def test_search_result_track_initialization():
@@ -1152,6 +1152,15 @@ def test_tracks_in_list_with_dict():
     track4.track = "track4"
     assert matcher.match(track4) == False
     
+def test_tracks_in_list_with_keys_view():
+    track_dict = {"track1": 1}
+    matcher = TracksInList(tracks=track_dict.keys())
+    track2 = MagicMock(spec=SearchResultTrack)
+    track2.track = "track2"
+    assert matcher.match(track2) == False
+    track_dict["track2"] = 2
+    assert matcher.match(track2) == True
+
 def test_tracks_not_in_list_with_list():
     track_list = ["track1", "track2", "track3"]
     matcher = TracksNotInList(tracks=track_list)
@@ -1272,3 +1281,129 @@ def test_search_tracks_from_string_with_custom_options(mock_tracks_matcher):
 
     assert isinstance(result, types.GeneratorType)
     
+
+def test_tracks_matcher_candidates():
+    index = MagicMock()
+    index.get_equal.return_value = {"loc1", "loc2"}
+    index.get_containing.return_value = {"loc2", "loc3"}
+    matcher = TracksMatcher('artist==foo album=bar')
+    assert matcher.candidates(index) == {"loc2"}
+
+def test_tracks_matcher_candidates_not_narrowed():
+    index = MagicMock()
+    matcher = TracksMatcher('! artist==foo')
+    assert matcher.candidates(index) is None
+    index.get_equal.assert_not_called()
+
+def test_search_tracks_with_index_skips_candidates():
+    tracks = []
+    for loc in ("loc1", "loc2", "loc3"):
+        track = MagicMock()
+        track.get_loc_for_io.return_value = loc
+        track.get_tag_search.return_value = "foo"
+        tracks.append(track)
+    index = MagicMock()
+    index.get_equal.return_value = {"loc2"}
+    matcher = TracksMatcher('artist==foo')
+    result = [srtr.track for srtr in search_tracks(tracks, [matcher], index=index)]
+    assert result == [tracks[1]]
+
+def test_search_tracks_with_index_keeps_trackdb_order():
+    tracks = {}
+    for num in range(50):
+        track = MagicMock()
+        track.get_tag_search.return_value = "foo"
+        tracks["loc%02d" % num] = types.SimpleNamespace(_track=track)
+    index = MagicMock()
+    index.get_equal.return_value = set(list(tracks)[::2])
+    trackdb = types.SimpleNamespace(tracks=tracks, search_index=index)
+    matcher = TracksMatcher('artist==foo')
+    result = [srtr.track for srtr in search_tracks(trackdb, [matcher])]
+    assert result == [holder._track for holder in list(tracks.values())[::2]]
+
+def test_plan_cache_lru():
+    cache = MatcherPlanCache(limit=2)
+    cache.put("a", (1,))
+    cache.put("b", (2,))
+    assert cache.get("a") == (1,)
+    cache.put("c", (3,))
+    assert cache.get("b") is None
+    assert cache.get("a") == (1,)
+    assert cache.get("c") == (3,)
+    assert cache.hits == 3
+    assert cache.misses == 1
+    assert cache.hit_rate == 0.75
+
+def test_tracks_matcher_reuses_compiled_matchers():
+    _plan_cache.clear()
+    matcher1 = TracksMatcher('artist==foo', case_sensitive=False)
+    matcher2 = TracksMatcher('artist==foo', case_sensitive=False)
+    matcher3 = TracksMatcher('artist==foo', case_sensitive=True)
+    assert matcher1.matchers[0] is matcher2.matchers[0]
+    assert matcher1.matchers[0] is not matcher3.matchers[0]
+    assert _plan_cache.get_stats()['hits'] == 1
+    assert _plan_cache.get_stats()['misses'] == 2
+
+    matcher2.append_matcher(MagicMock())
+    assert len(matcher1.matchers) == 1
+
+def test_tracks_matcher_orders_cheap_matchers_first():
+    matcher = TracksMatcher('title~^f.o artist=foo album==bar')
+    assert [type(ma) for ma in matcher.matchers] == [_ExactMatcher, _InMatcher, _RegexMatcher]
+
+def test_order_matchers_nested():
+    lower = lambda x: x
+    not_inner = [_RegexMatcher('title', 'f.o', lower), _ExactMatcher('artist', 'foo', lower)]
+    or_inner = [_RegexMatcher('title', 'b.r', lower), _ExactMatcher('album', 'bar', lower)]
+    matchers = [
+        _NotMetaMatcher(_MultiMetaMatcher(not_inner)),
+        _OrMetaMatcher(_MultiMetaMatcher(or_inner), _ExactMatcher('genre', 'baz', lower)),
+    ]
+    _order_matchers(matchers)
+    assert [type(ma) for ma in not_inner] == [_ExactMatcher, _RegexMatcher]
+    assert [type(ma) for ma in or_inner] == [_ExactMatcher, _RegexMatcher]
+
+def test_tracks_matcher_prepend_or_uses_query_order():
+    matcher = TracksMatcher('title~^f.o album==bar')
+    title = matcher.matchers[1]
+    extra = _ExactMatcher('artist', 'baz', lambda x: x)
+    matcher.prepend_matcher(extra, or_match=True)
+    assert isinstance(matcher.matchers[1], _OrMetaMatcher)
+    assert matcher.matchers[1].left is extra
+    assert matcher.matchers[1].right is title
+    assert isinstance(matcher.matchers[0], _ExactMatcher)
+
+def test_tracks_matcher_append_or_uses_query_order():
+    matcher = TracksMatcher('title~^f.o album==bar')
+    album = matcher.matchers[0]
+    extra = _ExactMatcher('artist', 'baz', lambda x: x)
+    matcher.append_matcher(extra, or_match=True)
+    assert isinstance(matcher.matchers[0], _OrMetaMatcher)
+    assert matcher.matchers[0].left is album
+    assert matcher.matchers[0].right is extra
+    assert isinstance(matcher.matchers[1], _RegexMatcher)
+
+def test_tracks_matcher_shared_keyword_matcher():
+    track = MagicMock()
+    track.get_tag_search.side_effect = lambda tag, format=True: {'artist': 'foo', 'album': 'bar'}[tag]
+    matcher1 = TracksMatcher('foo', keyword_tags=['artist', 'album'])
+    matcher2 = TracksMatcher('foo', keyword_tags=['artist', 'album'])
+    srtrack = SearchResultTrack(track)
+    assert matcher1.match(srtrack)
+    assert matcher2.match(srtrack)
+    assert srtrack.on_tags == ['artist']
+
+def test_is_search_refinement():
+    assert is_search_refinement('foo', 'foob')
+    assert is_search_refinement('foo bar', 'bar xfoo')
+    assert is_search_refinement('foo', 'foo bar')
+    assert not is_search_refinement('foo bar', 'foo')
+    assert not is_search_refinement('', 'foo')
+    assert not is_search_refinement('Foo', 'foob')
+    assert is_search_refinement('Foo', 'foob', case_sensitive=False)
+
+def test_is_search_refinement_needs_plain_keywords():
+    assert not is_search_refinement('foo', 'foo|bar')
+    assert not is_search_refinement('foo', '! foo')
+    assert not is_search_refinement('artist=foo', 'artist=foob')
+    assert not is_search_refinement('foo', '"foo bar"')
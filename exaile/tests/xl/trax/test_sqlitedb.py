@@ -0,0 +1,37 @@
+from xl.trax.sqlitedb import SQLiteTrackStore, is_sqlite_location
+
+
+def test_is_sqlite_location():
+    assert is_sqlite_location("/data/music.sqlite")
+    assert not is_sqlite_location("/data/music.db")
+
+def test_store_roundtrip(tmp_path):
+    store = SQLiteTrackStore(str(tmp_path / "music.sqlite"))
+    store.save(
+        {'name': 'Collection', '_key': 2},
+        [
+            (0, {'__loc': 'file:///a.mp3', 'artist': ['A']}, {}),
+            (1, {'__loc': 'file:///b.mp3', 'title': ['B'], 'album': None}, {'x': 1}),
+        ],
+        [],
+    )
+    store.close()
+
+    store = SQLiteTrackStore(str(tmp_path / "music.sqlite"))
+    assert store.get_meta() == {'name': 'Collection', '_key': 2}
+    assert store.get_keys() == {0, 1}
+    assert list(store.iter_tracks()) == [
+        (0, {'__loc': 'file:///a.mp3', 'artist': ['A']}, {}),
+        (1, {'__loc': 'file:///b.mp3', 'title': ['B'], 'album': None}, {'x': 1}),
+    ]
+    store.close()
+
+def test_store_replaces_and_deletes(tmp_path):
+    store = SQLiteTrackStore(str(tmp_path / "music.sqlite"))
+    store.save({}, [
+        (0, {'__loc': 'file:///a.mp3', 'artist': ['A']}, {}),
+        (1, {'__loc': 'file:///b.mp3'}, {}),
+    ], [])
+    assert store.save({}, [(0, {'__loc': 'file:///a.mp3', 'title': ['T']}, {})], [1]) == 1
+    assert list(store.iter_tracks()) == [(0, {'__loc': 'file:///a.mp3', 'title': ['T']}, {})]
+    store.close()
@@ -1,7 +1,9 @@
+import sys
 import unittest
+from collections import OrderedDict
 from unittest.mock import MagicMock, patch
 import pytest
-from xl.trax.track import _MetadataCacher, Track
+from xl.trax.track import _MetadataCacher, Track, batch_tags_changed
 
 def test_metadata_cacher_init():
 
@@ -607,4 +609,234 @@ def test__write_rating_to_disk_with_write_to_audio_file_metadata_disabled():
 def test__write_rating_to_disk_with_no_format_object():
     uri = "file"
     track = Track(uri=uri)
-    assert track._write_rating_to_disk() is False
\ No newline at end of file
+    assert track._write_rating_to_disk() is False
+def test_read_tags_unmodified_skips_file():
+    track = Track(uri="file:///path/to/unmodified.mp3", scan=False)
+    track.set_tags(__modified=100, notify_changed=False)
+    with patch('xl.trax.track.Gio.File.new_for_uri') as mock_new_for_uri, \
+         patch('xl.trax.track.metadata.get_format') as mock_get_format:
+        assert track.read_tags(force=False, mtime=100) is True
+        mock_new_for_uri.assert_not_called()
+        mock_get_format.assert_not_called()
+    assert track.is_supported() is True
+
+def test_read_tags_modified_reads_file():
+    track = Track(uri="file:///path/to/modified.mp3", scan=False)
+    track.set_tags(__modified=100, notify_changed=False)
+    assert track._is_modified(101) is True
+    assert track._is_modified(100) is False
+    assert track._is_modified(None) is True
+
+def test_get_tag_search_from_pickles():
+    track = Track(uri="file:///path/to/search_pickles.mp3", scan=False)
+    track.set_tags(
+        artist='Beyonc\u00e9', tracknumber='3/10', __bitrate=320000,
+        notify_changed=False,
+    )
+    tags = track._pickles()
+    for tag in ('artist', 'albumartist', 'album', 'tracknumber', '__bitrate'):
+        assert Track._get_tag_search_from_pickles(tags, tag) == track.get_tag_search(
+            tag, format=False
+        )
+
+def test_get_tag_search_values():
+    track = Track(uri="file:///path/to/search_values.mp3", scan=False)
+    track.set_tags(artist=['Foo', 'BAR'], notify_changed=False)
+    assert track.get_tag_search_values('artist') == ('Foo', 'BAR')
+    assert track.get_tag_search_values('artist', lower=True) == ('foo', 'bar')
+    assert track.get_tag_search_values('album') == (None,)
+
+def test_get_tag_search_values_invalidated_by_set_tags():
+    track = Track(uri="file:///path/to/search_values_changed.mp3", scan=False)
+    track.set_tags(artist='Foo', notify_changed=False)
+    assert track.get_tag_search_values('albumartist', lower=True) == ('foo',)
+    track.set_tags(artist='Bar', notify_changed=False)
+    assert track.get_tag_search_values('albumartist', lower=True) == ('bar',)
+    track.set_tags(albumartist='Baz', notify_changed=False)
+    assert track.get_tag_search_values('albumartist', lower=True) == ('baz',)
+
+def test_get_tag_search_values_bounded():
+    track = Track(uri="file:///path/to/search_values_bounded.mp3", scan=False)
+    for n in range(100):
+        track.get_tag_search_values('tag%d' % n)
+    assert len(track._search_values) <= 16
+
+def test_get_tag_search_values_shaved():
+    track = Track(uri="file:///path/to/search_values_shaved.mp3", scan=False)
+    track.set_tags(artist='Beyonc\u00e9', notify_changed=False)
+    assert track.get_tag_search_values('artist', lower=True) == ('beyonce',)
+
+def test_get_tag_search_values_bounded_tracks():
+    tracks = [
+        Track(uri="file:///path/to/search_values_lru%d.mp3" % n, scan=False)
+        for n in range(3)
+    ]
+    with patch("xl.trax.track._SEARCH_CACHE_MAX_TRACKS", 2), \
+         patch("xl.trax.track._search_cached_tracks", OrderedDict()):
+        for track in tracks:
+            track.get_tag_search_values('artist')
+    assert tracks[0]._search_values is None
+    assert tracks[1]._search_values is not None
+    assert tracks[2]._search_values is not None
+    assert tracks[0].get_tag_search_values('artist') == (None,)
+
+def test_get_tag_search_values_rebuilt_cache_counts_once():
+    tracks = [
+        Track(uri="file:///path/to/search_values_rebuilt%d.mp3" % n, scan=False)
+        for n in range(2)
+    ]
+    with patch("xl.trax.track._SEARCH_CACHE_MAX_TRACKS", 2), \
+         patch("xl.trax.track._search_cached_tracks", OrderedDict()) as cached:
+        tracks[0].get_tag_search_values('artist')
+        tracks[1].get_tag_search_values('artist')
+        for n in range(3):
+            tracks[0].set_tags(artist='artist%d' % n, notify_changed=False)
+            tracks[0].get_tag_search_values('artist')
+        assert len(cached) == 2
+        assert tracks[0]._search_values is not None
+        assert tracks[1]._search_values is not None
+
+def test_get_tag_sort_cached_until_tags_change():
+    track = Track(uri="file:///path/to/sort_keys.mp3", scan=False)
+    track.set_tags(artist='The Foo', notify_changed=False)
+    value = track.get_tag_sort('artist')
+    assert track.get_tag_sort('artist') is value
+    track.set_tags(artist='Bar', notify_changed=False)
+    assert track.get_tag_sort('artist') != value
+
+def test_get_tag_sort_invalidated_by_strip_list():
+    track = Track(uri="file:///path/to/sort_keys_strip.mp3", scan=False)
+    track.set_tags(artist='Foo', notify_changed=False)
+    track.get_tag_sort('artist')
+    generation = track._sort_keys[0]
+    the_cuts = Track._Track__the_cuts
+    with patch('xl.trax.track.settings.get_option', return_value=['the']):
+        Track._the_cuts_cb('collection_option_set', None, 'collection/strip_list')
+    Track._Track__the_cuts = the_cuts
+    assert Track._Track__sort_generation == generation + 1
+    track.get_tag_sort('artist')
+    assert track._sort_keys[0] == generation + 1
+
+def test_set_tags_interns_values():
+    track1 = Track(uri="file:///path/to/interned1.mp3", scan=False)
+    track2 = Track(uri="file:///path/to/interned2.mp3", scan=False)
+    track1.set_tags(genre=''.join(['Ro', 'ck']), notify_changed=False)
+    track2.set_tags(genre=''.join(['Roc', 'k']), notify_changed=False)
+    assert track1.get_tag_raw('genre')[0] is track2.get_tag_raw('genre')[0]
+
+def test_unpickles_interns_values():
+    track = Track(uri="file:///path/to/interned3.mp3", scan=False)
+    basedir = ''.join(['file:///path/', 'to'])
+    track._unpickles({'__loc': "file:///path/to/interned3.mp3", '__basedir': basedir})
+    assert track.get_tag_raw('__basedir') is sys.intern(basedir)
+
+def test_pickles_is_isolated_from_later_changes():
+    track = Track(uri="file:///path/to/pickles.mp3", scan=False)
+    track.set_tags(artist='Before', notify_changed=False)
+    pickled = track._pickles()
+    track.set_tags(artist='After', notify_changed=False)
+    assert pickled['artist'] == ['Before']
+    pickled['album'] = ['Other']
+    assert track.get_tag_raw('album') is None
+
+def test_unpickles_is_isolated_from_source():
+    loc = "file:///path/to/unpickles.mp3"
+    track = Track(uri=loc, scan=False)
+    pickle_obj = {'__loc': loc, 'title': ['Title'], 'artist': ['Artist']}
+    track._unpickles(pickle_obj)
+    pickle_obj['title'].append('Changed')
+    pickle_obj['artist'].append('Changed')
+    assert track.get_tag_raw('title') == ['Title']
+    assert track.get_tag_raw('artist') == ['Artist']
+
+def test_set_tags_marks_track_dirty():
+    track = Track(uri="file:///path/to/dirty.mp3", scan=False)
+    track._set_dirty(False)
+    assert track not in Track._get_dirty_tracks()
+    track.set_tags(artist='Artist', notify_changed=False)
+    assert track._dirty is True
+    assert track in Track._get_dirty_tracks()
+    track._set_dirty(False)
+    assert track._dirty is False
+    assert track not in Track._get_dirty_tracks()
+    track.set_tags(artist='Artist', notify_changed=False)
+    assert track not in Track._get_dirty_tracks()
+
+def test_set_tags_sends_batched_event():
+    track = Track(uri="file:///path/to/event.mp3", scan=False)
+    with patch("xl.trax.track.event.log_event") as log_event, \
+         patch("xl.trax.track.event.has_callbacks", return_value=False):
+        track.set_tags(artist='Artist')
+    assert log_event.call_args_list == [
+        unittest.mock.call('tracks_tags_changed', Track, {track: {'artist'}}),
+    ]
+
+def test_set_tags_sends_track_event_to_listeners():
+    track = Track(uri="file:///path/to/event_listened.mp3", scan=False)
+    with patch("xl.trax.track.event.log_event") as log_event, \
+         patch("xl.trax.track.event.has_callbacks", return_value=True) as has_callbacks:
+        track.set_tags(artist='Artist')
+    has_callbacks.assert_called_once_with('track_tags_changed')
+    assert log_event.call_args_list == [
+        unittest.mock.call('tracks_tags_changed', Track, {track: {'artist'}}),
+        unittest.mock.call('track_tags_changed', track, {'artist'}),
+    ]
+
+def test_batch_tags_changed():
+    track1 = Track(uri="file:///path/to/batch1.mp3", scan=False)
+    track2 = Track(uri="file:///path/to/batch2.mp3", scan=False)
+    with patch("xl.trax.track.event.log_event") as log_event, \
+         patch("xl.trax.track.event.has_callbacks", return_value=True):
+        with batch_tags_changed():
+            track1.set_tags(artist='Artist')
+            with batch_tags_changed():
+                track1.set_tags(album='Album')
+                track2.set_tags(title='Title')
+            track2.set_tags(title='Title')
+            log_event.assert_not_called()
+    assert log_event.call_args_list == [
+        unittest.mock.call(
+            'tracks_tags_changed',
+            Track,
+            {track1: {'artist', 'album'}, track2: {'title'}},
+        )
+    ]
+
+def test_batch_tags_changed_sends_large_batches_in_parts():
+    tracks = [Track(uri="file:///path/to/part%d.mp3" % i, scan=False) for i in range(5)]
+    with patch("xl.trax.track.event.log_event") as log_event, \
+         patch("xl.trax.track._BATCH_MAX_TRACKS", 2):
+        with batch_tags_changed():
+            for track in tracks:
+                track.set_tags(artist='Artist')
+            assert log_event.call_args_list == [
+                unittest.mock.call('tracks_tags_changed', Track, {tracks[0]: {'artist'}, tracks[1]: {'artist'}}),
+                unittest.mock.call('tracks_tags_changed', Track, {tracks[2]: {'artist'}, tracks[3]: {'artist'}}),
+            ]
+    assert log_event.call_args_list[-1] == unittest.mock.call(
+        'tracks_tags_changed', Track, {tracks[4]: {'artist'}}
+    )
+    assert log_event.call_count == 3
+
+def test_batch_tags_changed_sends_on_error():
+    track = Track(uri="file:///path/to/batch_error.mp3", scan=False)
+    with patch("xl.trax.track.event.log_event") as log_event:
+        with pytest.raises(ValueError):
+            with batch_tags_changed():
+                track.set_tags(artist='Artist')
+                raise ValueError()
+    log_event.assert_any_call('tracks_tags_changed', Track, {track: {'artist'}})
+    with patch("xl.trax.track.event.log_event") as log_event, \
+         patch("xl.trax.track.event.has_callbacks", return_value=False):
+        track.set_tags(artist='Other')
+    assert log_event.call_count == 1
+
+def test_merge_tag_changes_does_not_change_sent_data():
+    from xl.trax.track import _merge_tag_changes
+    track1 = Track(uri="file:///path/to/merge1.mp3", scan=False)
+    track2 = Track(uri="file:///path/to/merge2.mp3", scan=False)
+    first = {track1: {'artist'}}
+    merged = _merge_tag_changes(first, {track1: {'album'}, track2: {'title'}})
+    merged = _merge_tag_changes(merged, {track2: {'genre'}})
+    assert merged == {track1: {'artist', 'album'}, track2: {'title', 'genre'}}
+    assert first == {track1: {'artist'}}
@@ -505,4 +505,267 @@ def test_get_count_multiple_tracks():
     db = TrackDB(name="TestDB")
     db.tracks["track1"] = "dummy_track1"
     db.tracks["track2"] = "dummy_track2"
-    assert db.get_count() == 2
\ No newline at end of file
+    assert db.get_count() == 2
+
+def _make_index_track(loc, **tags):
+    track = MagicMock()
+    track.get_loc_for_io.return_value = loc
+    track.get_tag_raw.return_value = 1
+    track.is_supported.return_value = True
+    track.get_tag_search.side_effect = lambda tag, format=True: tags.get(
+        tag, '__null__'
+    )
+    return track
+
+def test_search_index_equal_and_containing():
+    db = TrackDB(name="TestDB")
+    db.enable_search_index()
+    db.add_tracks([
+        _make_index_track("loc1", artist=["Foo Fighters"]),
+        _make_index_track("loc2", artist=["foo"]),
+        _make_index_track("loc3", artist=["Bar"]),
+    ])
+    assert db.search_index.get_equal('artist', 'FOO') == {"loc2"}
+    assert db.search_index.get_containing('artist', 'foo') == {"loc1", "loc2"}
+    assert db.search_index.get_containing('artist', 'baz') == set()
+    assert db.search_index.get_equal('__length', '10') is None
+
+def test_search_index_follows_changes():
+    db = TrackDB(name="TestDB")
+    db.enable_search_index()
+    tags = {'artist': ['Foo']}
+    track = _make_index_track("loc1")
+    track.get_tag_search.side_effect = lambda tag, format=True: tags.get(
+        tag, '__null__'
+    )
+    db.add_tracks([track])
+    assert db.search_index.get_equal('artist', 'foo') == {"loc1"}
+
+    tags['artist'] = ['Bar']
+    db._on_track_tags_changed(track, {'artist'})
+    assert db.search_index.get_equal('artist', 'foo') == set()
+    assert db.search_index.get_equal('artist', 'bar') == {"loc1"}
+
+    db.remove_tracks([track])
+    assert db.search_index.get_equal('artist', 'bar') == set()
+
+def test_search_index_follows_changes_in_batch(supported_tracks):
+    from xl import trax
+    from xl.trax.track import Track as RealTrack
+    db = TrackDB(name="TestDB")
+    db.enable_search_index()
+    track = RealTrack("file:///path/to/index_batch.mp3", scan=False)
+    track.set_tags(artist='old', notify_changed=False)
+    db.add_tracks([track])
+    assert db.search_index.get_equal('artist', 'old') == {track.get_loc_for_io()}
+
+    with trax.batch_tags_changed():
+        track.set_tags(artist='new')
+        assert db.search_index.get_equal('artist', 'new') == {track.get_loc_for_io()}
+        assert db.search_index.get_equal('artist', 'old') == set()
+
+def test_search_index_lazy_tracks_not_created():
+    db = TrackDB(name="LazyIndexDB", lazy=True)
+    db.enable_search_index()
+    for num, artist in enumerate(['Foo', 'Bar']):
+        loc = 'file:///path/to/lazy_index%d.mp3' % num
+        db.tracks[loc] = TrackHolder.lazy({'__loc': loc, 'artist': [artist]}, num)
+    assert db.search_index.get_equal('artist', 'bar') == {
+        'file:///path/to/lazy_index1.mp3'
+    }
+    assert not any(holder._is_loaded() for holder in db.tracks.values())
+
+def test_search_index_disable():
+    db = TrackDB(name="TestDB")
+    db.enable_search_index()
+    db.disable_search_index()
+    assert db.search_index is None
+
+@pytest.fixture
+def supported_tracks():
+    """
+    Lets TrackDB add tracks whose files don't exist
+    """
+    from xl.trax.track import Track as RealTrack
+    with patch.object(RealTrack, 'is_supported', return_value=True):
+        yield
+
+def test_track_db_sqlite_save_load(tmp_path, supported_tracks):
+    from xl.trax.track import Track as RealTrack
+    location = str(tmp_path / "music.sqlite")
+    db = TrackDB(name="SQLiteDB", pickle_attrs=[])
+    track = RealTrack("file:///path/to/sqlite_roundtrip.mp3", scan=False)
+    track.set_tags(artist='Artist', notify_changed=False)
+    db.add_tracks([track])
+    db.save_to_location(location)
+    assert track._dirty is False
+
+    db2 = TrackDB(pickle_attrs=[])
+    db2.load_from_location(location)
+    assert db2.name == "SQLiteDB"
+    loaded = db2.get_track_by_loc(track.get_loc_for_io())
+    assert loaded.get_tag_raw('artist') == ['Artist']
+
+def test_track_db_sqlite_saves_only_dirty_tracks(tmp_path, supported_tracks):
+    from xl.trax.track import Track as RealTrack
+    location = str(tmp_path / "music.sqlite")
+    db = TrackDB(name="SQLiteDB", pickle_attrs=[])
+    track1 = RealTrack("file:///path/to/sqlite_dirty1.mp3", scan=False)
+    track2 = RealTrack("file:///path/to/sqlite_dirty2.mp3", scan=False)
+    db.add_tracks([track1, track2])
+    db.save_to_location(location)
+
+    track2.set_tags(title='Changed', notify_changed=False)
+    with patch.object(RealTrack, '_pickles', autospec=True, side_effect=RealTrack._pickles) as pickles:
+        db.save_to_location(location)
+    pickles.assert_called_once_with(track2)
+
+    db.remove_tracks([track1])
+    db.save_to_location(location)
+    db2 = TrackDB(pickle_attrs=[])
+    db2.load_from_location(location)
+    assert list(db2.tracks) == [track2.get_loc_for_io()]
+
+def test_track_holder_lazy():
+    tags = {'__loc': 'file:///lazy.mp3', 'artist': ['A']}
+    with patch("xl.trax.trackdb.Track") as mock_track:
+        mock_track.return_value._dirty = True
+        holder = TrackHolder.lazy(tags, 1, extra=2)
+        assert holder._is_loaded() is False
+        assert holder._is_dirty() is False
+        assert holder._get_pickles() is tags
+        mock_track.assert_not_called()
+
+        assert holder._track is mock_track.return_value
+        mock_track.assert_called_once_with(_unpickles=tags)
+        assert holder._is_loaded() is True
+        assert holder._is_dirty() is True
+        assert holder._attrs == {'extra': 2}
+
+def test_track_db_lazy_one_track_per_uri():
+    from xl.trax.track import Track as RealTrack
+    loc = 'file:///path/to/lazy_track.mp3'
+    db = TrackDB(name="LazyDB", lazy=True)
+    db.tracks[loc] = TrackHolder.lazy({'__loc': loc, 'artist': ['Lazy']}, 0)
+    assert db.loc_is_member(loc)
+    assert not db.tracks[loc]._is_loaded()
+
+    track = RealTrack(loc, scan=False)
+    assert db.tracks[loc]._is_loaded()
+    assert track.get_tag_raw('artist') == ['Lazy']
+    assert db.get_track_by_loc(loc) is track
+    assert list(db) == [track]
+
+def test_track_db_lazy_one_track_per_uri_across_threads():
+    import threading
+    from xl.trax.track import Track as RealTrack
+    loc = 'file:///path/to/lazy_threaded_track.mp3'
+    db = TrackDB(name="LazyThreadDB", lazy=True)
+    db.tracks[loc] = TrackHolder.lazy({'__loc': loc, 'artist': ['Lazy']}, 0)
+    created = []
+    other = threading.Thread(target=lambda: created.append(RealTrack(loc, scan=False)))
+    get_lazy_track = TrackDB._get_lazy_track
+
+    def slow_get_lazy_track(self, uri):
+        # another thread asks for the track before it is registered
+        if not other.is_alive() and not created:
+            other.start()
+            other.join(0.2)
+        return get_lazy_track(self, uri)
+
+    with patch.object(TrackDB, '_get_lazy_track', slow_get_lazy_track):
+        track = db.get_track_by_loc(loc)
+    other.join()
+    assert created == [track]
+    assert created[0].get_tag_raw('artist') == ['Lazy']
+
+def test_track_db_saved_data_is_isolated(tmp_path, supported_tracks):
+    from xl import common
+    from xl.trax.track import Track as RealTrack
+    location = str(tmp_path / "music.db")
+    db = TrackDB(name="ShelfDB", pickle_attrs=[])
+    track = RealTrack("file:///path/to/shelf_isolated.mp3", scan=False)
+    track.set_tags(artist='Saved', notify_changed=False)
+    db.add_tracks([track])
+    db.save_to_location(location)
+
+    track.set_tags(artist='Changed later', notify_changed=False)
+    db.name = "Renamed later"
+
+    pdata = common.open_shelf(location)
+    try:
+        records = [pdata[k] for k in pdata.keys() if k.startswith('tracks-')]
+        assert [r[0]['artist'] for r in records] == [['Saved']]
+        assert pdata['name'] == "ShelfDB"
+    finally:
+        pdata.close()
+
+def test_track_db_shelf_saves_only_changed_tracks(tmp_path, supported_tracks):
+    from xl.trax.track import Track as RealTrack
+    location = str(tmp_path / "music.db")
+    db = TrackDB(name="ShelfDB", pickle_attrs=[])
+    track1 = RealTrack("file:///path/to/shelf_changed1.mp3", scan=False)
+    track2 = RealTrack("file:///path/to/shelf_changed2.mp3", scan=False)
+    db.add_tracks([track1, track2])
+    db.save_to_location(location)
+    assert db.get_save_stats()['tracks_written'] == 2
+
+    track1.set_tags(title='Changed', notify_changed=False)
+    track3 = RealTrack("file:///path/to/shelf_changed3.mp3", scan=False)
+    db.add_tracks([track3])
+    with patch.object(RealTrack, '_pickles', autospec=True, side_effect=RealTrack._pickles) as pickles:
+        db.save_to_location(location)
+    assert sorted(c.args[0].get_loc_for_io() for c in pickles.call_args_list) == [
+        track1.get_loc_for_io(), track3.get_loc_for_io()
+    ]
+    stats = db.get_save_stats()
+    assert stats['saves'] == 2
+    assert stats['tracks_written'] == 4
+
+    with patch.object(RealTrack, '_pickles', autospec=True) as pickles:
+        db.save_to_location(location)
+    pickles.assert_not_called()
+    assert db.get_save_stats()['saves'] == 2
+
+    db2 = TrackDB(pickle_attrs=[])
+    db2.load_from_location(location)
+    assert len(db2) == 3
+    assert db2.get_track_by_loc(track1.get_loc_for_io()) is track1
+
+def test_track_db_failed_save_keeps_changes(tmp_path, supported_tracks):
+    from xl.trax.track import Track as RealTrack
+    location = str(tmp_path / "music.sqlite")
+    db = TrackDB(name="FailDB", pickle_attrs=[])
+    track = RealTrack("file:///path/to/failed_save.mp3", scan=False)
+    track.set_tags(artist='Artist', notify_changed=False)
+    db.add_tracks([track])
+
+    def failing_save(meta, tracks, deleted_keys):
+        list(tracks)
+        raise OSError("disk full")
+
+    with patch("xl.trax.sqlitedb.SQLiteTrackStore.save", side_effect=failing_save):
+        db.save_to_location(location)
+    assert db._dirty is True
+    assert track._dirty is True
+    assert db.get_save_stats()['saves'] == 0
+
+    db.save_to_location(location)
+    assert track._dirty is False
+    db2 = TrackDB(pickle_attrs=[])
+    db2.load_from_location(location)
+    assert db2.get_track_by_loc(track.get_loc_for_io()) is track
+
+def test_track_db_save_in_background():
+    import threading
+    db = TrackDB(name="BackgroundDB")
+    saved = threading.Event()
+    with patch.object(db, 'save_to_location', side_effect=lambda: saved.set()):
+        db.save_in_background()
+        assert saved.wait(5)
+        writer = db._writer
+        saved.clear()
+        db.save_in_background()
+        assert saved.wait(5)
+    assert db._writer is writer
+    assert writer.daemon
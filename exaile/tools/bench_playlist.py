@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Measures how long appending, extending and deleting take on large
+playlists, with current and SPAT positions set.
+
+Run from the source directory:
+
+    python3 tools/bench_playlist.py --tracks 50000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xl.playlist import Playlist  # noqa: E402
+from xl.trax import Track  # noqa: E402
+
+
+def make_tracks(count):
+    return [
+        Track('file:///bench/%d/%d.mp3' % (n % 1000, n), scan=False)
+        for n in range(count)
+    ]
+
+
+def make_playlist(tracks):
+    playlist = Playlist('bench', tracks)
+    playlist.current_position = len(tracks) // 2
+    playlist.spat_position = len(tracks) - 1
+    return playlist
+
+
+def bench_append(tracks):
+    playlist = make_playlist(tracks[:1])
+    for track in tracks[1:]:
+        playlist.append(track)
+
+
+def bench_extend(tracks):
+    playlist = make_playlist(tracks[:1])
+    chunk = 100
+    for start in range(1, len(tracks), chunk):
+        playlist.extend(tracks[start : start + chunk])
+
+
+def bench_delete_front(tracks):
+    playlist = make_playlist(tracks)
+    while len(playlist) > 1:
+        del playlist[0]
+
+
+def bench_delete_back(tracks):
+    playlist = make_playlist(tracks)
+    while len(playlist) > 1:
+        del playlist[-1]
+
+
+def bench_insert_middle(tracks):
+    playlist = make_playlist(tracks[: len(tracks) // 2])
+    for track in tracks[len(tracks) // 2 :]:
+        position = len(playlist) // 2
+        playlist[position:position] = [track]
+
+
+BENCHMARKS = [
+    ('append', bench_append),
+    ('extend by 100', bench_extend),
+    ('delete front', bench_delete_front),
+    ('delete back', bench_delete_back),
+    ('insert middle', bench_insert_middle),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=50000)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    print('Creating %d tracks...' % args.tracks)
+    tracks = make_tracks(args.tracks)
+
+    for label, func in BENCHMARKS:
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            func(tracks)
+            times.append(time.perf_counter() - start)
+        print(
+            '%-14s best %.3fs, avg %.3fs' % (label, min(times), sum(times) / len(times))
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Measures search speed over a synthetic collection, with and without the
+per-track search value cache.
+
+Run from the source directory:
+
+    python3 tools/bench_search.py --tracks 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xl.trax import Track, search_tracks_from_string  # noqa: E402
+
+QUERIES = [
+    ('artist "Artist 42"', ['artist', 'albumartist', 'album', 'title']),
+    ('album=ALBUM 7', []),
+    ('albumartist==artist 13', []),
+    ('__bitrate==320k', []),
+    ('tracknumber<3', []),
+]
+
+
+def make_tracks(count):
+    tracks = []
+    for n in range(count):
+        tr = Track('file:///bench/%d/%d.mp3' % (n % 1000, n), scan=False)
+        tr.set_tags(
+            notify_changed=False,
+            artist='Artist %d' % (n % 500),
+            album='Album %d' % (n % 5000),
+            title='Tïtle %d' % n,
+            tracknumber='%d/12' % (n % 12 + 1),
+            __bitrate=320000 if n % 2 else 192000,
+        )
+        tracks.append(tr)
+    return tracks
+
+
+def run_queries(tracks, cold):
+    start = time.perf_counter()
+    found = 0
+    for query, keyword_tags in QUERIES:
+        if cold:
+            for tr in tracks:
+                tr._search_values = None
+        found += sum(
+            1
+            for _ in search_tracks_from_string(
+                tracks, query, case_sensitive=False, keyword_tags=keyword_tags
+            )
+        )
+    return time.perf_counter() - start, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=100000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print('Creating %d tracks...' % args.tracks)
+    tracks = make_tracks(args.tracks)
+
+    for label, cold in (('uncached', True), ('cached', False)):
+        # the first cached run fills the cache
+        run_queries(tracks, cold)
+        times = []
+        for _ in range(args.runs):
+            elapsed, found = run_queries(tracks, cold)
+            times.append(elapsed)
+        print(
+            '%-9s %d queries: best %.3fs, avg %.3fs (%d matches)'
+            % (label, len(QUERIES), min(times), sum(times) / len(times), found)
+        )
+
+
+if __name__ == '__main__':
+    main()
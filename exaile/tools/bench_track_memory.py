@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Reports the memory used per Track for a synthetic collection, with and
+without interning of tag values.
+
+Run from the source directory:
+
+    python3 tools/bench_track_memory.py --tracks 200000
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xl.trax import track as track_module  # noqa: E402
+from xl.trax import Track  # noqa: E402
+
+
+def make_record(n, prefix):
+    # build every string separately, as reading tags from files does
+    return {
+        '__loc': 'file:///%s/%d/%d.mp3' % (prefix, n % 2000, n),
+        '__basedir': 'file:///%s/%d' % (prefix, n % 2000),
+        '__length': 200.0 + n % 100,
+        '__bitrate': 320000,
+        '__modified': 1600000000.0 + n,
+        'artist': ['Artist %d' % (n % 500)],
+        'albumartist': (
+            ['Various Artists'] if n % 10 == 0 else ['Artist %d' % (n % 500)]
+        ),
+        'album': ['Album %d' % (n % 2000)],
+        'genre': ['Genre %d' % (n % 40)],
+        'date': ['%d' % (1960 + n % 60)],
+        'title': ['Title %d' % n],
+        'tracknumber': ['%d/12' % (n % 12 + 1)],
+    }
+
+
+def measure(count, prefix):
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    tracks = [Track(_unpickles=make_record(n, prefix)) for n in range(count)]
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del tracks
+    return used / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=200000)
+    args = parser.parse_args()
+
+    intern = track_module._intern
+    track_module._intern = lambda value: value
+    try:
+        before = measure(args.tracks, 'plain')
+    finally:
+        track_module._intern = intern
+    after = measure(args.tracks, 'interned')
+
+    print('%d tracks' % args.tracks)
+    print('without interning: %7.0f bytes/track' % before)
+    print('with interning:    %7.0f bytes/track' % after)
+    print('saved:             %6.1f%%' % (100.0 * (before - after) / before))
+
+
+if __name__ == '__main__':
+    main()
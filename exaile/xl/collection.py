@@ -35,9 +35,10 @@ collection.
 """
 
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import threading
-from typing import Deque, Dict, Iterable, List, MutableSequence, Optional, Set, Tuple
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
 
 from gi.repository import (
     GLib,
@@ -49,8 +50,16 @@ from xl import common, event, settings, trax
 
 logger = logging.getLogger(__name__)
 
+# the UI only needs to show the latest progress of a scan
+event.coalesce_ui_events('scan_progress_update')
+event.coalesce_ui_events('tracks_scanned')
+
 COLLECTIONS: Set['Collection'] = set()
 
+_FILE_BASED_COMPILATIONS = settings.LiveOption(
+    'collection/file_based_compilations', True
+)
+
 
 def get_collection_by_loc(loc: str) -> Optional['Collection']:
     """
@@ -65,6 +74,64 @@ def get_collection_by_loc(loc: str) -> Optional['Collection']:
     return None
 
 
+def _get_mtime(fileinfo: Optional[Gio.FileInfo]) -> Optional[int]:
+    """
+    Returns the modification time contained in a file info as unix
+    timestamp, or None if there is no file info.
+    """
+    if fileinfo is None:
+        return None
+    return fileinfo.get_modification_date_time().to_unix()
+
+
+# (directory, album, artist) of a track, see _get_compilation_key
+_CompilationKey = Tuple[str, Optional[str], Optional[str]]
+
+
+def _get_compilation_key(get_tag: Callable[[str], Any]) -> Optional[_CompilationKey]:
+    """
+    Returns the directory of a track, and its album and artist
+    normalized for compilation detection, or None if the directory is
+    not known.
+
+    :param get_tag: returns the raw value of a tag of the track, like
+        Track.get_tag_raw
+    """
+
+    def normalize(value):
+        if isinstance(value, list):
+            value = "\0".join(value)
+        return value.lower() if value else None
+
+    try:
+        basedir = get_tag('__basedir')
+        album = normalize(get_tag('album'))
+        artist = normalize(get_tag('artist'))
+    except Exception:
+        logger.warning("Error while checking for compilation", exc_info=True)
+        return None
+    if not basedir:
+        return None
+    return basedir, album, artist
+
+
+class _DoneFuture:
+    """
+    Stands in for an already completed concurrent.futures.Future
+    """
+
+    __slots__ = ['_result']
+
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+    def cancel(self):
+        return False
+
+
 class CollectionScanThread(common.ProgressThread):
     """
     Scans the collection
@@ -130,7 +197,7 @@ class Collection(trax.TrackDB):
     5
     """
 
-    def __init__(self, name, location=None, pickle_attrs=[]):
+    def __init__(self, name, location=None, pickle_attrs=[], lazy=False):
         global COLLECTIONS
         self.libraries: Dict[str, Library] = {}
         self._scanning = False
@@ -140,7 +207,9 @@ class Collection(trax.TrackDB):
         self._frozen = False
         self._libraries_dirty = False
         pickle_attrs += ['_serial_libraries']
-        trax.TrackDB.__init__(self, name, location=location, pickle_attrs=pickle_attrs)
+        trax.TrackDB.__init__(
+            self, name, location=location, pickle_attrs=pickle_attrs, lazy=lazy
+        )
         COLLECTIONS.add(self)
 
     def freeze_libraries(self) -> None:
@@ -255,7 +324,9 @@ class Collection(trax.TrackDB):
                 continue
 
             event.add_callback(self._progress_update, 'tracks_scanned', library)
-            library.rescan(notify_interval=scan_interval, force_update=force_update)
+            # a scan can change the tags of many tracks, send them in batches
+            with trax.batch_tags_changed():
+                library.rescan(notify_interval=scan_interval, force_update=force_update)
             event.remove_callback(self._progress_update, 'tracks_scanned', library)
             self._running_total_count += self._running_count
             if self._scan_stopped:
@@ -565,6 +636,15 @@ class Library:
         self.collection: Optional[Collection] = None
         self.set_rescan_interval(scan_interval)
 
+        # Index of the scanned tracks for compilation detection: location
+        # -> (directory, album, artist), and directory -> locations. The
+        # directories whose tracks changed are checked after a scan. It
+        # is built from the tracks in the collection before the first scan.
+        self._compilation_keys: Dict[str, _CompilationKey] = {}
+        self._compilation_locs: Dict[str, Set[str]] = {}
+        self._compilation_dirs: Set[str] = set()
+        self._compilation_loaded = False
+
     def set_location(self, location: str) -> None:
         """
         Changes the location of this Library
@@ -572,6 +652,10 @@ class Library:
         :param location: the new location to use
         """
         self.location = location
+        self._compilation_keys.clear()
+        self._compilation_locs.clear()
+        self._compilation_dirs.clear()
+        self._compilation_loaded = False
 
     def get_location(self) -> str:
         """
@@ -649,65 +733,106 @@ class Library:
 
         return count
 
-    def _check_compilation(
-        self,
-        ccheck: Dict[str, Dict[str, Deque[str]]],
-        compilations: MutableSequence[Tuple[str, str]],
-        tr: trax.Track,
-    ) -> None:
+    def _index_compilation_track(self, loc: str, tr: Optional[trax.Track]) -> None:
         """
-        This is the hacky way to test to see if a particular track is a
-        part of a compilation.
+        Updates the compilation index for a scanned or removed track, and
+        marks its directory for checking if the track is new there, or
+        its album or artist changed.
 
-        Basically, if there is more than one track in a directory that has
-        the same album but different artist, we assume that it's part of a
-        compilation.
-
-        :param ccheck: dictionary for internal use
-        :param compilations: if a compilation is found, it'll be appended
-            to this list
-        :param tr: the track to check
+        :param loc: the location of the track
+        :param tr: the track, None if it was removed
         """
-        # check for compilations
-        if not settings.get_option('collection/file_based_compilations', True):
+        key = _get_compilation_key(tr.get_tag_raw) if tr is not None else None
+        old_key = self._compilation_keys.get(loc)
+        if key == old_key:
             return
 
-        def joiner(value):
-            if isinstance(value, list):
-                return "\0".join(value)
-            else:
-                return value
+        if old_key is not None:
+            del self._compilation_keys[loc]
+            locs = self._compilation_locs[old_key[0]]
+            locs.discard(loc)
+            if not locs:
+                del self._compilation_locs[old_key[0]]
+            self._compilation_dirs.add(old_key[0])
 
-        try:
-            basedir = joiner(tr.get_tag_raw('__basedir'))
-            album = joiner(tr.get_tag_raw('album'))
-            artist = joiner(tr.get_tag_raw('artist'))
-        except Exception:
-            logger.warning("Error while checking for compilation: %s", tr)
-            return
-        if not basedir or not album or not artist:
-            return
-        album = album.lower()
-        artist = artist.lower()
-        try:
-            if basedir not in ccheck:
-                ccheck[basedir] = {}
+        if key is not None:
+            self._compilation_keys[loc] = key
+            self._compilation_locs.setdefault(key[0], set()).add(loc)
+            self._compilation_dirs.add(key[0])
 
-            if album not in ccheck[basedir]:
-                ccheck[basedir][album] = deque()
-        except TypeError:
-            logger.exception("Error adding to compilation")
-            return
+    def _load_compilation_index(self, libloc: Gio.File) -> None:
+        """
+        Builds the compilation index from the tags the collection stores
+        for the tracks of this library. Their directories are not marked
+        for checking, earlier scans did that already, so after a restart
+        only the directories changed since are checked again.
 
-        if ccheck[basedir][album] and artist not in ccheck[basedir][album]:
-            if not (basedir, album) in compilations:
-                compilations.append((basedir, album))
-                logger.debug("Compilation %r detected in %r", album, basedir)
+        Tracks that haven't been created yet (see collection/lazy_load)
+        are indexed without creating them.
+        """
+        for loc, holder in list(self.collection.tracks.items()):
+            try:
+                if not Gio.File.new_for_uri(loc).has_prefix(libloc):
+                    continue
+            except UnicodeDecodeError:
+                logger.exception("Error decoding file location")
+                continue
+            key = _get_compilation_key(holder._get_pickles().get)
+            if key is not None:
+                self._compilation_keys[loc] = key
+                self._compilation_locs.setdefault(key[0], set()).add(loc)
+        self._compilation_loaded = True
 
-        ccheck[basedir][album].append(artist)
+    def _detect_compilations(self) -> None:
+        """
+        This is the hacky way to find out which tracks are part of a
+        compilation, in the directories marked for checking.
+
+        Basically, if there is more than one track in a directory that has
+        the same album but different artist, we assume that it's part of a
+        compilation. The __compilation tag of these tracks is set to
+        (directory, album), and removed from the other tracks checked.
+        """
+        for basedir in self._compilation_dirs:
+            # album -> artists, only the first two are needed
+            artists: Dict[str, Set[str]] = {}
+            dir_tracks = []
+            locs = self._compilation_locs.get(basedir, set())
+            for loc in list(locs):
+                tr = self.collection.get_track_by_loc(loc)
+                if tr is None:
+                    # removed from the collection since it was scanned
+                    del self._compilation_keys[loc]
+                    locs.discard(loc)
+                    continue
+                album, artist = self._compilation_keys[loc][1:]
+                dir_tracks.append((tr, album))
+                if album and artist:
+                    album_artists = artists.setdefault(album, set())
+                    if len(album_artists) < 2:
+                        album_artists.add(artist)
+
+            compilations = {
+                album
+                for album, album_artists in artists.items()
+                if len(album_artists) > 1
+            }
+            for album in compilations:
+                logger.debug("Compilation %r detected in %r", album, basedir)
+            for tr, album in dir_tracks:
+                if album in compilations:
+                    tr.set_tag_raw('__compilation', (basedir, album))
+                elif tr.get_tag_raw('__compilation') is not None:
+                    tr.set_tag_raw('__compilation', None)
+            if not locs:
+                self._compilation_locs.pop(basedir, None)
+        self._compilation_dirs.clear()
 
     def update_track(
-        self, gloc: Gio.File, force_update: bool = False
+        self,
+        gloc: Gio.File,
+        force_update: bool = False,
+        fileinfo: Optional[Gio.FileInfo] = None,
     ) -> Optional[trax.Track]:
         """
         Rescan the track at a given location
@@ -716,6 +841,8 @@ class Library:
         :type gloc: :class:`Gio.File`
         :param force_update: Force update of file (default only updates file
                              when mtime has changed)
+        :param fileinfo: the file info of the location, if already known.
+            Must contain the ``time::modified`` attribute.
 
         returns: the Track object, None if it could not be updated
         """
@@ -725,7 +852,7 @@ class Library:
 
         tr = self.collection.get_track_by_loc(uri)
         if tr:
-            tr.read_tags(force=force_update)
+            tr.read_tags(force=force_update, mtime=_get_mtime(fileinfo))
         else:
             tr = trax.Track(uri)
             if tr._scan_valid:
@@ -741,6 +868,119 @@ class Library:
 
         return tr
 
+    def _begin_update_track(self, gloc: Gio.File) -> Optional[Tuple[trax.Track, bool]]:
+        """
+        First half of update_track, without reading any tags. Must be
+        called on the scanning thread.
+
+        :returns: a tuple (track, is_new), None if the track could not be
+            updated
+        """
+        uri = gloc.get_uri()
+        if not uri:  # we get segfaults if this check is removed
+            return None
+
+        tr = self.collection.get_track_by_loc(uri)
+        if tr:
+            return tr, False
+        return trax.Track(uri, scan=False), True
+
+    def _finish_update_track(
+        self, tr: trax.Track, is_new: bool, fetched
+    ) -> Optional[trax.Track]:
+        """
+        Second half of update_track, applies the tags read by
+        Track._fetch_disk_tags. Must be called on the scanning thread.
+
+        :param fetched: the result of Track._fetch_disk_tags, or None if
+            the track was not read
+        :returns: the Track object, None if it could not be updated
+        """
+        if is_new:
+            if fetched is not None:
+                # notify isn't needed here because this is a new track
+                tr._apply_disk_tags(fetched, notify_changed=False)
+            if tr._scan_valid or not tr._init:
+                self.collection.add(tr)
+        elif fetched is not None:
+            tr._apply_disk_tags(fetched)
+
+        if not tr.is_supported():
+            return None
+
+        return tr
+
+    def _update_tracks(
+        self, entries: Iterable[Tuple[Gio.File, Gio.FileInfo]], force_update: bool
+    ) -> Iterable[Tuple[Gio.File, Gio.FileType, Optional[trax.Track]]]:
+        """
+        Updates the tracks for the regular files in entries.
+
+        If the ``collection/scan_workers`` option is larger than 1, the tags
+        are read by a pool of worker threads, while the tracks are still
+        added to the collection on the calling thread. Either way, the
+        results are yielded in the same order as entries.
+
+        :param entries: tuples (location, file info), as returned by
+            common.walk_with_info
+        :returns: tuples (location, file type, track or None)
+        """
+        workers = settings.get_option('collection/scan_workers', 1)
+        if workers <= 1:
+            for fil, fileinfo in entries:
+                type = fileinfo.get_file_type()
+                tr = None
+                if type == Gio.FileType.REGULAR:
+                    tr = self.update_track(
+                        fil, force_update=force_update, fileinfo=fileinfo
+                    )
+                yield fil, type, tr
+            return
+
+        # Keep the workers busy, but don't read too far ahead so that
+        # progress updates and scan cancellation stay responsive.
+        window_size = workers * 4
+        window: Deque = deque()
+
+        def finish(fil, type, job, future):
+            tr = None
+            if job is not None:
+                fetched = future.result() if future is not None else None
+                tr = self._finish_update_track(job[0], job[1], fetched)
+            return fil, type, tr
+
+        executor = ThreadPoolExecutor(workers, thread_name_prefix='LibraryScan')
+        try:
+            for fil, fileinfo in entries:
+                type = fileinfo.get_file_type()
+                job = future = None
+                if type == Gio.FileType.REGULAR:
+                    job = self._begin_update_track(fil)
+                    if job is not None:
+                        tr, is_new = job
+                        mtime = _get_mtime(fileinfo)
+                        if not (is_new or force_update or tr._is_modified(mtime)):
+                            # Unchanged, no need to bother the workers
+                            future = _DoneFuture((True, None))
+                        # Tracks that already exist outside of the
+                        # collection are added as they are, see update_track
+                        elif not is_new or tr._init:
+                            future = executor.submit(
+                                tr._fetch_disk_tags, force_update or is_new, mtime
+                            )
+                window.append((fil, type, job, future))
+
+                while len(window) > window_size:
+                    yield finish(*window.popleft())
+
+            while window:
+                yield finish(*window.popleft())
+        finally:
+            for fil, type, job, future in window:
+                if future is not None:
+                    future.cancel()
+            executor.shutdown(wait=True)
+
     def rescan(
         self, notify_interval: Optional[int] = None, force_update: bool = False
     ) -> bool:
@@ -763,57 +1003,29 @@ class Library:
         self.scanning = True
         libloc = Gio.File.new_for_uri(self.location)
 
+        detect_compilations = _FILE_BASED_COMPILATIONS.value
+        if not detect_compilations:
+            # everything is checked once the detection is enabled again
+            self._compilation_keys.clear()
+            self._compilation_locs.clear()
+            self._compilation_dirs.clear()
+            self._compilation_loaded = True
+        elif not self._compilation_loaded:
+            self._load_compilation_index(libloc)
+
         count = 0
-        dirtracks = deque()
-        compilations = deque()
-        ccheck = {}
-        for fil in common.walk(libloc):
+        scanned_uris = set()
+        scanned = self._update_tracks(common.walk_with_info(libloc), force_update)
+        for fil, type, tr in scanned:
             count += 1
-            type = fil.query_info(
-                "standard::type", Gio.FileQueryInfoFlags.NONE, None
-            ).get_file_type()
-            if type == Gio.FileType.DIRECTORY:
-                if dirtracks:
-                    for tr in dirtracks:
-                        self._check_compilation(ccheck, compilations, tr)
-                    for basedir, album in compilations:
-                        base = basedir.replace('"', '\\"')
-                        alb = album.replace('"', '\\"')
-                        items = [
-                            tr
-                            for tr in dirtracks
-                            if tr.get_tag_raw('__basedir') == base and
-                            # FIXME: this is ugly
-                            alb in "".join(tr.get_tag_raw('album') or []).lower()
-                        ]
-                        for item in items:
-                            item.set_tag_raw('__compilation', (basedir, album))
-                dirtracks = deque()
-                compilations = deque()
-                ccheck = {}
-            elif type == Gio.FileType.REGULAR:
-                tr = self.update_track(fil, force_update=force_update)
-                if not tr:
-                    continue
-
-                if dirtracks is not None:
-                    dirtracks.append(tr)
-                    # do this so that if we have, say, a 4000-song folder
-                    # we dont get bogged down trying to keep track of them
-                    # for compilation detection. Most albums have far fewer
-                    # than 110 tracks anyway, so it is unlikely that this
-                    # restriction will affect the heuristic's accuracy.
-                    # 110 was chosen to accommodate "top 100"-style
-                    # compilations.
-                    if len(dirtracks) > 110:
-                        logger.debug(
-                            "Too many files, skipping "
-                            "compilation detection heuristic for %s",
-                            fil.get_uri(),
-                        )
-                        dirtracks = None
+            if type == Gio.FileType.REGULAR:
+                uri = fil.get_uri()
+                scanned_uris.add(uri)
+                if tr and detect_compilations:
+                    self._index_compilation_track(uri, tr)
 
             if self.collection and self.collection._scan_stopped:
+                scanned.close()
                 self.scanning = False
                 logger.info("Scan canceled")
                 return False
@@ -832,6 +1044,9 @@ class Library:
             loc = tr.get_loc_for_io()
             if not loc:
                 continue
+            # Found by the walk above, so it still exists
+            if loc in scanned_uris:
+                continue
             gloc = Gio.File.new_for_uri(loc)
             try:
                 if not gloc.has_prefix(libloc):
@@ -846,6 +1061,11 @@ class Library:
         for tr in removals:
             logger.debug("Removing %s", tr)
             self.collection.remove(tr)
+            if detect_compilations:
+                self._index_compilation_track(tr.get_loc_for_io(), None)
+
+        if detect_compilations:
+            self._detect_compilations()
 
         logger.info("Scan completed: %s", self.location)
         self.scanning = False
@@ -39,7 +39,7 @@ import shelve
 import subprocess
 import sys
 import threading
-from typing import Deque, Generic, Iterable, List, TypeVar
+from typing import Deque, Generic, Iterable, List, Tuple, TypeVar
 import urllib.parse
 import urllib.request
 import weakref
@@ -541,17 +541,42 @@ def walk(root: Gio.File) -> Iterable[Gio.File]:
         directory to walk through
     :returns: a generator object
     """
-    queue: Deque[Gio.File] = deque()
-    queue.append(root)
+    for fil, fileinfo in walk_with_info(root):
+        yield fil
+
+
+def walk_with_info(root: Gio.File) -> Iterable[Tuple[Gio.File, Gio.FileInfo]]:
+    """
+    Same as walk, but also yields the :class:`Gio.FileInfo` obtained while
+    enumerating each file, so that callers don't need to query it again.
+
+    The file info holds the ``standard::type`` and ``time::modified``
+    attributes.
+
+    :param root: a :class:`Gio.File` representing the
+        directory to walk through
+    :returns: a generator object yielding (file, file info) tuples
+    """
+    attributes = (
+        "standard::type,"
+        "standard::is-symlink,standard::name,"
+        "standard::symlink-target,time::modified"
+    )
+    try:
+        rootinfo = root.query_info(attributes, Gio.FileQueryInfoFlags.NONE, None)
+    except GLib.Error:
+        logger.exception("Unhandled exception while walking on %s.", root)
+        return
+
+    queue: Deque[Tuple[Gio.File, Gio.FileInfo]] = deque()
+    queue.append((root, rootinfo))
 
     while len(queue) > 0:
-        dir = queue.pop()
-        yield dir
+        dir, dirinfo = queue.pop()
+        yield dir, dirinfo
         try:
             for fileinfo in dir.enumerate_children(
-                "standard::type,"
-                "standard::is-symlink,standard::name,"
-                "standard::symlink-target,time::modified",
+                attributes,
                 Gio.FileQueryInfoFlags.NONE,
                 None,
             ):
@@ -568,9 +593,9 @@ def walk(root: Gio.File) -> Iterable[Gio.File]:
                         continue
                 type = fileinfo.get_file_type()
                 if type == Gio.FileType.DIRECTORY:
-                    queue.append(fil)
+                    queue.append((fil, fileinfo))
                 elif type == Gio.FileType.REGULAR:
-                    yield fil
+                    yield fil, fileinfo
         except GLib.Error:  # why doesn't gio offer more-specific errors?
             logger.exception("Unhandled exception while walking on %s.", dir)
 
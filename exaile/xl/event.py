@@ -37,7 +37,9 @@ Events should be emitted AFTER the given event has taken place. Often the
 most appropriate spot is immediately before a return statement.
 """
 
+from collections import deque
 from inspect import ismethod
+import itertools
 import logging
 import re
 import threading
@@ -61,6 +63,9 @@ _NONE = Nothing()  # used by event for a safe None replacement
 # Assumes that this module was imported on main thread
 _UiThread = threading.current_thread()
 
+# gives callbacks the order they were added in
+_callback_order = itertools.count()
+
 
 def log_event(evty, obj, data):
     """
@@ -139,6 +144,33 @@ def add_ui_callback(function, evty=None, obj=None, *args, **kwargs):
     return EVENT_MANAGER.add_callback(function, evty, obj, args, kwargs, ui=True)
 
 
+def coalesce_ui_events(evty, merge=None):
+    """
+    Makes pending events of type evty sent by the same object from other
+    threads be delivered to UI callbacks as a single event. Use this for
+    events whose UI callbacks only care about the latest state, like
+    progress updates.
+
+    :param evty: the *type* or *name* of the events
+    :param merge: function taking the data of the pending event and of the
+        new event, and returning the data of the merged event. By default
+        the data of the new event is used.
+    """
+    global EVENT_MANAGER
+    EVENT_MANAGER.coalesce_ui_events(evty, merge)
+
+
+def has_callbacks(evty):
+    """
+    Checks whether any callback listens to events of type evty, so that
+    senders can skip building events nobody receives.
+
+    :param evty: the *type* or *name* of the event
+    """
+    global EVENT_MANAGER
+    return EVENT_MANAGER.has_callbacks(evty)
+
+
 def remove_callback(function, evty=None, obj=None):
     """
     Removes a callback. Can remove both ui and non-ui callbacks.
@@ -173,7 +205,7 @@ class Callback:
     Represents a callback
     """
 
-    __slots__ = ['wfunction', 'time', 'args', 'kwargs']
+    __slots__ = ['wfunction', 'time', 'order', 'args', 'kwargs']
 
     def __init__(self, function, time, args, kwargs):
         """
@@ -182,6 +214,7 @@ class Callback:
         """
         self.wfunction = _getWeakRef(function)
         self.time = time
+        self.order = next(_callback_order)
         self.args = args
         self.kwargs = kwargs
 
@@ -257,6 +290,87 @@ def _getWeakRef(obj, notifyDead=None):
         return createRef(obj, notifyDead)
 
 
+# maximum time in seconds the UI thread spends on events sent by other
+# threads before it handles other work
+UI_EVENT_BUDGET = 0.01
+
+
+def _newest_data(old, new):
+    return new
+
+
+def _callback_name(function):
+    try:
+        return '%s.%s' % (function.__module__, function.__qualname__)
+    except AttributeError:
+        return repr(function)
+
+
+class EventProfiler:
+    """
+    Counts the events sent by an :class:`EventManager` and measures how
+    long their callbacks take, see :meth:`EventManager.set_profiling`
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """
+        Drops all collected data
+        """
+        with self.lock:
+            self.start_time = time.perf_counter()
+            # event type: [count, total seconds, max seconds]
+            self.events = {}
+            # (event type, callback name): [calls, total seconds, max seconds]
+            self.callbacks = {}
+
+    def add_event(self, evty):
+        with self.lock:
+            try:
+                self.events[evty][0] += 1
+            except KeyError:
+                self.events[evty] = [1, 0.0, 0.0]
+
+    def add_dispatch(self, evty, duration):
+        """
+        Adds the time it took to call all callbacks of an event
+        """
+        with self.lock:
+            stats = self.events.setdefault(evty, [0, 0.0, 0.0])
+            stats[1] += duration
+            if duration > stats[2]:
+                stats[2] = duration
+
+    def add_call(self, evty, function, duration):
+        key = (evty, _callback_name(function))
+        with self.lock:
+            try:
+                stats = self.callbacks[key]
+            except KeyError:
+                stats = self.callbacks[key] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += duration
+            if duration > stats[2]:
+                stats[2] = duration
+
+    def get_stats(self):
+        """
+        :returns: a tuple (seconds since the data was cleared, events,
+            callbacks). events maps event types, and callbacks maps tuples
+            (event type, callback name), to tuples (count, total seconds,
+            maximum seconds)
+        """
+        with self.lock:
+            return (
+                time.perf_counter() - self.start_time,
+                {k: tuple(v) for k, v in self.events.items()},
+                {k: tuple(v) for k, v in self.callbacks.items()},
+            )
+
+
 class EventManager:
     """
     Manages all Events
@@ -275,8 +389,36 @@ class EventManager:
         # synchronous events and add or remove callbacks
         self.lock = threading.RLock()
 
-        self.pending_ui = []
+        # entries [event, callbacks, emit_logmsg, emit_verbose, time queued]
+        # of events sent by other threads, for the UI callbacks
+        self.pending_ui = deque()
         self.pending_ui_lock = threading.Lock()
+        # whether _emit_pending is scheduled, it is as long as pending_ui
+        # isn't empty
+        self._pending_ui_scheduled = False
+        # maximum time in seconds spent on pending UI events in one main
+        # loop iteration
+        self.ui_budget = UI_EVENT_BUDGET
+        # event type: function merging the data of two events, see
+        # coalesce_ui_events
+        self._ui_coalesce = {}
+        # (event type, id of object): entry in pending_ui
+        self._pending_ui_index = {}
+        self._ui_stats = {
+            'delivered': 0,
+            'coalesced': 0,
+            'slices': 0,
+            'max_depth': 0,
+            'last_latency': 0.0,
+            'max_latency': 0.0,
+        }
+
+        # (id of a callbacks dict, event type): callbacks to call, see
+        # _get_callbacks. Only replaced while holding the lock, so that
+        # emit can read it without taking the lock.
+        self._snapshots = {}
+
+        self.profiler = None
 
     def emit(self, event):
         """
@@ -290,6 +432,10 @@ class EventManager:
         )
         emit_verbose = emit_logmsg and self.use_verbose_logger
 
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.add_event(event.type)
+
         global _UiThread
         is_ui_thread = threading.current_thread() == _UiThread
 
@@ -298,55 +444,116 @@ class EventManager:
 
         if is_ui_thread:
             self._emit(event, self.all_callbacks, emit_logmsg, emit_verbose)
+        elif not self._get_callbacks(self.ui_callbacks, event.type, event.object):
+            self._emit(event, self.callbacks, emit_logmsg, emit_verbose)
         else:
             # Don't issue the log message twice
-            with self.pending_ui_lock:
-                do_emit = not self.pending_ui
-                self.pending_ui.append(
-                    (event, self.ui_callbacks, emit_logmsg, emit_verbose)
-                )
-
-            if do_emit:
-                GLib.idle_add(self._emit_pending)
+            self._queue_ui(event, emit_logmsg, emit_verbose)
             self._emit(event, self.callbacks, False, emit_verbose)
 
-    def _emit_pending(self):
+    def _queue_ui(self, event, emit_logmsg, emit_verbose):
+        merge = self._ui_coalesce.get(event.type)
         with self.pending_ui_lock:
-            events = self.pending_ui
-            self.pending_ui = []
+            if merge is not None:
+                key = (event.type, id(event.object))
+                entry = self._pending_ui_index.get(key)
+                if entry is not None:
+                    old = entry[0]
+                    entry[0] = Event(old.type, old.object, merge(old.data, event.data))
+                    self._ui_stats['coalesced'] += 1
+                    return
+            entry = [
+                event,
+                self.ui_callbacks,
+                emit_logmsg,
+                emit_verbose,
+                time.perf_counter(),
+            ]
+            self.pending_ui.append(entry)
+            if merge is not None:
+                self._pending_ui_index[key] = entry
+            depth = len(self.pending_ui)
+            if depth > self._ui_stats['max_depth']:
+                self._ui_stats['max_depth'] = depth
+            if self._pending_ui_scheduled:
+                return
+            self._pending_ui_scheduled = True
+        GLib.idle_add(self._emit_pending)
 
-        for event in events:
-            self._emit(*event)
+    def _emit_pending(self):
+        """
+        Delivers pending events to the UI callbacks, until they took more
+        than ui_budget seconds. The rest is left for the next main loop
+        iteration, so that the UI stays responsive.
+        """
+        start = time.perf_counter()
+        stats = self._ui_stats
+        stats['slices'] += 1
+        while True:
+            with self.pending_ui_lock:
+                if not self.pending_ui:
+                    self._pending_ui_scheduled = False
+                    return False
+                entry = self.pending_ui.popleft()
+                event = entry[0]
+                if self._pending_ui_index.get((event.type, id(event.object))) is entry:
+                    del self._pending_ui_index[(event.type, id(event.object))]
+
+            now = time.perf_counter()
+            latency = now - entry[4]
+            stats['delivered'] += 1
+            stats['last_latency'] = latency
+            if latency > stats['max_latency']:
+                stats['max_latency'] = latency
+
+            self._emit(*entry[:4])
+
+            if time.perf_counter() - start >= self.ui_budget:
+                # keep the idle callback, there may be more events
+                return True
+
+    def coalesce_ui_events(self, evty, merge=None):
+        """
+        Makes pending events of type evty sent by the same object from
+        other threads be delivered to UI callbacks as one event
 
-    def _emit(self, event, exc_callbacks, emit_logmsg, emit_verbose):
-        # Accumulate in this set to ensure callbacks only get called once
-        callbacks = set()
+        :param evty: the type of the events
+        :param merge: function taking the data of the pending event and of
+            the new event, and returning the data of the merged event. By
+            default the data of the new event is used.
+        """
+        if merge is None:
+            merge = _newest_data
+        self._ui_coalesce[evty] = merge
 
-        with self.lock:
-            for tcall in [_NONE, event.type]:
-                tcb = exc_callbacks.get(tcall)
-                if tcb is not None:
-                    for ocall in [_NONE, event.object]:
-                        ocb = tcb.get(ocall)
-                        if ocb is not None:
-                            callbacks.update(ocb)
-
-        # However, do not actually call the callbacks from within the lock
-        # -> Otherwise non-ui threads could accidentally block the UI if
-        #    they decide to run for too long
-
-        for cb in callbacks:
+    def get_ui_queue_stats(self):
+        """
+        :returns: a dict with the current and maximum number of events
+            waiting for the UI thread, the number of events delivered and
+            coalesced, the number of main loop iterations that delivered
+            them, and the last and maximum time in seconds an event waited
+        """
+        with self.pending_ui_lock:
+            stats = dict(self._ui_stats)
+            stats['depth'] = len(self.pending_ui)
+        return stats
+
+    def _emit(self, event, exc_callbacks, emit_logmsg, emit_verbose):
+        profiler = self.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+
+        # The callbacks are not called from within the lock, otherwise non-ui
+        # threads could accidentally block the UI if they decide to run for
+        # too long
+        for cb in self._get_callbacks(exc_callbacks, event.type, event.object):
             try:
                 fn = cb.wfunction()
                 if fn is None:
                     # Remove callbacks that have been garbage collected.. but
                     # really, should be using remove_callback to clean up after
                     # your event handler
-                    with self.lock:
-                        try:
-                            exc_callbacks[event.type][event.object].remove(cb)
-                        except (KeyError, ValueError):
-                            pass
+                    self._remove_dead_callback(cb)
                 else:
                     if emit_verbose:
                         logger.debug(
@@ -354,14 +561,30 @@ class EventManager:
                             "%(function)s in response "
                             "to %(event)s." % {'function': fn, 'event': event.type}
                         )
-                    fn.__call__(
-                        event.type, event.object, event.data, *cb.args, **cb.kwargs
-                    )
+                    if profiler is None:
+                        fn(event.type, event.object, event.data, *cb.args, **cb.kwargs)
+                    else:
+                        call_start = time.perf_counter()
+                        try:
+                            fn(
+                                event.type,
+                                event.object,
+                                event.data,
+                                *cb.args,
+                                **cb.kwargs
+                            )
+                        finally:
+                            profiler.add_call(
+                                event.type, fn, time.perf_counter() - call_start
+                            )
                 fn = None
             except Exception:
                 # something went wrong inside the function we're calling
                 logger.exception("Event callback exception caught!")
 
+        if profiler is not None:
+            profiler.add_dispatch(event.type, time.perf_counter() - start)
+
         if emit_logmsg:
             logger.debug(
                 "Sent '%s' event from %r with data %r",
@@ -370,6 +593,89 @@ class EventManager:
                 event.data,
             )
 
+    def _get_callbacks(self, exc_callbacks, evty, obj):
+        """
+        Returns the callbacks in exc_callbacks to call for an event of type
+        evty sent by obj, in the order they were added
+        """
+        snapshot = self._snapshots.get((id(exc_callbacks), evty))
+        if snapshot is None:
+            snapshot = self._make_snapshot(exc_callbacks, evty)
+        callbacks, by_object = snapshot
+        if by_object is not None:
+            try:
+                callbacks = by_object.get(obj, callbacks)
+            except TypeError:
+                # obj can't be weakly referenced, so nothing listens to it
+                pass
+        return callbacks
+
+    def has_callbacks(self, evty):
+        """
+        Whether any callback listens to events of type evty
+        """
+        snapshot = self._snapshots.get((id(self.all_callbacks), evty))
+        if snapshot is None:
+            snapshot = self._make_snapshot(self.all_callbacks, evty)
+        callbacks, by_object = snapshot
+        return bool(callbacks) or by_object is not None
+
+    def _make_snapshot(self, exc_callbacks, evty):
+        """
+        Collects the callbacks for events of type evty, as a tuple of the
+        callbacks for any object and a mapping of objects with callbacks of
+        their own to all of their callbacks (or None if there are none)
+        """
+
+        def ordered(callbacks):
+            return tuple(sorted(callbacks, key=lambda cb: cb.order))
+
+        with self.lock:
+            tables = [
+                tcb
+                for tcb in (exc_callbacks.get(_NONE), exc_callbacks.get(evty))
+                if tcb is not None
+            ]
+            general = [cb for tcb in tables for cb in tcb.get(_NONE, ())]
+            by_object = weakref.WeakKeyDictionary()
+            for tcb in tables:
+                for obj in list(tcb.keys()):
+                    if obj is _NONE or obj in by_object:
+                        continue
+                    by_object[obj] = ordered(
+                        general + [cb for t in tables for cb in t.get(obj, ())]
+                    )
+            snapshot = (ordered(general), by_object or None)
+            self._snapshots[(id(exc_callbacks), evty)] = snapshot
+        return snapshot
+
+    def _remove_dead_callback(self, cb):
+        with self.lock:
+            for cbs in [self.callbacks, self.all_callbacks, self.ui_callbacks]:
+                for evty, tcb in list(cbs.items()):
+                    for obj, callbacks in list(tcb.items()):
+                        if cb in callbacks:
+                            callbacks.remove(cb)
+                            if len(callbacks) == 0:
+                                del tcb[obj]
+                    if len(tcb) == 0:
+                        del cbs[evty]
+            self._snapshots = {}
+
+    def set_profiling(self, enabled):
+        """
+        Enables or disables counting events and measuring their callbacks
+
+        :returns: the :class:`EventProfiler` collecting the data, or None
+            if profiling was disabled
+        """
+        with self.lock:
+            if not enabled:
+                self.profiler = None
+            elif self.profiler is None:
+                self.profiler = EventProfiler()
+            return self.profiler
+
     def emit_async(self, event):
         """
         Same as emit(), but does not block.
@@ -418,6 +724,8 @@ class EventManager:
                 # add the actual callback
                 callbacks.append(cb)
 
+            self._snapshots = {}
+
         if self.use_logger:
             if (
                 not self.logger_filter
@@ -466,6 +774,8 @@ class EventManager:
                     if len(cbs[evty]) == 0:
                         del cbs[evty]
 
+            self._snapshots = {}
+
         if self.use_logger:
             if (
                 not self.logger_filter
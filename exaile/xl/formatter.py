@@ -31,13 +31,14 @@ preparation of data for display in various contexts.
 """
 
 from datetime import date
+import functools
 import re
-from typing import Dict, Tuple, Union
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
 from gi.repository import GLib
 from gi.repository import GObject
 
-from xl import common, providers, settings, trax
+from xl import common, event, providers, settings, trax
 from xl.common import TimeSpan
 from xl.nls import gettext as _, ngettext
 
@@ -158,6 +159,202 @@ class ParameterTemplate(metaclass=_ParameterTemplateMetaclass):
         return self.pattern.sub(convert, self.template)
 
 
+def _parse_parameters(parameters: str) -> Dict[str, Union[bool, str]]:
+    """
+    Turns the parameters of an identifier into a dictionary
+
+    :param parameters: the text after the colon in ``${identifier:...}``
+    """
+    # Split parameters on unescaped comma
+    parts = [p.lstrip() for p in re.split(r'(?<!\\),', parameters)]
+    # Split arguments on unescaped equals sign
+    parts = [(re.split(r'(?<!\\)=', p, 1) + [True])[:2] for p in parts]
+    # Turn list of lists into a proper dictionary
+    result = dict(parts)
+
+    # Remove now obsolete escapes
+    for p in result:
+        argument = result[p]
+
+        if not isinstance(argument, bool):
+            argument = argument.replace(r'\,', ',')
+            argument = argument.replace(r'\}', '}')
+            argument = argument.replace(r'\=', '=')
+            result[p] = argument
+
+    return result
+
+
+class _TemplateField:
+    """
+    An identifier with its parameters in a compiled format
+    """
+
+    __slots__ = [
+        'needle',
+        'identifier',
+        'parameters',
+        'arguments',
+        'prefix',
+        'suffix',
+        'pad',
+        'padstring',
+    ]
+
+    def __init__(self, needle, identifier, parameters):
+        self.needle = needle
+        self.identifier = identifier
+        # passed to tag formatters, must not be modified
+        self.parameters = parameters
+
+        # the parameters handled by Formatter itself
+        arguments = dict(parameters)
+        self.prefix = arguments.pop('prefix', '')
+        self.suffix = arguments.pop('suffix', '')
+        self.pad = int(arguments.pop('pad', 0))
+        self.padstring = arguments.pop('padstring', '')
+        # the remaining parameters are passed to callable substitutions
+        self.arguments = arguments
+
+    def decorate(self, substitute):
+        """
+        Applies padding, prefix and suffix to a substitute
+        """
+        if self.pad > 0 and self.padstring:
+            # Decrease pad length by value length
+            pad = max(0, self.pad - len(substitute))
+            # Retrieve the maximum multiplier for the pad string
+            padcount = pad // len(self.padstring) + 1
+            # Generate pad string
+            padstring = padcount * self.padstring
+            # Clamp pad string
+            padstring = padstring[0:pad]
+            substitute = '%s%s' % (padstring, substitute)
+
+        if substitute:
+            substitute = '%s%s%s' % (self.prefix, substitute, self.suffix)
+
+        return substitute
+
+
+# Increased whenever a tag formatter is added or removed
+_tag_formatters_generation = 0
+
+
+def _on_tag_formatters_changed(type, manager, data):
+    global _tag_formatters_generation
+    _tag_formatters_generation += 1
+
+
+event.add_callback(_on_tag_formatters_changed, 'tag-formatting_provider_added')
+event.add_callback(_on_tag_formatters_changed, 'tag-formatting_provider_removed')
+
+
+class _CompiledTemplate:
+    """
+    A format string split into literal text and identifiers, so that
+    formatting doesn't have to parse it again
+
+    :param template_class: the :class:`ParameterTemplate` whose syntax
+        the format string uses
+    :param template: the format string
+    """
+
+    def __init__(self, template_class, template: str):
+        self.template = template
+        #: unique identifiers, in order of first appearance
+        self.fields: List[_TemplateField] = []
+        #: (text, field index) pairs; the text is literal if the index
+        #: is None, else the placeholder to keep if the field has no value
+        self.segments: List[Tuple[str, Optional[int]]] = []
+        # (generation, tag formatter of each field)
+        self._tag_formatters = (-1, [])
+
+        delimiter = template_class.delimiter
+        indexes = {}
+        position = 0
+
+        for match in template_class.pattern.finditer(template):
+            if match.start() > position:
+                self.segments.append((template[position : match.start()], None))
+            position = match.end()
+
+            named = match.group('named')
+            braced = match.group('braced')
+
+            if named is not None:
+                needle = identifier = named
+                placeholder = delimiter + named
+                parameters = {}
+            elif braced is not None:
+                identifier = braced
+                needle = braced
+                parameters = {}
+
+                if match.group('parameters') is not None:
+                    parameters = _parse_parameters(match.group('parameters'))
+                    needle = '%s:%s' % (braced, match.group('parameters'))
+
+                placeholder = delimiter + '{' + needle + '}'
+            else:
+                # escaped or invalid delimiter
+                self.segments.append((delimiter, None))
+                continue
+
+            # Required to make multiple occurrences of the same
+            # identifier with different parameters work
+            index = indexes.get(needle)
+            if index is None:
+                index = indexes[needle] = len(self.fields)
+                self.fields.append(_TemplateField(needle, identifier, parameters))
+
+            self.segments.append((placeholder, index))
+
+        if position < len(template):
+            self.segments.append((template[position:], None))
+
+    def get_tag_formatters(self) -> List[Optional['TagFormatter']]:
+        """
+        :returns: the tag formatter of each field, or None for fields
+            that are displayed as they are
+        """
+        generation, tag_formatters = self._tag_formatters
+
+        if generation != _tag_formatters_generation:
+            generation = _tag_formatters_generation
+            tag_formatters = [
+                providers.get_provider('tag-formatting', field.identifier)
+                for field in self.fields
+            ]
+            self._tag_formatters = (generation, tag_formatters)
+
+        return tag_formatters
+
+    def render(self, values) -> str:
+        """
+        :param values: the decorated value of each field, or None to
+            keep the placeholder
+        :returns: the formatted text
+        """
+        parts = []
+
+        for text, index in self.segments:
+            if index is not None and values[index] is not None:
+                text = '%s' % (values[index],)
+            parts.append(text)
+
+        return ''.join(parts)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_template(template_class, template: str) -> _CompiledTemplate:
+    """
+    Compiles a format string, reusing the result for formatters with the
+    same format such as those of playlist columns
+    """
+    return _CompiledTemplate(template_class, template)
+
+
 class Formatter(GObject.GObject):
     R"""
     A generic text formatter based on a format string
@@ -192,6 +389,7 @@ class Formatter(GObject.GObject):
         GObject.GObject.__init__(self)
 
         self._template = ParameterTemplate(format)
+        self._compiled: Optional[_CompiledTemplate] = None
         self._substitutions = {}
 
     def do_get_property(self, property):
@@ -210,6 +408,7 @@ class Formatter(GObject.GObject):
         if property.name == 'format':
             if value != self._template.template:
                 self._template.template = value
+                self._compiled = None
         else:
             raise AttributeError('unknown property %s' % property.name)
 
@@ -232,51 +431,23 @@ class Formatter(GObject.GObject):
 
         :returns: the extractions
         """
-        matches = self._template.pattern.finditer(self._template.template)
-        extractions: Formatter.Extractions = {}
-
-        # Extract list of identifiers and parameters from the format string
-        for match in matches:
-            groups = match.groupdict()
+        return {
+            field.needle: (field.identifier, dict(field.parameters))
+            for field in self._get_compiled().fields
+        }
 
-            # We only care about braced and named, not escaped and invalid
-            identifier = groups['braced'] or groups['named']
-
-            if identifier is None:
-                continue
-
-            identifier_parts = [identifier]
-            parameters = {}
-
-            if groups['parameters'] is not None:
-                # Split parameters on unescaped comma
-                parameters = [
-                    p.lstrip() for p in re.split(r'(?<!\\),', groups['parameters'])
-                ]
-                # Split arguments on unescaped equals sign
-                parameters = [
-                    (re.split(r'(?<!\\)=', p, 1) + [True])[:2] for p in parameters
-                ]
-                # Turn list of lists into a proper dictionary
-                parameters = dict(parameters)
-
-                # Remove now obsolete escapes
-                for p in parameters:
-                    argument = parameters[p]
-
-                    if not isinstance(argument, bool):
-                        argument = argument.replace(r'\,', ',')
-                        argument = argument.replace(r'\}', '}')
-                        argument = argument.replace(r'\=', '=')
-                        parameters[p] = argument
-
-                identifier_parts += [groups['parameters']]
+    def _get_compiled(self) -> _CompiledTemplate:
+        """
+        :returns: the compiled format
+        """
+        compiled = self._compiled
 
-            # Required to make multiple occurrences of the same
-            # identifier with different parameters work
-            extractions[':'.join(identifier_parts)] = (identifier, parameters)
+        if compiled is None:
+            compiled = self._compiled = _compile_template(
+                type(self._template), self._template.template
+            )
 
-        return extractions
+        return compiled
 
     def format(self, *args):
         """
@@ -286,43 +457,25 @@ class Formatter(GObject.GObject):
         :returns: the formatted text
         :rtype: string
         """
-        extractions = self.extract()
-        substitutions = {}
+        compiled = self._get_compiled()
+        substitutions = self._substitutions
+        values = []
 
-        for needle, (identifier, parameters) in extractions.items():
-            substitute = None
-
-            if needle in self._substitutions:
-                substitute = self._substitutions[needle]
-            elif identifier in self._substitutions:
-                substitute = self._substitutions[identifier]
+        for field in compiled.fields:
+            if field.needle in substitutions:
+                substitute = substitutions[field.needle]
+            else:
+                substitute = substitutions.get(field.identifier)
 
             if substitute is not None:
-                prefix = parameters.pop('prefix', '')
-                suffix = parameters.pop('suffix', '')
-                pad = int(parameters.pop('pad', 0))
-                padstring = parameters.pop('padstring', '')
-
                 if callable(substitute):
-                    substitute = substitute(*args, **parameters)
-
-                if pad > 0 and padstring:
-                    # Decrease pad length by value length
-                    pad = max(0, pad - len(substitute))
-                    # Retrieve the maximum multiplier for the pad string
-                    padcount = pad // len(padstring) + 1
-                    # Generate pad string
-                    padstring = padcount * padstring
-                    # Clamp pad string
-                    padstring = padstring[0:pad]
-                    substitute = '%s%s' % (padstring, substitute)
+                    substitute = substitute(*args, **field.arguments)
 
-                if substitute:
-                    substitute = '%s%s%s' % (prefix, substitute, suffix)
+                substitute = field.decorate(substitute)
 
-                substitutions[needle] = substitute
+            values.append(substitute)
 
-        return self._template.safe_substitute(substitutions)
+        return compiled.render(values)
 
 
 class ProgressTextFormatter(Formatter):
@@ -400,28 +553,46 @@ class TrackFormatter(Formatter):
         :returns: the formatted text
         :rtype: string
         """
-        if not isinstance(track, trax.Track):
-            raise TypeError(
-                'First argument to format() needs ' 'to be of type xl.trax.Track'
-            )
+        return self.format_many([track], markup_escape)[0]
 
-        extractions = self.extract()
-        self._substitutions = {}
+    def format_many(
+        self, tracks: Iterable[trax.Track], markup_escape: bool = False
+    ) -> List[str]:
+        """
+        Formats several tracks at once, which is faster than
+        calling :meth:`format` for each of them
 
-        for identifier, (tag, parameters) in extractions.items():
-            provider = providers.get_provider('tag-formatting', tag)
+        :param tracks: the tracks to take data from
+        :param markup_escape: whether to escape markup-like
+            characters in tag values
+        :returns: the formatted text of each track
+        """
+        compiled = self._get_compiled()
+        fields = list(zip(compiled.fields, compiled.get_tag_formatters()))
+        results = []
 
-            if provider is None:
-                substitute = track.get_tag_display(tag)
-            else:
-                substitute = provider.format(track, parameters)
+        for track in tracks:
+            if not isinstance(track, trax.Track):
+                raise TypeError(
+                    'First argument to format() needs ' 'to be of type xl.trax.Track'
+                )
 
-            if markup_escape:
-                substitute = GLib.markup_escape_text(substitute)
+            values = []
 
-            self._substitutions[identifier] = substitute
+            for field, provider in fields:
+                if provider is None:
+                    substitute = track.get_tag_display(field.identifier)
+                else:
+                    substitute = provider.format(track, field.parameters)
 
-        return Formatter.format(self)
+                if markup_escape:
+                    substitute = GLib.markup_escape_text(substitute)
+
+                values.append(field.decorate(substitute))
+
+            results.append(compiled.render(values))
+
+        return results
 
 
 class TagFormatter:
@@ -444,7 +615,8 @@ class TagFormatter:
 
         :param track: the track to get the tag from
         :type track: :class:`xl.trax.Track`
-        :param parameters: optionally passed parameters
+        :param parameters: optionally passed parameters, which
+            must not be modified
         :type parameters: dictionary
         :returns: the formatted value
         :rtype: string
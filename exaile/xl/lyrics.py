@@ -119,7 +119,7 @@ class LyricsManager(providers.ProviderHandler):
         self.preferred_order = settings.get_option('lyrics/preferred_order', [])
         self.cache = LyricsCache(os.path.join(xdg.get_cache_dir(), 'lyrics.cache'))
 
-        event.add_callback(self.on_track_tags_changed, 'track_tags_changed')
+        event.add_callback(self.on_tracks_tags_changed, 'tracks_tags_changed')
 
     def __get_cache_key(self, track: Track, provider) -> str:
         """
@@ -281,16 +281,20 @@ class LyricsManager(providers.ProviderHandler):
         except (ValueError, AttributeError):
             pass
 
-    def on_track_tags_changed(self, e, track, tags):
+    def on_tracks_tags_changed(self, e, obj, changes):
         """
         Updates the internal cache upon lyric tag changes
         """
-        if 'lyrics' in tags:
-            local_provider = self.get_provider('__local')
-
-            # If the local tag provider was removed, don't bother
+        local_provider = None
+        for track, tags in changes.items():
+            if 'lyrics' not in tags:
+                continue
             if local_provider is None:
-                return
+                local_provider = self.get_provider('__local')
+
+                # If the local tag provider was removed, don't bother
+                if local_provider is None:
+                    return
 
             key = self.__get_cache_key(track, local_provider)
 
@@ -674,14 +674,29 @@ class Exaile:
         logger.info("Loading collection...")
         from xl import collection
 
+        location = os.path.join(xdg.get_data_dir(), 'music.db')
+        if settings.get_option('collection/database_backend', 'shelf') == 'sqlite':
+            import xl.migrations.database.to_sqlite as sqlite_mig
+
+            sqlite_location = os.path.join(xdg.get_data_dir(), 'music.sqlite')
+            if sqlite_mig.migrate(
+                location, sqlite_location, pickle_attrs=['_serial_libraries']
+            ):
+                location = sqlite_location
+
         try:
             self.collection = collection.Collection(
-                "Collection", location=os.path.join(xdg.get_data_dir(), 'music.db')
+                "Collection",
+                location=location,
+                lazy=settings.get_option('collection/lazy_load', False),
             )
         except common.VersionError:
             logger.exception("VersionError loading collection")
             sys.exit(1)
 
+        if settings.get_option('collection/use_search_index', True):
+            self.collection.enable_search_index()
+
         # Migrate covers.db. This can only be done after the collection is loaded.
         import xl.migrations.database.covers_1to2 as mig
 
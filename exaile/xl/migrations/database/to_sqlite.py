@@ -0,0 +1,80 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+"""
+One-shot migration of a TrackDB shelf to SQLite
+"""
+
+from dbm import whichdb
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(path, new_path, pickle_attrs=()):
+    """
+    Copies the TrackDB shelf at path to a new SQLite database at
+    new_path. Does nothing if new_path already exists or if there is no
+    shelf to migrate. The shelf itself is left untouched, but is not
+    kept up to date afterwards.
+
+    :param path: location of the shelf
+    :param new_path: location of the SQLite database, must end in
+        ``.sqlite``
+    :param pickle_attrs: extra attributes stored in the shelf by the
+        TrackDB subclass, eg. ``_serial_libraries`` for collections
+    :returns: True if new_path is ready to be used
+    """
+    if os.path.exists(new_path):
+        return True
+    # some dbm modules store the shelf in files with other names
+    if not os.path.exists(path) and whichdb(path) is None:
+        return True
+
+    from xl.trax.trackdb import TrackDB
+
+    logger.info("Migrating %s to %s", path, new_path)
+
+    tmp_path = new_path[: -len(os.extsep + 'sqlite')] + '-migrating.sqlite'
+    for leftover in (tmp_path, tmp_path + '-wal', tmp_path + '-shm'):
+        if os.path.exists(leftover):
+            os.unlink(leftover)
+
+    try:
+        # lazy, so the records are copied without creating any Track
+        db = TrackDB(pickle_attrs=list(pickle_attrs), lazy=True)
+        db.load_from_location(path)
+        db._save_to_sqlite(tmp_path)
+        os.replace(tmp_path, new_path)
+    except Exception:
+        logger.exception("Could not migrate %s to SQLite", path)
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        return False
+
+    logger.info("Migration successfully completed!")
+    return True
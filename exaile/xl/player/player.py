@@ -80,7 +80,7 @@ class ExailePlayer:
         self._setup_engine(disable_autoswitch)
 
         event.add_callback(self._on_track_end, 'playback_track_end', self)
-        event.add_callback(self._on_track_tags_changed, 'track_tags_changed')
+        event.add_callback(self._on_tracks_tags_changed, 'tracks_tags_changed')
 
     def _setup_engine(self, disable_autoswitch):
         if self._engine is not None:
@@ -117,10 +117,14 @@ class ExailePlayer:
             i = 0
         track.set_tags(__playcount=i + 1, __last_played=time.time())
 
+    def _on_tracks_tags_changed(self, eventtype, obj, changes):
+        for track, tags in changes.items():
+            if '__stopoffset' in tags:
+                self._on_track_stopoffset_changed(track)
+
     @common.idle_add()
-    def _on_track_tags_changed(self, eventtype, track, tags):
-        if '__stopoffset' in tags:
-            self._engine.on_track_stopoffset_changed(track)
+    def _on_track_stopoffset_changed(self, track):
+        self._engine.on_track_stopoffset_changed(track)
 
     def destroy(self):
         """
@@ -31,6 +31,7 @@ in playlists as well as methods to import and export from various file formats.
 
 from gi.repository import Gio
 
+import bisect
 from collections import deque
 from datetime import datetime, timedelta
 import logging
@@ -955,6 +956,14 @@ class Playlist:
         #     next: <xl.trax.Track> or None
         # current_position: <int> index in self.__tracks or -1 if no track
         # spat_position: <int> index in self.__tracks or -1 if no SPAT set
+        # marks: {<str> metadata key: <list> sorted indices in self.__tracks
+        #   whose metadata has this key}, for the keys marking the current
+        #   and SPAT positions. Updated from each change, so that finding
+        #   the positions doesn't have to look at every track.
+        # track_positions: {<xl.trax.Track>: <list> sorted indices of the
+        #   track in self.__tracks} or None if not built yet. Built when
+        #   first needed, kept up to date when tracks are added or removed
+        #   at the end and dropped on any other change.
         # shuffle_history_counter: <int> count of tracks queued in shuffle mode
         #   Start positive so we can just do an if directly on the value.
         self.__dirty = False
@@ -963,6 +972,11 @@ class Playlist:
         self.__next_data = None
         self.__current_position = -1
         self.__spat_position = -1
+        self.__marks = {
+            'playlist_current_position': [],
+            'playlist_spat_position': [],
+        }
+        self.__track_positions = None
         self.__shuffle_history_counter = 1
 
         event.add_callback(self.on_playback_track_start, "playback_track_start")
@@ -1015,6 +1029,7 @@ class Playlist:
                 self.__tracks.del_meta_key(oldposition, "playlist_current_position")
             except KeyError:
                 pass
+        self.__move_mark("playlist_current_position", oldposition, position)
         self.__dirty = True
         event.log_event(
             "playlist_current_position_changed", self, (position, oldposition)
@@ -1043,13 +1058,15 @@ class Playlist:
         """
         self.__next_data = None
         oldposition = self.spat_position
-        self.__tracks.set_meta_key(position, "playlist_spat_position", True)
+        if position != -1:
+            self.__tracks.set_meta_key(position, "playlist_spat_position", True)
         self.__spat_position = position
         if oldposition != -1:
             try:
                 self.__tracks.del_meta_key(oldposition, "playlist_spat_position")
             except KeyError:
                 pass
+        self.__move_mark("playlist_spat_position", oldposition, position)
         self.__dirty = True
         event.log_event("playlist_spat_position_changed", self, (position, oldposition))
 
@@ -1122,7 +1139,7 @@ class Playlist:
                     and i > current_position
                 ]
                 t = trax.sort_tracks(['discnumber', 'tracknumber'], t)
-                return self.__tracks.index(t[0]), t[0]
+                return self.index(t[0]), t[0]
 
             except IndexError:  # Pick a new album
                 hist = set(self.get_shuffle_history())
@@ -1138,26 +1155,18 @@ class Playlist:
                 album = list(random.choice(list(albums)))
                 t = [x for x in self if x.get_tag_raw('album') == album]
                 t = trax.sort_tracks(['tracknumber'], t)
-                return self.__tracks.index(t[0]), t[0]
+                return self.index(t[0]), t[0]
         elif mode == 'random':
-            try:
-                return random.choice(
-                    [(i, self.__tracks[i]) for i, tr in enumerate(self.__tracks)]
-                )
-            except IndexError:
+            if not self.__tracks:
                 return -1, None
+            i = random.randrange(len(self.__tracks))
+            return i, self.__tracks[i]
         else:
             hist = {i for i, tr in self.get_shuffle_history()}
-            try:
-                return random.choice(
-                    [
-                        (i, self.__tracks[i])
-                        for i, tr in enumerate(self.__tracks)
-                        if i not in hist
-                    ]
-                )
-            except IndexError:  # no more tracks
+            if len(hist) >= len(self.__tracks):  # no more tracks
                 return -1, None
+            i = random.choice([i for i in range(len(self.__tracks)) if i not in hist])
+            return i, self.__tracks[i]
 
     def __get_next(self, current_position):
         # don't recalculate
@@ -1537,6 +1546,7 @@ class Playlist:
 
             trs.append(track)
 
+        self.__replace_tracks(0, len(self.__tracks), 1, trs, [None] * len(trs))
         self.__tracks[:] = trs
 
         for item, val in items.items():
@@ -1562,7 +1572,10 @@ class Playlist:
         return len(self.__tracks)
 
     def __contains__(self, track):
-        return track in self.__tracks
+        try:
+            return track in self.__get_track_positions()
+        except TypeError:  # unhashable, so not a track
+            return False
 
     def __tuple_from_slice(self, i):
         """
@@ -1600,13 +1613,17 @@ class Playlist:
             (start, end, step) = self.__tuple_from_slice(i)
 
             if isinstance(value, MetadataList):
-                metadata = value.metadata
+                # copied, as changes to metadata shared with another list
+                # would not be noticed
+                metadata = [dict(meta) if meta else None for meta in value.metadata]
+                value = MetadataList(value, metadata)
             else:
                 metadata = [None] * len(value)
 
             if step != 1:
                 if len(value) != len(oldtracks):
                     raise ValueError("Extended slice assignment must match sizes.")
+            self.__replace_tracks(start, end, step, value, metadata)
             self.__tracks.__setitem__(i, value)
             removed = MetadataList(
                 zip(range(start, end, step), oldtracks), oldtracks.metadata
@@ -1618,12 +1635,12 @@ class Playlist:
         else:
             if not isinstance(value, trax.Track):
                 raise ValueError("Need trax.Track object, got %r" % type(value))
+            i = range(len(self.__tracks))[i]
+            self.__replace_tracks(i, i + 1, 1, [value], [None])
             self.__tracks[i] = value
             removed = [(i, oldtracks)]
             added = [(i, value)]
 
-        self.on_tracks_changed()
-
         if removed:
             event.log_event('playlist_tracks_removed', self, removed)
         if added:
@@ -1635,8 +1652,12 @@ class Playlist:
     def __delitem__(self, i):
         if isinstance(i, slice):
             (start, end, step) = self.__tuple_from_slice(i)
+        else:
+            start = range(len(self.__tracks))[i]
+            end, step = start + 1, 1
         oldtracks = self.__getitem__(i)
         oldpos = self.current_position
+        self.__replace_tracks(start, end, step, [], [])
         self.__tracks.__delitem__(i)
         removed = MetadataList()
 
@@ -1645,9 +1666,8 @@ class Playlist:
                 zip(range(start, end, step), oldtracks), oldtracks.metadata
             )
         else:
-            removed = [(i, oldtracks)]
+            removed = [(start, oldtracks)]
 
-        self.on_tracks_changed()
         event.log_event('playlist_tracks_removed', self, removed)
         self.__adjust_current_pos(oldpos, removed, [])
         self.__needs_save = self.__dirty = True
@@ -1678,7 +1698,10 @@ class Playlist:
         :returns: the count
         :rtype: int
         """
-        return self.__tracks.count(other)
+        try:
+            return len(self.__get_track_positions().get(other, ()))
+        except TypeError:  # unhashable, so not a track
+            return 0
 
     def index(self, item, start=0, end=None):
         """
@@ -1687,10 +1710,27 @@ class Playlist:
         :returns: the index
         :rtype: int
         """
-        if end is None:
-            return self.__tracks.index(item, start)
-        else:
-            return self.__tracks.index(item, start, end)
+        start, end, _ = slice(start, end).indices(len(self.__tracks))
+        try:
+            positions = self.__get_track_positions().get(item, ())
+        except TypeError:  # unhashable, so not a track
+            positions = ()
+        idx = bisect.bisect_left(positions, start)
+        if idx < len(positions) and positions[idx] < end:
+            return positions[idx]
+        raise ValueError("%r is not in playlist" % (item,))
+
+    def get_unique_tracks(self):
+        """
+        Retrieves the distinct tracks of the playlist as a set-like
+        view, which tests membership without looking at every track.
+
+        The view must not be kept across changes to the playlist.
+
+        :returns: the tracks
+        :rtype: set-like view of :class:`xl.trax.Track`
+        """
+        return self.__get_track_positions().keys()
 
     def pop(self, i=-1):
         """
@@ -1711,18 +1751,110 @@ class Playlist:
                 self.__fetch_dynamic_tracks()
 
     def on_tracks_changed(self, *args):
-        for idx in range(len(self.__tracks)):
-            if self.__tracks.get_meta_key(idx, "playlist_current_position"):
-                self.__current_position = idx
-                break
-        else:
-            self.__current_position = -1
-        for idx in range(len(self.__tracks)):
-            if self.__tracks.get_meta_key(idx, "playlist_spat_position"):
-                self.__spat_position = idx
-                break
+        """
+        Finds the current and SPAT positions by looking at all tracks
+        """
+        metadata = self.__tracks.metadata
+        for key, marks in self.__marks.items():
+            marks[:] = [
+                idx for idx, meta in enumerate(metadata) if meta and meta.get(key)
+            ]
+        self.__update_positions()
+
+    def __update_positions(self):
+        marks = self.__marks['playlist_current_position']
+        self.__current_position = marks[0] if marks else -1
+        marks = self.__marks['playlist_spat_position']
+        self.__spat_position = marks[0] if marks else -1
+
+    def __move_mark(self, key, oldposition, position):
+        """
+        Updates the marks after the metadata key was moved
+        """
+        marks = self.__marks[key]
+        # positions are list indices, -1 is the only one meaning none.
+        # The key is set at the new position before it is deleted at the
+        # old one, which may be the same track.
+        indices = range(len(self.__tracks))
+        if position != -1:
+            position = indices[position]
+            idx = bisect.bisect_left(marks, position)
+            if idx == len(marks) or marks[idx] != position:
+                marks.insert(idx, position)
+        if oldposition != -1:
+            oldposition = indices[oldposition]
+            idx = bisect.bisect_left(marks, oldposition)
+            if idx < len(marks) and marks[idx] == oldposition:
+                del marks[idx]
+
+    def __get_track_positions(self):
+        if self.__track_positions is None:
+            positions = {}
+            for idx, track in enumerate(self.__tracks):
+                positions.setdefault(track, []).append(idx)
+            self.__track_positions = positions
+        return self.__track_positions
+
+    def __replace_track_positions(self, start, end, step, tracks):
+        positions = self.__track_positions
+        if positions is None:
+            return
+        count = len(self.__tracks)
+        if step == 1 and start == count:
+            for idx, track in enumerate(tracks, start):
+                positions.setdefault(track, []).append(idx)
+        elif step == 1 and not tracks and end >= count:
+            # each removed track is at the last of its positions
+            for idx in reversed(range(start, count)):
+                track = self.__tracks[idx]
+                track_positions = positions[track]
+                track_positions.pop()
+                if not track_positions:
+                    del positions[track]
         else:
-            self.__spat_position = -1
+            # shifting the positions of all following tracks would cost
+            # about as much as building them again when needed
+            self.__track_positions = None
+
+    def __replace_tracks(self, start, end, step, tracks, metadata):
+        """
+        Updates the marks, positions and track positions before the
+        tracks at range(start, end, step) are replaced by the given
+        tracks with the given metadata, looking only at the replaced
+        tracks.
+
+        Extended slices are replaced by as many tracks as they contain,
+        or removed if tracks is empty.
+        """
+        self.__replace_track_positions(start, end, step, tracks)
+        for key, marks in self.__marks.items():
+            added = [idx for idx, meta in enumerate(metadata) if meta and meta.get(key)]
+            if not marks and not added:
+                continue
+
+            if step == 1:
+                end = max(start, end)
+                lo = bisect.bisect_left(marks, start)
+                hi = bisect.bisect_left(marks, end)
+                delta = len(metadata) - (end - start)
+                marks[lo:] = [start + idx for idx in added] + [
+                    idx + delta for idx in marks[hi:]
+                ]
+                continue
+
+            replaced = range(start, end, step)
+            removed = set(replaced)
+            kept = [idx for idx in marks if idx not in removed]
+            if metadata:
+                # the tracks stay at the same positions
+                kept.extend(replaced[idx] for idx in added)
+                kept.sort()
+            else:
+                removed = sorted(removed)
+                kept = [idx - bisect.bisect_left(removed, idx) for idx in kept]
+            marks[:] = kept
+
+        self.__update_positions()
 
 
 class SmartPlaylist:
@@ -1963,9 +2095,9 @@ class SmartPlaylist:
                         raise ValueError("Loading %s: %s" % (self.name, e))
 
                 if op == 'pin':
-                    matchers.append(trax.TracksInList(pl))
+                    matchers.append(trax.TracksInList(pl.get_unique_tracks()))
                 else:
-                    matchers.append(trax.TracksNotInList(pl))
+                    matchers.append(trax.TracksNotInList(pl.get_unique_tracks()))
                 continue
             elif fieldtype == 'timestamp':
                 duration, unit = value
@@ -30,10 +30,12 @@
 
 import ast
 from configparser import RawConfigParser, NoSectionError, NoOptionError
+import copy
 import logging
 import os
 import sys
 from typing import Any, ClassVar
+import weakref
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +45,10 @@ from xl.nls import gettext as _
 
 MANAGER = None
 
+# cached by get_option for options that don't exist
+_MISSING = object()
+_UNCACHED = object()
+
 
 class SettingsManager(RawConfigParser):
     """
@@ -72,6 +78,13 @@ class SettingsManager(RawConfigParser):
         """
         RawConfigParser.__init__(self)
 
+        # option path: parsed value, or _MISSING
+        self._cache = {}
+        # bumped whenever an option changes, see get_option
+        self._cache_generation = 0
+        # lower case option path: LiveOptions of that option
+        self._live_options = {}
+
         self.location = location
         self._saving = False
         self._dirty = False
@@ -151,6 +164,7 @@ class SettingsManager(RawConfigParser):
             self.add_section(section)
             self.set(section, key, value)
 
+        self._option_changed(option)
         self._dirty = True
 
         if save:
@@ -170,17 +184,29 @@ class SettingsManager(RawConfigParser):
         :param default: a default value to use as fallback
         :returns: the option value or *default*
         """
-        splitvals = option.split('/')
-        section, key = "/".join(splitvals[:-1]), splitvals[-1]
-
-        try:
-            value = self.get(section, key)
-            value = self._str_to_val(value)
-        except NoSectionError:
-            value = default
-        except NoOptionError:
-            value = default
+        value = self._cache.get(option, _UNCACHED)
+        if value is _UNCACHED:
+            generation = self._cache_generation
+            splitvals = option.split('/')
+            section, key = "/".join(splitvals[:-1]), splitvals[-1]
 
+            try:
+                value = self.get(section, key)
+                value = self._str_to_val(value)
+            except NoSectionError:
+                value = _MISSING
+            except NoOptionError:
+                value = _MISSING
+
+            # don't cache a value that changed while it was parsed
+            if generation == self._cache_generation:
+                self._cache[option] = value
+
+        if value is _MISSING:
+            return default
+        if isinstance(value, (list, dict)):
+            # the caller may modify it
+            return copy.deepcopy(value)
         return value
 
     def has_option(self, option):
@@ -210,6 +236,7 @@ class SettingsManager(RawConfigParser):
         section, key = "/".join(splitvals[:-1]), splitvals[-1]
 
         RawConfigParser.remove_option(self, section, key)
+        self._option_changed(option)
 
     def _set_direct(self, option, value):
         """
@@ -230,8 +257,27 @@ class SettingsManager(RawConfigParser):
             self.add_section(section)
             self.set(section, key, value)
 
+        self._option_changed(option)
         event.log_event('option_set', self, option)
 
+    def _option_changed(self, option):
+        """
+        Drops the cached value of an option and updates its LiveOptions
+        """
+        self._cache_generation += 1
+        # option keys are case insensitive
+        option = option.lower()
+        for cached in list(self._cache):
+            if cached.lower() == option:
+                self._cache.pop(cached, None)
+
+        for live in list(self._live_options.get(option, ())):
+            live.value = self.get_option(live.option, live.default)
+
+    def _add_live_option(self, live):
+        options = self._live_options.setdefault(live.option.lower(), weakref.WeakSet())
+        options.add(live)
+
     def _val_to_str(self, value):
         """
         Turns a value of some type into a string so it
@@ -327,6 +373,31 @@ class SettingsManager(RawConfigParser):
         self._dirty = False
 
 
+class LiveOption:
+    """
+    Holds the current value of an option in its value attribute, which is
+    updated whenever the option is set or removed. Hot code can read it
+    instead of calling get_option every time.
+
+    The value must not be modified.
+
+    :param option: the full path to an option
+    :param default: the value to use if the option doesn't exist
+    :param manager: the :class:`SettingsManager`, by default the one of
+        the application
+    """
+
+    __slots__ = ['option', 'default', 'value', '__weakref__']
+
+    def __init__(self, option: str, default: Any = None, manager=None):
+        if manager is None:
+            manager = MANAGER
+        self.option = option
+        self.default = default
+        self.value = manager.get_option(option, default)
+        manager._add_live_option(self)
+
+
 location = xdg.get_config_dir()
 
 
@@ -31,7 +31,7 @@
 Provides the base for creating and managing Track objects.
 """
 
-from xl.trax.track import Track
+from xl.trax.track import Track, batch_tags_changed
 from xl.trax.trackdb import TrackDB
 from xl.trax.search import (
     SearchResultTrack,
@@ -41,6 +41,7 @@ from xl.trax.search import (
     TracksInList,
     TracksNotInList,
     match_track_from_string,
+    is_search_refinement,
 )
 from xl.trax.util import (
     is_valid_track,
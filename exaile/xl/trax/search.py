@@ -24,9 +24,13 @@
 # do so. If you do not wish to do so, delete this exception statement
 # from your version.
 
+from collections import OrderedDict
+from collections.abc import KeysView
 import re
+import threading
 from typing import Collection
 
+from xl.trax.track import Track
 from xl.unicode import shave_marks
 
 __all__ = ['TracksMatcher', 'search_tracks']
@@ -46,6 +50,14 @@ class SearchResultTrack:
         self.on_tags = []
 
 
+def _lower(value):
+    return value.lower()
+
+
+def _keep_case(value):
+    return value
+
+
 class _Matcher:
     """
     Base class for match conditions
@@ -60,17 +72,30 @@ class _Matcher:
         self.content = content
         self.lower = lower
 
+    def candidates(self, index):
+        """
+        Returns the locations of all tracks that may match, according to
+        the given :class:`xl.trax.trackdb.SearchIndex`, or None if this
+        matcher cannot narrow down the tracks.
+        """
+        return None
+
     def match(self, srtrack):
-        vals = srtrack.track.get_tag_search(self.tag, format=False)
-        if vals == '__null__':
-            vals = None
-        if not isinstance(vals, list):
-            vals = [vals]
+        track = srtrack.track
+        if isinstance(track, Track) and (
+            self.lower is _lower or self.lower is _keep_case
+        ):
+            # the track caches its normalized values between searches
+            vals = track.get_tag_search_values(self.tag, self.lower is _lower)
+        else:
+            vals = track.get_tag_search(self.tag, format=False)
+            if vals == '__null__':
+                vals = None
+            if not isinstance(vals, list):
+                vals = [vals]
+            vals = [item if item is None else self.lower(item) for item in vals]
 
         for item in vals:
-            if item is not None:
-                item = self.lower(item)
-
             if self._matches(item):
                 return True
         return False
@@ -84,6 +109,11 @@ class _ExactMatcher(_Matcher):
     Condition for exact matches
     """
 
+    def candidates(self, index):
+        if self.content is None:
+            return None
+        return index.get_equal(self.tag, self.content)
+
     def _matches(self, value):
         if self.tag.startswith("__"):
             try:
@@ -104,6 +134,9 @@ class _InMatcher(_Matcher):
     Condition for inexact (ie. containing) matches
     """
 
+    def candidates(self, index):
+        return index.get_containing(self.tag, self.content)
+
     def _matches(self, value):
         if not value:
             return False
@@ -173,6 +206,9 @@ class _NotMetaMatcher:
     def __init__(self, matcher):
         self.matcher = matcher
 
+    def candidates(self, index):
+        return None
+
     def match(self, srtrack):
         return not self.matcher.match(srtrack)
 
@@ -188,6 +224,9 @@ class _OrMetaMatcher:
     def __init__(self, left, right):
         self.left, self.right = left, right
 
+    def candidates(self, index):
+        return _union_candidates([self.left, self.right], index)
+
     def match(self, srtrack):
         return self.left.match(srtrack) or self.right.match(srtrack)
 
@@ -203,6 +242,9 @@ class _MultiMetaMatcher:
     def __init__(self, matchers):
         self.matchers = matchers
 
+    def candidates(self, index):
+        return _intersect_candidates(self.matchers, index)
+
     def match(self, srtrack):
         for ma in self.matchers:
             if not ma.match(srtrack):
@@ -226,18 +268,205 @@ class _ManyMultiMetaMatcher:
         self.matchers = matchers
         self.tags = set()
 
+    def candidates(self, index):
+        return _union_candidates(self.matchers, index)
+
     def match(self, srtrack):
-        self.tags = set()
-        matched = False
+        self.tags = self.matched_tags(srtrack)
+        return bool(self.tags)
+
+    def matched_tags(self, srtrack):
+        """
+        Returns the set of tags that matched, without storing it on the
+        matcher. Compiled matchers are shared between TracksMatcher
+        instances, so this is what TracksMatcher.match uses.
+        """
+        tags = set()
         for ma in self.matchers:
-            if ma.match(srtrack):
+            if isinstance(ma, _ManyMultiMetaMatcher):
+                tags.update(ma.matched_tags(srtrack))
+            elif ma.match(srtrack):
                 if ma.tag:
-                    matched = True
-                    self.tags.add(ma.tag)
+                    tags.add(ma.tag)
                 elif hasattr(ma, 'tags') and ma.tags:
-                    matched = True
-                    self.tags.update(ma.tags)
-        return matched
+                    tags.update(ma.tags)
+        return tags
+
+
+def _get_candidates(matcher, index):
+    try:
+        candidates = matcher.candidates
+    except AttributeError:  # e.g. matchers added by plugins
+        return None
+    return candidates(index)
+
+
+def _intersect_candidates(matchers, index):
+    result = None
+    for ma in matchers:
+        candidates = _get_candidates(ma, index)
+        if candidates is None:
+            continue
+        if result is None:
+            result = candidates
+        else:
+            result &= candidates
+        if not result:
+            break
+    return result
+
+
+def _union_candidates(matchers, index):
+    result = set()
+    for ma in matchers:
+        candidates = _get_candidates(ma, index)
+        if candidates is None:
+            return None
+        result |= candidates
+    return result
+
+
+# Rough relative cost of evaluating each kind of matcher on a track.
+# Cheap matchers go first so that AND-ed conditions reject tracks as
+# early as possible. These are static: the compiled matchers are cached
+# and shared between searches of different TrackDBs, so the order can't
+# depend on the tracks of one of them. With a SearchIndex, the selective
+# equality and substring conditions already narrow down the tracks before
+# any matcher runs, see search_tracks.
+_MATCHER_COSTS = {
+    _ExactMatcher: 1,
+    _InMatcher: 2,
+    _GtMatcher: 3,
+    _LtMatcher: 3,
+    _RegexMatcher: 5,
+}
+
+
+def _matcher_cost(matcher):
+    """
+    Estimates how expensive a matcher is to evaluate
+    """
+    cost = _MATCHER_COSTS.get(type(matcher))
+    if cost is not None:
+        return cost
+    if isinstance(matcher, _NotMetaMatcher):
+        # a negated condition rejects few tracks, run it late
+        return _matcher_cost(matcher.matcher) + 1
+    if isinstance(matcher, _OrMetaMatcher):
+        return _matcher_cost(matcher.left) + _matcher_cost(matcher.right)
+    if isinstance(matcher, (_MultiMetaMatcher, _ManyMultiMetaMatcher)):
+        return sum(_matcher_cost(ma) for ma in matcher.matchers) or 1
+    return 10
+
+
+def _order_matchers(matchers):
+    """
+    Sorts a list of AND-ed matchers in place, cheapest first according to
+    _MATCHER_COSTS, and does the same for nested AND conditions. The sort
+    is stable, so matchers of equal cost keep the order chosen by the
+    tokenizer.
+    """
+    for ma in matchers:
+        _order_nested_matchers(ma)
+    matchers.sort(key=_matcher_cost)
+
+
+def _order_nested_matchers(matcher):
+    """
+    Sorts the AND conditions nested in a matcher, see _order_matchers
+    """
+    if isinstance(matcher, _MultiMetaMatcher):
+        _order_matchers(matcher.matchers)
+    elif isinstance(matcher, _NotMetaMatcher):
+        _order_nested_matchers(matcher.matcher)
+    elif isinstance(matcher, _OrMetaMatcher):
+        _order_nested_matchers(matcher.left)
+        _order_nested_matchers(matcher.right)
+    elif isinstance(matcher, _ManyMultiMetaMatcher):
+        for ma in matcher.matchers:
+            _order_nested_matchers(ma)
+
+
+class MatcherPlanCache:
+    """
+    Thread-safe LRU cache of compiled matchers, keyed by
+    (search string, case sensitivity, keyword tags)
+
+    :param limit: maximum number of compiled queries to keep
+    """
+
+    def __init__(self, limit=256):
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the compiled matchers for key, or None
+        """
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._plans.move_to_end(key)
+            return plan
+
+    def put(self, key, plan):
+        """
+        Stores the compiled matchers for key, evicting the least
+        recently used entries when over the limit
+        """
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.limit:
+                self._plans.popitem(last=False)
+
+    def clear(self):
+        """
+        Drops all compiled matchers and resets the counters
+        """
+        with self._lock:
+            self._plans.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def hit_rate(self):
+        """
+        The fraction of lookups that were answered from the cache
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get_stats(self):
+        """
+        :returns: a dict with the hits, misses, hit_rate and size of
+            the cache
+        """
+        with self._lock:
+            size = len(self._plans)
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+            'size': size,
+        }
+
+
+_plan_cache = MatcherPlanCache()
+
+
+def get_plan_cache_stats():
+    """
+    Returns the counters of the compiled search query cache, see
+    :meth:`MatcherPlanCache.get_stats`
+    """
+    return _plan_cache.get_stats()
 
 
 class TracksMatcher:
@@ -246,7 +475,7 @@ class TracksMatcher:
     a given track matches those criteria.
     """
 
-    __slots__ = ['matchers', 'case_sensitive', 'keyword_tags']
+    __slots__ = ['matchers', '_ends', 'case_sensitive', 'keyword_tags']
 
     def __init__(self, search_string, case_sensitive=True, keyword_tags=None):
         """
@@ -258,25 +487,83 @@ class TracksMatcher:
         """
         self.case_sensitive = case_sensitive
         self.keyword_tags = keyword_tags or []
+        key = (search_string, bool(case_sensitive), tuple(self.keyword_tags))
+        compiled = _plan_cache.get(key)
+        if compiled is None:
+            compiled = self.__compile(search_string)
+            _plan_cache.put(key, compiled)
+        # the compiled matchers are shared, but the list is ours to modify
+        matchers, ends = compiled
+        self.matchers = list(matchers)
+        # the first and last matchers in the order of the query, which
+        # prepend_matcher and append_matcher combine with
+        self._ends = list(ends)
+
+    def __compile(self, search_string):
+        """
+        Turns a search string into a tuple of matchers ordered for
+        evaluation, and a tuple of the first and last matchers in the
+        order of the query
+        """
         search_string = shave_marks(search_string)
         tokens = self.__tokenize_query(search_string)
         tokens = self.__red(tokens)
         tokens = self.__optimize_tokens(tokens)
-        self.matchers = self.__tokens_to_matchers(tokens)
+        matchers = self.__tokens_to_matchers(tokens)
+        ends = (matchers[0], matchers[-1]) if matchers else (None, None)
+        _order_matchers(matchers)
+        return tuple(matchers), ends
+
+    def candidates(self, index):
+        """
+        Returns the locations of all tracks that may match, according to
+        the given :class:`xl.trax.trackdb.SearchIndex`, or None if all
+        tracks need to be checked.
+        """
+        return _intersect_candidates(self.matchers, index)
 
     def append_matcher(self, matcher, or_match=False):
         '''Here so you can use playlist matchers. Probably needs better impl'''
         if not or_match or len(self.matchers) == 0:
+            if not self.matchers:
+                self._ends[0] = matcher
             self.matchers.append(matcher)
         else:
-            self.matchers[-1] = _OrMetaMatcher(self.matchers[-1], matcher)
+            index = self.__end_index(1, -1)
+            matcher = _OrMetaMatcher(self.matchers[index], matcher)
+            if self._ends[0] is self.matchers[index]:
+                self._ends[0] = matcher
+            self.matchers[index] = matcher
+        self._ends[1] = matcher
 
     def prepend_matcher(self, matcher, or_match=False):
         '''Here so you can use playlist matchers. Probably needs better impl'''
         if not or_match or len(self.matchers) == 0:
+            if not self.matchers:
+                self._ends[1] = matcher
             self.matchers.insert(0, matcher)
         else:
-            self.matchers[0] = _OrMetaMatcher(matcher, self.matchers[0])
+            index = self.__end_index(0, 0)
+            matcher = _OrMetaMatcher(matcher, self.matchers[index])
+            if self._ends[1] is self.matchers[index]:
+                self._ends[1] = matcher
+            self.matchers[index] = matcher
+        self._ends[0] = matcher
+
+    def __end_index(self, end, default):
+        """
+        Returns the index in self.matchers of the first (end 0) or last
+        (end 1) matcher in the order of the query. The matchers are
+        ordered for evaluation, so that is not necessarily the first or
+        last one of the list.
+
+        :param default: the index to use if the matcher is not in the
+            list, because the list was replaced
+        """
+        for index, ma in enumerate(self.matchers):
+            if ma is self._ends[end]:
+                return index
+        return default
 
     def match(self, srtrack):
         """
@@ -284,6 +571,14 @@ class TracksMatcher:
         Track object matches this search condition.
         """
         for ma in self.matchers:
+            if isinstance(ma, _ManyMultiMetaMatcher):
+                tags = ma.matched_tags(srtrack)
+                if not tags:
+                    break
+                for t in tags:
+                    if t not in srtrack.on_tags:
+                        srtrack.on_tags.append(t)
+                continue
             if not ma.match(srtrack):
                 break
             if ma.tag is not None:
@@ -339,9 +634,9 @@ class TracksMatcher:
         # normal token
         else:
             if not self.case_sensitive:
-                lower = lambda x: x.lower()
+                lower = _lower
             else:
-                lower = lambda x: x
+                lower = _keep_case
 
             # TODO: this stuff is kinda repetitive, can we consolidate
             # it? Maybe move some of this into the matcher classes?
@@ -499,13 +794,18 @@ class TracksMatcher:
 class TracksInList:
     """
     Matches tracks contained in a list/dict/set. Copies the list.
+
+    Dict key views, such as :meth:`xl.playlist.Playlist.get_unique_tracks`,
+    are used without copying.
     """
 
     __slots__ = ['_tracks']
     tag = None
 
     def __init__(self, tracks):
-        if isinstance(tracks, dict):
+        if isinstance(tracks, KeysView):
+            self._tracks = tracks
+        elif isinstance(tracks, dict):
             self._tracks = set(tracks.keys())
         else:
             self._tracks = {t for t in tracks}
@@ -523,13 +823,43 @@ class TracksNotInList(TracksInList):
         return track.track not in self._tracks
 
 
-def search_tracks(trackiter, trackmatchers: Collection[TracksMatcher]):
+def search_tracks(trackiter, trackmatchers: Collection[TracksMatcher], index=None):
     """
     Search a set of tracks for those that match specified conditions.
 
     :param trackiter: An iterable object returning Track objects
     :param trackmatchers: A list of TrackMatcher objects
-    """
+    :param index: A :class:`xl.trax.trackdb.SearchIndex` used to skip
+        tracks that cannot match. All tracks in trackiter must be part of
+        the TrackDB of the index. Defaults to the index of trackiter, if
+        it is a TrackDB that has one.
+    """
+    if index is None:
+        index = getattr(trackiter, 'search_index', None)
+
+    candidates = None
+    if index is not None:
+        candidates = _intersect_candidates(trackmatchers, index)
+
+    if candidates is not None:
+        if getattr(trackiter, 'search_index', None) is index:
+            # Searching the TrackDB itself, only create the candidates, in
+            # the order of the TrackDB
+            trackiter = (
+                holder._track
+                for loc, holder in list(trackiter.tracks.items())
+                if loc in candidates
+            )
+        else:
+            trackiter = (
+                srtr
+                for srtr in trackiter
+                if (
+                    srtr.track if isinstance(srtr, SearchResultTrack) else srtr
+                ).get_loc_for_io()
+                in candidates
+            )
+
     for srtr in trackiter:
         if not isinstance(srtr, SearchResultTrack):
             srtr = SearchResultTrack(srtr)
@@ -538,7 +868,7 @@ def search_tracks(trackiter, trackmatchers: Collection[TracksMatcher]):
 
 
 def search_tracks_from_string(
-    trackiter, search_string, case_sensitive=True, keyword_tags=None
+    trackiter, search_string, case_sensitive=True, keyword_tags=None, index=None
 ):
     """
     Convenience wrapper around search_tracks that builds matchers
@@ -552,7 +882,7 @@ def search_tracks_from_string(
             search_string, case_sensitive=case_sensitive, keyword_tags=keyword_tags
         )
     ]
-    return search_tracks(trackiter, matchers)
+    return search_tracks(trackiter, matchers, index=index)
 
 
 def match_track_from_string(
@@ -562,3 +892,29 @@ def match_track_from_string(
         search_string, case_sensitive=case_sensitive, keyword_tags=keyword_tags
     )
     return matcher.match(SearchResultTrack(track))
+
+
+def is_search_refinement(old_string, new_string, case_sensitive=True):
+    """
+    Checks whether every track matching new_string also matches
+    old_string, so that the results of old_string can be searched for
+    new_string instead of all the tracks.
+
+    Only searches made of plain keywords are recognized: new_string
+    refines old_string when each keyword of old_string is part of a
+    keyword of new_string. Both searches must use the same keyword
+    tags.
+
+    :param case_sensitive: whether both searches are case-sensitive
+    """
+    old_words = shave_marks(old_string).split()
+    new_words = shave_marks(new_string).split()
+    if not old_words:
+        return False
+    for word in old_words + new_words:
+        if any(c in word for c in '\\"|!()=<>~'):
+            return False
+    if not case_sensitive:
+        old_words = [word.lower() for word in old_words]
+        new_words = [word.lower() for word in new_words]
+    return all(any(old in new for new in new_words) for old in old_words)
@@ -0,0 +1,173 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+#
+# The developers of the Exaile media player hereby grant permission
+# for non-GPL compatible GStreamer and Exaile plugins to be used and
+# distributed together with GStreamer and Exaile. This permission is
+# above and beyond the permissions granted by the GPL license by which
+# Exaile is covered. If you modify this code, you may extend this
+# exception to your version of the code, but you are not obligated to
+# do so. If you do not wish to do so, delete this exception statement
+# from your version.
+
+"""
+SQLite storage for :class:`xl.trax.TrackDB`
+"""
+
+import logging
+import os
+import pickle
+import sqlite3
+from typing import Any, Dict, Iterable, Iterator, Set, Tuple
+
+from xl import common
+
+logger = logging.getLogger(__name__)
+
+SQLITE_EXTENSION = os.extsep + 'sqlite'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value BLOB
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    key INTEGER PRIMARY KEY,
+    loc TEXT,
+    attrs BLOB
+);
+CREATE TABLE IF NOT EXISTS tags (
+    track INTEGER NOT NULL REFERENCES tracks (key) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    value BLOB,
+    PRIMARY KEY (track, tag)
+) WITHOUT ROWID;
+'''
+
+# (key, tags, attrs) of a TrackHolder
+TrackRecord = Tuple[int, Dict[str, Any], Dict[str, Any]]
+
+
+def is_sqlite_location(location: str) -> bool:
+    """
+    Returns whether a TrackDB at the given location is stored with
+    :class:`SQLiteTrackStore` rather than in a shelf
+    """
+    return location.endswith(SQLITE_EXTENSION)
+
+
+def _dumps(value):
+    return pickle.dumps(value, protocol=common.PICKLE_PROTOCOL)
+
+
+class SQLiteTrackStore:
+    """
+    Stores the tracks of a TrackDB in an SQLite database, one row per
+    track and one row per tag, so that only the tracks that changed
+    have to be written when saving.
+
+    The database uses write-ahead logging, so a save does not block
+    readers and an interrupted save leaves the previous state intact.
+
+    :param path: the file to store the database in
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        try:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('PRAGMA foreign_keys=ON')
+            with self._conn:
+                self._conn.executescript(_SCHEMA)
+        except Exception:
+            self._conn.close()
+            raise
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def get_meta(self) -> Dict[str, Any]:
+        """
+        :returns: the stored TrackDB attributes, by name
+        """
+        return {
+            name: pickle.loads(value)
+            for name, value in self._conn.execute('SELECT name, value FROM meta')
+        }
+
+    def get_keys(self) -> Set[int]:
+        """
+        :returns: the keys of all stored tracks
+        """
+        return {key for (key,) in self._conn.execute('SELECT key FROM tracks')}
+
+    def iter_tracks(self) -> Iterator[TrackRecord]:
+        """
+        Yields all stored tracks, ordered by key
+        """
+        tags_cursor = self._conn.execute(
+            'SELECT track, tag, value FROM tags ORDER BY track'
+        )
+        pending = next(tags_cursor, None)
+        for key, attrs in self._conn.execute(
+            'SELECT key, attrs FROM tracks ORDER BY key'
+        ):
+            tags = {}
+            # skip tags of tracks that don't exist (foreign keys were off)
+            while pending is not None and pending[0] < key:
+                pending = next(tags_cursor, None)
+            while pending is not None and pending[0] == key:
+                tags[pending[1]] = pickle.loads(pending[2])
+                pending = next(tags_cursor, None)
+            yield key, tags, pickle.loads(attrs)
+
+    def save(
+        self,
+        meta: Dict[str, Any],
+        tracks: Iterable[TrackRecord],
+        deleted_keys: Iterable[int],
+    ) -> int:
+        """
+        Writes the given attributes and tracks, and removes deleted
+        tracks, in a single transaction.
+
+        :param meta: TrackDB attributes to store, by name
+        :param tracks: the tracks to add or replace
+        :param deleted_keys: the keys of tracks to remove
+        :returns: the number of tracks written
+        """
+        count = 0
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)',
+                ((name, _dumps(value)) for name, value in meta.items()),
+            )
+            self._conn.executemany(
+                'DELETE FROM tracks WHERE key = ?', ((key,) for key in deleted_keys)
+            )
+            for key, tags, attrs in tracks:
+                # replacing the row deletes its tags through the foreign key
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO tracks (key, loc, attrs) VALUES (?, ?, ?)',
+                    (key, tags.get('__loc'), _dumps(attrs)),
+                )
+                self._conn.executemany(
+                    'INSERT INTO tags (track, tag, value) VALUES (?, ?, ?)',
+                    ((key, tag, _dumps(value)) for tag, value in tags.items()),
+                )
+                count += 1
+        return count
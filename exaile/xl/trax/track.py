@@ -25,10 +25,13 @@
 # do so. If you do not wish to do so, delete this exception statement
 # from your version.
 
-from copy import deepcopy
+from collections import OrderedDict
+import contextlib
 import logging
 import operator
 import re
+import sys
+import threading
 import time
 from typing import Dict, Generic, List, Optional, TypeVar, Union
 import unicodedata
@@ -77,6 +80,173 @@ _no_set_raw = {'__basename', '__loc'} | disk_tags
 
 _unset = object()
 
+# Maximum number of (tag, case) entries kept in the search value cache of
+# a single track. Searches rarely touch more than a handful of tags.
+_SEARCH_CACHE_MAX_ENTRIES = 16
+
+# Maximum number of tracks with a search value cache. Beyond it, the
+# caches of the tracks that got theirs first are dropped, which bounds
+# the memory of all the caches together, whatever the size of the
+# collection.
+_SEARCH_CACHE_MAX_TRACKS = 250000
+
+# id -> weak reference of the tracks with a search value cache, in the
+# order they got it, oldest first
+_search_cached_tracks: 'OrderedDict[int, weakref.ref]' = OrderedDict()
+
+
+def _add_search_cached_track(track: 'Track') -> None:
+    """
+    Records that track got a new search value cache, and drops the caches
+    of the tracks that got theirs longest ago if there are too many
+    """
+    key = id(track)
+    ref = _search_cached_tracks.get(key)
+    if ref is None or ref() is not track:
+        ref = weakref.ref(
+            track, lambda ref, key=key: _forget_search_cached_track(key, ref)
+        )
+        _search_cached_tracks[key] = ref
+    _search_cached_tracks.move_to_end(key)
+    while len(_search_cached_tracks) > _SEARCH_CACHE_MAX_TRACKS:
+        oldest = _search_cached_tracks.popitem(last=False)[1]()
+        if oldest is not None:
+            oldest._search_values = None
+
+
+def _forget_search_cached_track(key: int, ref: weakref.ref) -> None:
+    # the track is gone, unless a newer track has its id already
+    if _search_cached_tracks.get(key) is ref:
+        _search_cached_tracks.pop(key, None)
+
+
+# Values of these tags are (nearly) unique per track, so they are not
+# worth interning. Neither are long strings.
+_unique_tags = {'__loc', 'title', 'lyrics', 'comment'}
+_INTERN_MAX_LENGTH = 256
+
+
+def _intern(value):
+    if type(value) is str and len(value) <= _INTERN_MAX_LENGTH:
+        return sys.intern(value)
+    return value
+
+
+def _compact_values(tag, values):
+    """
+    Interns the strings of a tag value, so that values shared by many
+    tracks (artists, albums, genres, __basedir...) are only stored once
+    """
+    if isinstance(values, list):
+        if tag in _unique_tags:
+            return list(values)
+        return [_intern(v) for v in values]
+    if tag in _unique_tags:
+        return values
+    return _intern(values)
+
+
+# Tag changes collected by batch_tags_changed in the current thread
+_tag_change_batch = threading.local()
+
+# Objects told about every tag change right away, even inside a batch,
+# see Track._add_tag_watcher
+_tag_watchers = weakref.WeakSet()
+
+# A batch sends the changes collected so far once it has this many
+# changed tracks, or this many seconds passed since it last sent them, so
+# that listeners like the collection panel don't lag far behind
+_BATCH_MAX_TRACKS = 1000
+_BATCH_MAX_DELAY = 1.0
+
+# Held while the Track for a uri is looked up or registered, and by
+# lazily loaded TrackDBs while they create a track, so that other threads
+# wait for that track instead of creating a second one for the same uri
+_new_track_lock = threading.RLock()
+
+
+@contextlib.contextmanager
+def batch_tags_changed():
+    """
+    Collects the tag changes made by the current thread while the context
+    is active, and sends them in a single ``tracks_tags_changed`` event
+    when it exits, instead of one event per changed track. Contexts may
+    be nested, the event is sent when the outermost one exits. Long
+    batches also send the changes collected so far every 1000 changed
+    tracks or every second.
+
+    Use this when changing the tags of many tracks at once::
+
+        with batch_tags_changed():
+            for track in tracks:
+                track.set_tags(genre='Jazz')
+
+    The data of ``tracks_tags_changed`` events is a dict mapping each
+    changed :class:`Track` to the set of its changed tags, the object
+    is the :class:`Track` class. Batched changes are not sent in
+    per-track ``track_tags_changed`` events.
+    """
+    if getattr(_tag_change_batch, 'changes', None) is not None:
+        yield
+        return
+    _tag_change_batch.changes = {}
+    _tag_change_batch.sent = time.monotonic()
+    try:
+        yield
+    finally:
+        changes = _tag_change_batch.changes
+        _tag_change_batch.changes = None
+        if changes:
+            event.log_event('tracks_tags_changed', Track, changes)
+
+
+class _MergedTagChanges(dict):
+    """
+    Data of a tracks_tags_changed event that was merged while waiting for
+    the UI thread, it isn't shared with any other event
+    """
+
+
+def _merge_tag_changes(old: Dict['Track', set], new: Dict['Track', set]):
+    if type(old) is not _MergedTagChanges:
+        old = _MergedTagChanges((track, set(tags)) for track, tags in old.items())
+    for track, tags in new.items():
+        try:
+            old[track].update(tags)
+        except KeyError:
+            old[track] = set(tags)
+    return old
+
+
+event.coalesce_ui_events('tracks_tags_changed', _merge_tag_changes)
+event.coalesce_ui_events('track_tags_changed', operator.or_)
+
+
+def _notify_tags_changed(track: 'Track', tags: set) -> None:
+    for watcher in list(_tag_watchers):
+        watcher._on_track_tags_changed(track, tags)
+
+    changes = getattr(_tag_change_batch, 'changes', None)
+    if changes is None:
+        event.log_event('tracks_tags_changed', Track, {track: tags})
+        # for listeners that don't handle the batched event
+        if event.has_callbacks('track_tags_changed'):
+            event.log_event('track_tags_changed', track, tags)
+        return
+
+    try:
+        changes[track].update(tags)
+    except KeyError:
+        changes[track] = set(tags)
+    now = time.monotonic()
+    if (
+        len(changes) >= _BATCH_MAX_TRACKS
+        or now - _tag_change_batch.sent >= _BATCH_MAX_DELAY
+    ):
+        _tag_change_batch.changes = {}
+        _tag_change_batch.sent = now
+        event.log_event('tracks_tags_changed', Track, changes)
+
 
 class _MetadataCacher(Generic[_K, _V]):
     """Time- and size-limited LRU cache"""
@@ -162,12 +332,22 @@ class Track:
         "__weakref__",
         "_init",
         "_is_supported",
+        "_search_values",
+        "_sort_keys",
     ]
     # this is used to enforce the one-track-per-uri rule
     __tracksdict = weakref.WeakValueDictionary()
+    # TrackDBs holding tracks that are only created when needed. They
+    # are asked for a uri before a new Track is created for it.
+    __lazy_sources = weakref.WeakSet()
+    # tracks whose tags changed since they were last saved, see _set_dirty
+    __dirty_tracks = weakref.WeakSet()
+    __dirty_lock = threading.Lock()
     # store a copy of the settings values here - much faster (0.25 cpu
     # seconds) (see _the_cuts_cb)
     __the_cuts = settings.get_option('collection/strip_list', [])
+    # bumped whenever cached sort keys of all tracks become invalid
+    __sort_generation = 0
 
     def __new__(cls, *args, **kwargs):
         """
@@ -203,35 +383,41 @@ class Track:
 
         if uri is not None:
             uri = Gio.File.new_for_uri(uri).get_uri()
-            try:
-                tr = cls.__tracksdict[uri]
-                tr._init = False
-
-                # if the track *does* happen to be pickled in more than one
-                # place, then we need to preserve any internal tags that aren't
-                # persisted to disk.
-                #
-                # See https://bugs.launchpad.net/exaile/+bug/1054637
-                if unpickles is None:
-                    if len(args) > 2:
-                        unpickles = args[2]
-                    else:
-                        unpickles = kwargs.get("_unpickles")
-
-                if unpickles is not None:
-                    tags = tr.list_tags()
-                    to_set = {
-                        tag: values
-                        for tag, values in unpickles.items()
-                        if tag.startswith('__') and tag not in tags
-                    }
-                    if to_set:
-                        tr.set_tags(**to_set)
+            with _new_track_lock:
+                tr = cls.__tracksdict.get(uri)
+                if tr is None:
+                    for source in list(cls.__lazy_sources):
+                        tr = source._get_lazy_track(uri)
+                        if tr is not None:
+                            break
+                if tr is None:
+                    tr = object.__new__(cls)
+                    cls.__tracksdict[uri] = tr
+                    tr._init = True
+                    return tr
+            tr._init = False
+
+            # if the track *does* happen to be pickled in more than one
+            # place, then we need to preserve any internal tags that aren't
+            # persisted to disk.
+            #
+            # See https://bugs.launchpad.net/exaile/+bug/1054637
+            if unpickles is None:
+                if len(args) > 2:
+                    unpickles = args[2]
+                else:
+                    unpickles = kwargs.get("_unpickles")
+
+            if unpickles is not None:
+                tags = tr.list_tags()
+                to_set = {
+                    tag: values
+                    for tag, values in unpickles.items()
+                    if tag.startswith('__') and tag not in tags
+                }
+                if to_set:
+                    tr.set_tags(**to_set)
 
-            except KeyError:
-                tr = object.__new__(cls)
-                cls.__tracksdict[uri] = tr
-                tr._init = True
             return tr
         else:
             # this should always fail in __init__, and will never be
@@ -255,6 +441,8 @@ class Track:
             return
 
         self.__tags = {}
+        self._search_values = None
+        self._sort_keys = None
         self._scan_valid = None  # whether our last tag read attempt worked
         self._is_supported = None
 
@@ -299,9 +487,11 @@ class Track:
         self.__unregister()
         gloc = Gio.File.new_for_commandline_arg(loc)
         self.__tags['__loc'] = gloc.get_uri()
+        self._search_values = None
+        self._sort_keys = None
         self.__register()
         if notify_changed:
-            event.log_event('track_tags_changed', self, {'__loc'})
+            _notify_tags_changed(self, {'__loc'})
 
     def exists(self):
         """
@@ -386,33 +576,57 @@ class Track:
             logger.exception("Unknown exception: Could not write tags to file")
             return False
 
-    def read_tags(self, force=True, notify_changed=True):
+    def read_tags(self, force=True, notify_changed=True, mtime=None):
         """
         Reads tags from the file for this Track.
 
         :param force: If not True, then only read the tags if the file has
                       be modified.
+        :param mtime: The modification time of the file as unix timestamp,
+                      if already known. Saves querying it from the file.
 
-        Returns False if unsuccessful, and a Format object from
-        `xl.metadata` otherwise.
+        Returns False if unsuccessful, True if the file was not modified
+        and thus not read, and a Format object from `xl.metadata` otherwise.
+        """
+        return self._apply_disk_tags(
+            self._fetch_disk_tags(force, mtime), notify_changed
+        )
+
+    def _fetch_disk_tags(self, force=True, mtime=None):
+        """
+        Reads the tags of the file for this Track without modifying the
+        Track, so that the (slow) file parsing can run on a worker thread.
+        Pass the result to _apply_disk_tags.
+
+        :param force: If not True, then only read the tags if the file has
+                      be modified.
+        :param mtime: The modification time of the file, if already known.
+
+        :returns: a tuple (format, tags). format is False if unsuccessful,
+            True if the file was not modified; tags is None if nothing
+            needs to be updated.
         """
+        # __modified is only stored after a successful read, so an
+        # unmodified file needs neither a stat nor to be parsed again
+        if not force and not self._is_modified(mtime):
+            return True, None
 
         if not self.is_supported():
-            self._scan_valid = False
-            return False
+            return False, None
 
         loc = self.get_loc_for_io()
         try:
             # Retrieve file specific metadata
             gloc = Gio.File.new_for_uri(loc)
-            mtime = (
-                gloc.query_info("time::modified", Gio.FileQueryInfoFlags.NONE, None)
-                .get_modification_date_time()
-                .to_unix()
-            )
+            if mtime is None:
+                mtime = (
+                    gloc.query_info("time::modified", Gio.FileQueryInfoFlags.NONE, None)
+                    .get_modification_date_time()
+                    .to_unix()
+                )
+                if not force and not self._is_modified(mtime):
+                    return True, None
             f = metadata.get_format(loc)
-            if not force and self.__tags.get('__modified', 0) >= mtime:
-                return f
 
             # Read the tags
             ntags = f.read_all()
@@ -443,15 +657,50 @@ class Track:
             for tag in to_del:
                 ntags[tag] = None
 
-            self.set_tags(notify_changed=notify_changed, **ntags)
+            return f, ntags
+        except Exception:
+            logger.exception("Error reading tags for %s", loc)
+            return False, None
 
-            self._scan_valid = True
+    def _is_modified(self, mtime):
+        """
+        Whether the file has been modified since the tags were last read.
+
+        :param mtime: the current modification time of the file, None if
+            unknown
+        """
+        if mtime is None or '__modified' not in self.__tags:
+            return True
+        return self.__tags['__modified'] < mtime
+
+    def _apply_disk_tags(self, fetched, notify_changed=True):
+        """
+        Applies the result of _fetch_disk_tags to this Track.
+
+        Returns False if unsuccessful, True if the file was not modified
+        and thus not read, and a Format object from `xl.metadata` otherwise.
+        """
+        f, ntags = fetched
+        if f is False:
+            self._scan_valid = False
+            return False
+
+        if ntags is None:
+            if f is True and self._is_supported is None:
+                # The file was read successfully before and is unchanged
+                self._is_supported = True
             return f
+
+        try:
+            self.set_tags(notify_changed=notify_changed, **ntags)
         except Exception:
             self._scan_valid = False
-            logger.exception("Error reading tags for %s", loc)
+            logger.exception("Error reading tags for %s", self.get_loc_for_io())
             return False
 
+        self._scan_valid = True
+        return f
+
     def is_local(self):
         """
         Determines whether a file is accessible on the local filesystem.
@@ -500,8 +749,11 @@ class Track:
         returns a data repr of the track suitable for pickling
 
         internal use only please
+
+        Tag values are never modified in place, set_tags replaces them,
+        so a shallow copy is a snapshot that later changes don't affect.
         """
-        return deepcopy(self.__tags)
+        return dict(self.__tags)
 
     def _unpickles(self, pickle_obj):
         """
@@ -509,7 +761,14 @@ class Track:
 
         internal use only please
         """
-        self.__tags = deepcopy(pickle_obj)
+        # _compact_values copies lists, so we don't share them with
+        # pickle_obj
+        self.__tags = {
+            _intern(tag): _compact_values(tag, values)
+            for tag, values in pickle_obj.items()
+        }
+        self._search_values = None
+        self._sort_keys = None
 
     def list_tags(self):
         """
@@ -535,7 +794,7 @@ class Track:
             values = [v for v in values if v not in (None, '')]
 
         if values:
-            return values
+            return _compact_values(tag, values)
 
         return None
 
@@ -600,12 +859,16 @@ class Track:
             new_value = self._xform_set_values(tag, values)
             if self.__tags.get(tag, _unset) != new_value:
                 changed.add(tag)
-                self.__tags[tag] = new_value
+                self.__tags[_intern(tag)] = new_value
 
         if changed:
-            self._dirty = True
+            self._set_dirty(True)
+            # derived search values (albumartist, __bitrate...) may depend
+            # on any tag, so drop all of them
+            self._search_values = None
+            self._sort_keys = None
             if notify_changed:
-                event.log_event("track_tags_changed", self, changed)
+                _notify_tags_changed(self, changed)
 
         return changed
 
@@ -653,7 +916,30 @@ class Track:
             tag=="albumartist".
         :param extend_title: If the title tag is unknown, try to
             add some identifying information to it.
-        """
+
+        Joined values are cached until the tags of the track or the
+        ``collection/strip_list`` option change.
+        """
+        # __rating depends on the rating/maximum option, and unjoined
+        # values are lists the caller might modify
+        if not join or tag == '__rating':
+            return self.__get_tag_sort(tag, join, artist_compilations)
+
+        generation = Track.__sort_generation
+        # Attach the cache before computing the value, so that a
+        # concurrent set_tags always discards what we compute here
+        cache = self._sort_keys
+        if cache is None or cache[0] != generation:
+            cache = self._sort_keys = (generation, {})
+        key = (tag, artist_compilations)
+        try:
+            return cache[1][key]
+        except KeyError:
+            pass
+        value = cache[1][key] = self.__get_tag_sort(tag, join, artist_compilations)
+        return value
+
+    def __get_tag_sort(self, tag, join, artist_compilations):
         # The two magic values here are to ensure that compilations
         # and unknown values are always sorted below all normal
         # values.
@@ -797,37 +1083,17 @@ class Track:
         :returns: unicode string that is used for searching
         """
         extraformat = ""
-        if tag == "albumartist":
-            if artist_compilations and self.__tags.get('__compilation'):
-                value = self.__tags.get('albumartist', None)
-                tag = 'albumartist'
-                extraformat += " ! __compilation==__null__"
-            else:
-                value = self.__tags.get('albumartist')
-                if value is None:
-                    value = self.__tags.get('artist')
-        elif tag in ('tracknumber', 'discnumber'):
-            value = self.split_numerical(self.__tags.get(tag))[0]
-        elif tag in (
-            '__length',
-            '__playcount',
-            '__rating',
-            '__startoffset',
-            '__stopoffset',
+        if (
+            tag == "albumartist"
+            and artist_compilations
+            and self.__tags.get('__compilation')
         ):
-            value = self.__tags.get(tag, 0)
-        elif tag == '__bitrate':
-            try:
-                value = int(self.__tags['__bitrate']) // 1000
-                if value != -1:
-                    # TRANSLATORS: Bitrate (k here is short for kbps).
-                    value = [_("%dk") % value, self.__tags['__bitrate']]
-            except (KeyError, ValueError):
-                value = -1
+            value = self.__tags.get('albumartist', None)
+            extraformat += " ! __compilation==__null__"
         elif tag == '__basename':
             value = self.get_basename_display()
         else:
-            value = self.__tags.get(tag)
+            value = self._get_search_value(self.__tags, tag)
 
         # Quote arguments
         if value is None:
@@ -857,6 +1123,96 @@ class Track:
 
         return value
 
+    @staticmethod
+    def _get_search_value(tags, tag):
+        """
+        Internal API, returns the unquoted and unshaved value of a tag for
+        get_tag_search, out of a dict of tags as returned by _pickles.
+        Doesn't handle __basename.
+        """
+        if tag == "albumartist":
+            value = tags.get('albumartist')
+            if value is None:
+                value = tags.get('artist')
+        elif tag in ('tracknumber', 'discnumber'):
+            value = Track.split_numerical(tags.get(tag))[0]
+        elif tag in (
+            '__length',
+            '__playcount',
+            '__rating',
+            '__startoffset',
+            '__stopoffset',
+        ):
+            value = tags.get(tag, 0)
+        elif tag == '__bitrate':
+            try:
+                value = int(tags['__bitrate']) // 1000
+                if value != -1:
+                    # TRANSLATORS: Bitrate (k here is short for kbps).
+                    value = [_("%dk") % value, tags['__bitrate']]
+            except (KeyError, ValueError):
+                value = -1
+        else:
+            value = tags.get(tag)
+        return value
+
+    @staticmethod
+    def _get_tag_search_from_pickles(tags, tag):
+        """
+        Internal API, returns what get_tag_search(tag, format=False)
+        returns for the track whose tags are given as returned by
+        _pickles, without creating that track. Doesn't handle __basename.
+        """
+        value = Track._get_search_value(tags, tag)
+        if value is None:
+            value = '__null__'
+        if isinstance(value, list):
+            return [shave_marks(v) for v in value]
+        return shave_marks(value)
+
+    def get_tag_search_values(self, tag, lower=False):
+        """
+        Get the values of a tag as compared by the search matchers: the
+        values of :meth:`get_tag_search` with format=False, which shaves
+        the marks off them like TracksMatcher does off the query, with
+        None for an unset tag, optionally lower-cased.
+
+        The result is cached until the tags of the track change, or the
+        caches of too many other tracks were made since.
+
+        :param tag: The name of the tag to get
+        :param lower: If True, lower-case the values
+
+        :returns: tuple of values
+        """
+        key = (tag, lower)
+        # Attach the cache before computing the values, so that a
+        # concurrent set_tags always discards what we compute here
+        cache = self._search_values
+        if cache is None:
+            cache = self._search_values = {}
+            _add_search_cached_track(self)
+        else:
+            try:
+                return cache[key]
+            except KeyError:
+                pass
+
+        vals = self.get_tag_search(tag, format=False)
+        if vals == '__null__':
+            vals = (None,)
+        elif isinstance(vals, list):
+            vals = tuple(vals)
+        else:
+            vals = (vals,)
+        if lower:
+            vals = tuple(v if v is None else v.lower() for v in vals)
+
+        if len(cache) >= _SEARCH_CACHE_MAX_ENTRIES:
+            cache.clear()
+        cache[key] = vals
+        return vals
+
     def _get_format_obj(self):
         f = _CACHER.get(self)
         if not f:
@@ -1105,6 +1461,7 @@ class Track:
         """
         if data == "collection/strip_list":
             cls._Track__the_cuts = settings.get_option('collection/strip_list', [])
+            cls._Track__sort_generation += 1
 
     ### Utility method intended for TrackDB ###
 
@@ -1113,6 +1470,49 @@ class Track:
         '''Internal API, returns number of track objects we have'''
         return len(cls._Track__tracksdict)
 
+    @classmethod
+    def _add_lazy_source(cls, source):
+        '''
+        Internal API, registers an object whose _get_lazy_track(uri)
+        method returns the Track for uri if it has one that hasn't been
+        created yet, and None otherwise
+        '''
+        cls._Track__lazy_sources.add(source)
+
+    @classmethod
+    def _add_tag_watcher(cls, watcher):
+        '''
+        Internal API, registers an object whose
+        _on_track_tags_changed(track, tags) method is called whenever the
+        tags of a track change, before the change is sent as an event.
+        Unlike the event, this isn't delayed by batch_tags_changed.
+        '''
+        _tag_watchers.add(watcher)
+
+    @classmethod
+    def _remove_tag_watcher(cls, watcher):
+        '''Internal API, unregisters an object added by _add_tag_watcher'''
+        _tag_watchers.discard(watcher)
+
+    @classmethod
+    def _get_dirty_tracks(cls):
+        '''Internal API, returns a list of the tracks that need to be saved'''
+        with cls._Track__dirty_lock:
+            return list(cls._Track__dirty_tracks)
+
+    def _set_dirty(self, dirty):
+        '''
+        Internal API, marks the track as (not) needing to be saved. A
+        TrackDB marks its tracks clean before taking their pickles, so
+        that changes made while it saves are kept for the next save.
+        '''
+        with Track._Track__dirty_lock:
+            self._dirty = dirty
+            if dirty:
+                Track._Track__dirty_tracks.add(self)
+            else:
+                Track._Track__dirty_tracks.discard(self)
+
     def _write_rating_to_disk(self):
         if not settings.get_option(
             'collection/write_rating_to_audio_file_metadata', False
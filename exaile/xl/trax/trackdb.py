@@ -25,24 +25,93 @@
 # from your version.
 
 
-from copy import deepcopy
 import logging
+import threading
 from time import time
-from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import weakref
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from xl import common, event
 from xl.nls import gettext as _
-from xl.trax.track import Track
+from xl.trax import sqlitedb
+from xl.trax.track import Track, _new_track_lock
 
 logger = logging.getLogger(__name__)
 
 
+# Number of tracks taken at a time while holding the lock of a TrackDB
+# that is being saved
+SAVE_BATCH_SIZE = 500
+
+
 class TrackHolder:
     def __init__(self, track, key, **kwargs):
-        self._track = track
+        self.__track = track
+        self.__tags = None
         self._key = key
         self._attrs = kwargs
 
+    @classmethod
+    def lazy(cls, tags, key, **kwargs) -> 'TrackHolder':
+        """
+        Creates a holder for a track that is only created from tags, as
+        returned by Track._pickles, the first time it is accessed.
+        """
+        holder = cls(None, key, **kwargs)
+        holder.__tags = tags
+        return holder
+
+    @property
+    def _track(self) -> Track:
+        track = self.__track
+        if track is None:
+            # other threads wait here while the track is being created,
+            # and in Track() until it is registered for its uri
+            with _new_track_lock:
+                track = self.__track
+                tags = self.__tags
+                if track is None and tags is not None:
+                    # Creating the Track asks the lazy TrackDBs for its
+                    # uri first, this holder must not answer that
+                    self.__tags = None
+                    try:
+                        track = self.__track = Track(_unpickles=tags)
+                    except Exception:
+                        self.__tags = tags
+                        raise
+        return track
+
+    def _is_loaded(self) -> bool:
+        """
+        Returns whether the Track of this holder has been created
+        """
+        return self.__tags is None
+
+    def _is_dirty(self) -> bool:
+        """
+        Returns whether the track needs to be saved, without creating it
+        """
+        return self.__tags is None and self._track._dirty
+
+    def _get_pickles(self):
+        """
+        Returns the pickle-able state of the track, without creating it
+        """
+        tags = self.__tags
+        if tags is not None:
+            return tags
+        return self._track._pickles()
+
+    def _get_tag_search(self, tag: str):
+        """
+        Returns track.get_tag_search(tag, format=False), without creating
+        the track
+        """
+        tags = self.__tags
+        if tags is not None:
+            return Track._get_tag_search_from_pickles(tags, tag)
+        return self._track.get_tag_search(tag, format=False)
+
     def __getattr__(self, attr):
         return getattr(self._track, attr)
 
@@ -58,6 +127,159 @@ class TrackDBIterator:
         return next(self.iter)[1]._track
 
 
+class SearchIndex:
+    """
+    Inverted index of the search values of the tracks in a
+    :class:`TrackDB`, used by :func:`xl.trax.search_tracks` to narrow
+    down the tracks that need to be checked by a search.
+
+    For every indexed tag, this maps each distinct lower-cased value of
+    :meth:`Track.get_tag_search` to the locations of the tracks having
+    that value. Tags are indexed the first time they are searched for.
+
+    The index is kept up to date by its TrackDB.
+    """
+
+    def __init__(self, trackdb: 'TrackDB'):
+        self._trackdb = trackdb
+        self._lock = threading.RLock()
+        # tag -> normalized value -> locations
+        self._values: Dict[str, Dict[object, Set[str]]] = {}
+        # tag -> location -> normalized values
+        self._track_values: Dict[str, Dict[str, Tuple]] = {}
+
+    @staticmethod
+    def _normalize(values) -> Tuple:
+        if values is None or values == '__null__':
+            return ()
+        if not isinstance(values, list):
+            values = [values]
+        return tuple({v.lower() if isinstance(v, str) else v for v in values})
+
+    def _add(self, tag: str, loc: str, search_value) -> None:
+        self._remove(tag, loc)
+        values = self._normalize(search_value)
+        if not values:
+            return
+        self._track_values[tag][loc] = values
+        tag_values = self._values[tag]
+        for value in values:
+            try:
+                tag_values[value].add(loc)
+            except KeyError:
+                tag_values[value] = {loc}
+
+    def _remove(self, tag: str, loc: str) -> None:
+        values = self._track_values[tag].pop(loc, ())
+        tag_values = self._values[tag]
+        for value in values:
+            locs = tag_values[value]
+            locs.discard(loc)
+            if not locs:
+                del tag_values[value]
+
+    def _get_tag_values(self, tag: str) -> Dict[object, Set[str]]:
+        try:
+            return self._values[tag]
+        except KeyError:
+            pass
+        self._values[tag] = {}
+        self._track_values[tag] = {}
+        # lazily loaded tracks are indexed without creating them
+        for loc, holder in list(self._trackdb.tracks.items()):
+            self._add(tag, loc, holder._get_tag_search(tag))
+        return self._values[tag]
+
+    def add_tracks(self, tracks: Iterable[Tuple[str, Track]]) -> None:
+        """
+        Adds or updates tracks in all indexed tags
+
+        :param tracks: tuples (location, track)
+        """
+        with self._lock:
+            for loc, track in tracks:
+                for tag in self._values:
+                    self._add(tag, loc, track.get_tag_search(tag, format=False))
+
+    def remove_tracks(self, locs: Iterable[str]) -> None:
+        """
+        Removes tracks from all indexed tags
+        """
+        with self._lock:
+            for loc in locs:
+                for tag in self._values:
+                    self._remove(tag, loc)
+
+    def clear(self) -> None:
+        """
+        Drops all indexed tags, they will be rebuilt when needed
+        """
+        with self._lock:
+            self._values = {}
+            self._track_values = {}
+
+    def get_equal(self, tag: str, content: str) -> Optional[Set[str]]:
+        """
+        Returns the locations of all tracks which have a value of tag
+        equal to content, ignoring case. None if tag isn't indexable.
+        """
+        if tag.startswith('__') or not isinstance(content, str):
+            return None
+        with self._lock:
+            return set(self._get_tag_values(tag).get(content.lower(), ()))
+
+    def get_containing(self, tag: str, content: str) -> Optional[Set[str]]:
+        """
+        Returns the locations of all tracks which have a value of tag
+        containing content, ignoring case. None if tag isn't indexable.
+        """
+        if tag.startswith('__') or not isinstance(content, str) or not content:
+            return None
+        content = content.lower()
+        locs = set()
+        with self._lock:
+            for value, value_locs in self._get_tag_values(tag).items():
+                if isinstance(value, str) and content in value:
+                    locs.update(value_locs)
+        return locs
+
+
+class _PendingSave:
+    """
+    What a save of a :class:`TrackDB` writes, see TrackDB._take_changes
+    """
+
+    def __init__(self, holders, meta, deleted_keys, unsaved_locs):
+        self.holders: List[TrackHolder] = holders
+        self.meta = meta
+        self.deleted_keys: List[int] = deleted_keys
+        self.unsaved_locs: Set[str] = unsaved_locs
+        self.was_dirty = False
+        # tracks marked clean while taking their pickles
+        self.cleaned: List[Track] = []
+
+
+def _run_writer(db_ref, save_requested: threading.Event) -> None:
+    """
+    Saves the TrackDB referenced by db_ref whenever a save is requested,
+    until the TrackDB is garbage collected
+    """
+    while True:
+        if not save_requested.wait(60):
+            if db_ref() is None:
+                return
+            continue
+        save_requested.clear()
+        db = db_ref()
+        if db is None:
+            return
+        try:
+            db.save_to_location()
+        except Exception:
+            logger.exception("Failed to save %s DB in the background.", db.name)
+        del db
+
+
 class TrackDB:
     """
     Manages a track database.
@@ -67,7 +289,9 @@ class TrackDB:
 
     :param name:   The name of this :class:`TrackDB`.
     :param location:   Path to a file where this :class:`TrackDB`
-            should be stored.
+            should be stored. Locations ending in ``.sqlite`` are
+            stored with :class:`xl.trax.sqlitedb.SQLiteTrackStore`,
+            anything else in a shelf.
     :param pickle_attrs:   A list of attributes to store in the
             pickled representation of this object. All
             attributes listed must be built-in types, with
@@ -76,6 +300,10 @@ class TrackDB:
             of :class:`Track` objects.
     :param load_first: Set to True if this collection should be
             loaded before any tracks are created.
+    :param lazy: Set to True to create the Track objects of a loaded
+            database only when they are accessed, eg. by iteration,
+            get_track_by_loc or a search hit. Creating a Track for the
+            uri of such a track anywhere else also returns it.
     """
 
     def __init__(
@@ -84,6 +312,7 @@ class TrackDB:
         location: str = "",
         pickle_attrs: List[str] = [],
         loadfirst: bool = False,
+        lazy: bool = False,
     ):
         """
         Sets up the trackDB.
@@ -107,10 +336,29 @@ class TrackDB:
         self.pickle_attrs = pickle_attrs
         self.pickle_attrs += ['tracks', 'name', '_key']
         self._saving = False
+        self._save_lock = threading.RLock()
+        self._save_requested = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._save_stats = {
+            'saves': 0,
+            'tracks_written': 0,
+            'last_duration': 0.0,
+            'max_duration': 0.0,
+            'total_duration': 0.0,
+        }
+        # the location tracks were last loaded from or saved to, saves to
+        # it only write what changed since
+        self._saved_location: Optional[str] = None
         self._key = 0
         self._dbversion = 2.0
         self._dbminorversion = 0
         self._deleted_keys = []
+        # tracks added since the last save
+        self._unsaved_locs: Set[str] = set()
+        self.search_index: Optional[SearchIndex] = None
+        self.lazy = lazy
+        if lazy:
+            Track._add_lazy_source(self)
         if location:
             self.load_from_location()
             self._timeout_save()
@@ -132,14 +380,75 @@ class TrackDB:
         """
         return len(self.tracks)
 
+    def _get_lazy_track(self, loc: str) -> Optional[Track]:
+        """
+        Internal API for Track, returns the track at loc if it has not
+        been created yet
+        """
+        holder = self.tracks.get(loc)
+        if holder is None or holder._is_loaded():
+            return None
+        return holder._track
+
     @common.glib_wait_seconds(300)
     def _timeout_save(self):
         """
-        Callback for auto-saving.
+        Callback for auto-saving, the save runs in a background thread
+        so the main loop isn't blocked.
         """
-        self.save_to_location()
+        self.save_in_background()
         return True
 
+    @common.synchronized
+    def save_in_background(self) -> None:
+        """
+        Makes a background thread call :meth:`save_to_location`. Requests
+        made while it is saving are coalesced into a single save.
+        """
+        if self._writer is None:
+            self._writer = threading.Thread(
+                target=_run_writer,
+                args=(weakref.ref(self), self._save_requested),
+                name="%s DB writer" % (self.name or "TrackDB"),
+                daemon=True,
+            )
+            self._writer.start()
+        self._save_requested.set()
+
+    def enable_search_index(self) -> None:
+        """
+        Makes this :class:`TrackDB` maintain a :class:`SearchIndex`,
+        available as the search_index attribute, which speeds up
+        searches over the tracks of this database.
+        """
+        if self.search_index is not None:
+            return
+        self.search_index = SearchIndex(self)
+        Track._add_tag_watcher(self)
+
+    def disable_search_index(self) -> None:
+        """
+        Drops the :class:`SearchIndex` of this :class:`TrackDB`
+        """
+        if self.search_index is None:
+            return
+        Track._remove_tag_watcher(self)
+        self.search_index = None
+
+    def _on_track_tags_changed(self, track: Track, tags: Set[str]) -> None:
+        """
+        Internal API for Track, updates the search index as soon as the
+        tags of a track change, so searches made while tags are changed in
+        a batch (see :func:`xl.trax.batch_tags_changed`) don't miss it
+        """
+        index = self.search_index
+        if index is None:
+            return
+        loc = track.get_loc_for_io()
+        holder = self.tracks.get(loc)
+        if holder is not None and holder._is_loaded() and holder._track is track:
+            index.add_tracks([(loc, track)])
+
     def set_name(self, name: str) -> None:
         """
         Sets the name of this :class:`TrackDB`
@@ -183,6 +492,19 @@ class TrackDB:
 
         logger.debug("Loading %s DB from %s.", self.name, location)
 
+        if sqlitedb.is_sqlite_location(location):
+            self._load_from_sqlite(location)
+        else:
+            self._load_from_shelf(location)
+
+        if self.search_index is not None:
+            self.search_index.clear()
+
+        self._dirty = False
+        self._unsaved_locs.clear()
+        self._saved_location = location
+
+    def _load_from_shelf(self, location: str) -> None:
         pdata = common.open_shelf(location)
 
         if "_dbversion" in pdata:
@@ -205,10 +527,15 @@ class TrackDB:
                     data = {}
                     for k in (x for x in pdata.keys() if x.startswith("tracks-")):
                         p = pdata[k]
-                        tr = Track(_unpickles=p[0])
-                        loc = tr.get_loc_for_io()
+                        if self.lazy:
+                            loc = p[0]['__loc']
+                            holder = TrackHolder.lazy(p[0], p[1], **p[2])
+                        else:
+                            tr = Track(_unpickles=p[0])
+                            loc = tr.get_loc_for_io()
+                            holder = TrackHolder(tr, p[1], **p[2])
                         if loc not in data:
-                            data[loc] = TrackHolder(tr, p[1], **p[2])
+                            data[loc] = holder
                         else:
                             logger.warning("Duplicate track found: %s", loc)
                             # presumably the second track was written because of an error,
@@ -224,73 +551,221 @@ class TrackDB:
 
         pdata.close()
 
-        self._dirty = False
+    def _load_from_sqlite(self, location: str) -> None:
+        store = sqlitedb.SQLiteTrackStore(location)
+        try:
+            meta = store.get_meta()
+            if int(meta.get('_dbversion', self._dbversion)) > int(self._dbversion):
+                raise common.VersionError("DB was created on a newer Exaile version.")
+
+            for attr in self.pickle_attrs:
+                try:
+                    if 'tracks' == attr:
+                        data = {}
+                        for key, tags, attrs in store.iter_tracks():
+                            if self.lazy:
+                                loc = tags['__loc']
+                                holder = TrackHolder.lazy(tags, key, **attrs)
+                            else:
+                                tr = Track(_unpickles=tags)
+                                loc = tr.get_loc_for_io()
+                                holder = TrackHolder(tr, key, **attrs)
+                            if loc not in data:
+                                data[loc] = holder
+                            else:
+                                logger.warning("Duplicate track found: %s", loc)
+                                self._deleted_keys.append(key)
+                        self.tracks = data
+                    else:
+                        setattr(self, attr, meta.get(attr, getattr(self, attr)))
+                except Exception:
+                    logger.exception("Exception occurred while loading %s", location)
+        finally:
+            store.close()
 
-    @common.synchronized
     def save_to_location(self, location: Optional[str] = None):
         """
         Saves a pickled representation of this :class:`TrackDB` to the
         specified location.
 
+        When saving to the location the database was last loaded from or
+        saved to, only the tracks that were added or changed since then
+        are written. If a save is running in another thread, this waits
+        for it to finish first, so calling it on shutdown flushes all
+        changes.
+
         :param location: the location to save the data to
         """
-        if not self._dirty:
-            for track in self.tracks.values():
-                if track._track._dirty:
-                    self._dirty = True
-                    break
-
-        if not self._dirty:
-            return
-
         if not location:
             location = self.location
-        if not location:
-            raise AttributeError(_("You did not specify a location to save the db"))
 
-        if self._saving:
-            return
-        self._saving = True
+        with self._save_lock:
+            # the lock is re-entrant, don't save again from within a save
+            if self._saving:
+                return
+            changes = self._take_changes(location)
+            if changes is None:
+                return
+            if not location:
+                self._restore_changes(changes)
+                raise AttributeError(_("You did not specify a location to save the db"))
+
+            logger.debug("Saving %s DB to %s.", self.name, location)
+            self._saving = True
+            start = time()
+            try:
+                if sqlitedb.is_sqlite_location(location):
+                    count = self._save_to_sqlite(location, changes)
+                else:
+                    count = self._save_to_shelf(location, changes)
+            except Exception:
+                logger.exception("Failed to save %s DB to %s.", self.name, location)
+                self._restore_changes(changes)
+                return
+            finally:
+                self._saving = False
+            self._commit_changes(location, changes)
+            self._update_save_stats(time() - start, count)
+
+    @common.synchronized
+    def _take_changes(
+        self, location: Optional[str], full: bool = False
+    ) -> Optional['_PendingSave']:
+        """
+        Collects what a save to location has to write, and marks this
+        database as saved.
+
+        :param full: write all tracks, even if nothing changed
+        :returns: the changes, or None if there is nothing to save
+        """
+        changed = {}
+        for track in Track._get_dirty_tracks():
+            holder = self.tracks.get(track.get_loc_for_io())
+            if holder is not None and holder._is_loaded() and holder._track is track:
+                changed[holder._key] = holder
+        for loc in self._unsaved_locs:
+            holder = self.tracks.get(loc)
+            if holder is not None:
+                changed[holder._key] = holder
+
+        if not (full or changed or self._dirty or self._deleted_keys):
+            return None
 
-        logger.debug("Saving %s DB to %s.", self.name, location)
+        if full or location != self._saved_location:
+            holders = list(self.tracks.values())
+        else:
+            holders = list(changed.values())
+        meta = {attr: getattr(self, attr) for attr in self.pickle_attrs}
+        del meta['tracks']
+        meta['_dbversion'] = self._dbversion
+
+        changes = _PendingSave(
+            holders, meta, list(self._deleted_keys), set(self._unsaved_locs)
+        )
+        changes.was_dirty = self._dirty
+        self._dirty = False
+        return changes
 
+    @common.synchronized
+    def _get_records(
+        self, changes: '_PendingSave', start: int
+    ) -> List[sqlitedb.TrackRecord]:
+        """
+        Returns the (key, tags, attrs) records of the next batch of
+        holders to save, starting at index start
+        """
+        records = []
+        for holder in changes.holders[start : start + SAVE_BATCH_SIZE]:
+            if holder._is_loaded():
+                track = holder._track
+                track._set_dirty(False)
+                changes.cleaned.append(track)
+            records.append((holder._key, holder._get_pickles(), holder._attrs))
+        return records
+
+    def _iter_records(self, changes: '_PendingSave') -> Iterator[sqlitedb.TrackRecord]:
+        """
+        Yields the records to save. They are taken in batches, so that
+        other threads can use the database while it is being written.
+        """
+        for start in range(0, len(changes.holders), SAVE_BATCH_SIZE):
+            yield from self._get_records(changes, start)
+
+    @common.synchronized
+    def _commit_changes(self, location: str, changes: '_PendingSave') -> None:
+        del self._deleted_keys[: len(changes.deleted_keys)]
+        self._unsaved_locs -= changes.unsaved_locs
+        self._saved_location = location
+
+    @common.synchronized
+    def _restore_changes(self, changes: '_PendingSave') -> None:
+        if changes.was_dirty:
+            self._dirty = True
+        for track in changes.cleaned:
+            track._set_dirty(True)
+
+    def _update_save_stats(self, duration: float, count: int) -> None:
+        stats = self._save_stats
+        stats['saves'] += 1
+        stats['tracks_written'] += count
+        stats['last_duration'] = duration
+        stats['max_duration'] = max(stats['max_duration'], duration)
+        stats['total_duration'] += duration
+        logger.debug(
+            "Wrote %d tracks of %s DB in %.3f seconds.", count, self.name, duration
+        )
+
+    def get_save_stats(self) -> Dict[str, float]:
+        """
+        :returns: a dict with the number of saves, the number of tracks
+            written and the last, maximum and total duration of the
+            saves in seconds
+        """
+        return dict(self._save_stats)
+
+    def _save_to_shelf(self, location: str, changes: '_PendingSave') -> int:
+        pdata = common.open_shelf(location)
         try:
-            pdata = common.open_shelf(location)
             if pdata.get('_dbversion', self._dbversion) > self._dbversion:
                 raise common.VersionError("DB was created on a newer Exaile.")
-        except Exception:
-            logger.exception("Failed to open music DB for writing.")
-            return
-
-        for attr in self.pickle_attrs:
-            # bad hack to allow saving of lists/dicts of Tracks
-            if 'tracks' == attr:
-                for k, track in self.tracks.items():
-                    key = "tracks-%s" % track._key
-                    if track._track._dirty or key not in pdata:
-                        pdata[key] = (
-                            track._track._pickles(),
-                            track._key,
-                            deepcopy(track._attrs),
-                        )
-            else:
-                pdata[attr] = deepcopy(getattr(self, attr))
-
-        pdata['_dbversion'] = self._dbversion
-
-        for key in self._deleted_keys:
-            key = "tracks-%s" % key
-            if key in pdata:
-                del pdata[key]
-
-        pdata.sync()
-        pdata.close()
 
-        for track in self.tracks.values():
-            track._track._dirty = False
-
-        self._dirty = False
-        self._saving = False
+            # Values are pickled as soon as they are assigned to the shelf,
+            # so they don't need to be copied
+            count = 0
+            for key, tags, attrs in self._iter_records(changes):
+                pdata["tracks-%s" % key] = (tags, key, attrs)
+                count += 1
+            for attr, value in changes.meta.items():
+                pdata[attr] = value
+
+            for key in changes.deleted_keys:
+                key = "tracks-%s" % key
+                if key in pdata:
+                    del pdata[key]
+
+            pdata.sync()
+        finally:
+            pdata.close()
+        return count
+
+    def _save_to_sqlite(
+        self, location: str, changes: Optional['_PendingSave'] = None
+    ) -> int:
+        """
+        Writes the changes, by default all tracks, in a single transaction.
+        """
+        if changes is None:
+            changes = self._take_changes(location, full=True)
+        store = sqlitedb.SQLiteTrackStore(location)
+        try:
+            meta = store.get_meta()
+            if meta.get('_dbversion', self._dbversion) > self._dbversion:
+                raise common.VersionError("DB was created on a newer Exaile.")
+            return store.save(
+                changes.meta, self._iter_records(changes), changes.deleted_keys
+            )
+        finally:
+            store.close()
 
     def get_track_by_loc(self, loc: str) -> Optional[Track]:
         """
@@ -342,9 +817,14 @@ class TrackDB:
                 continue
             locations += [location]
             self.tracks[location] = TrackHolder(tr, self._key)
+            self._unsaved_locs.add(location)
             self._key += 1
 
         if locations:
+            if self.search_index is not None:
+                self.search_index.add_tracks(
+                    (loc, self.tracks[loc]._track) for loc in locations
+                )
             event.log_event('tracks_added', self, locations)
             self._dirty = True
 
@@ -367,8 +847,12 @@ class TrackDB:
             location = tr.get_loc_for_io()
             locations += [location]
             self._deleted_keys.append(self.tracks[location]._key)
+            self._unsaved_locs.discard(location)
             del self.tracks[location]
 
+        if self.search_index is not None:
+            self.search_index.remove_tracks(locations)
+
         event.log_event('tracks_removed', self, locations)
 
         self._dirty = True
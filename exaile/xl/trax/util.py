@@ -115,11 +115,53 @@ def sort_tracks(
     """
     if trackfunc is None:
         trackfunc = lambda tr: tr
-    keyfunc = lambda tr: [
-        trackfunc(tr).get_tag_sort(field, artist_compilations=artist_compilations)
-        for field in fields
-    ]
-    return sorted(items, key=keyfunc, reverse=reverse)
+    fields = list(fields)
+    items = list(items)
+    if len(items) < 2 or not fields:
+        return items
+
+    # Python's sort is stable, so sorting by each field in turn, least
+    # significant first, is the same as sorting by all of them at once.
+    # That lets us skip the trailing fields the items are already sorted
+    # by, which is the usual case when a column is clicked: the new
+    # column is prepended to the previous sort order.
+    tracks = [trackfunc(item) for item in items]
+    columns = {}
+
+    def get_column(field):
+        column = columns.get(field)
+        if column is None:
+            column = columns[field] = [
+                tr.get_tag_sort(field, artist_compilations=artist_compilations)
+                for tr in tracks
+            ]
+        return column
+
+    order = list(range(len(items)))
+    try:
+        todo = len(fields)
+        for start in range(1, len(fields)):
+            if _is_sorted([get_column(field) for field in fields[start:]], reverse):
+                todo = start
+                break
+        for field in reversed(fields[:todo]):
+            order.sort(key=get_column(field).__getitem__, reverse=reverse)
+    except TypeError:
+        # Values of different types (eg. a bpm of unknown format) only
+        # compare when all previous fields are equal; compare whole rows
+        rows = list(zip(*(get_column(field) for field in fields)))
+        order = sorted(range(len(items)), key=rows.__getitem__, reverse=reverse)
+    return [items[i] for i in order]
+
+
+def _is_sorted(columns, reverse=False):
+    """
+    Returns whether the rows of the given columns are in order
+    """
+    rows = list(zip(*columns))
+    if reverse:
+        return all(a >= b for a, b in zip(rows, rows[1:]))
+    return all(a <= b for a, b in zip(rows, rows[1:]))
 
 
 def sort_result_tracks(fields, trackiter, reverse=False, artist_compilations=False):
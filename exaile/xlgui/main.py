@@ -395,7 +395,7 @@ class MainWindow(GObject.GObject):
         event.add_ui_callback(
             self.on_toggle_pause, 'playback_toggle_pause', player.PLAYER
         )
-        event.add_ui_callback(self.on_track_tags_changed, 'track_tags_changed')
+        event.add_ui_callback(self.on_tracks_tags_changed, 'tracks_tags_changed')
         event.add_ui_callback(self.on_buffering, 'playback_buffering', player.PLAYER)
         event.add_ui_callback(self.on_playback_error, 'playback_error', player.PLAYER)
 
@@ -711,11 +711,11 @@ class MainWindow(GObject.GObject):
         percent = min(percent, 100)
         self.statusbar.set_status(_("Buffering: %d%%...") % percent, 1)
 
-    def on_track_tags_changed(self, type, track, tags):
+    def on_tracks_tags_changed(self, type, obj, changes):
         """
         Called when tags are changed
         """
-        if track is player.PLAYER.current:
+        if player.PLAYER.current in changes:
             self._update_track_information()
 
     def on_collection_tree_loaded(self, tree):
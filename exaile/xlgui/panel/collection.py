@@ -31,6 +31,7 @@ from gi.repository import GObject
 from gi.repository import Gtk
 import itertools
 import logging
+import time
 
 from xl.nls import gettext as _
 from xl import common, event, formatter, settings, trax
@@ -45,6 +46,15 @@ logger = logging.getLogger(__name__)
 # TODO: come up with a more customizable way to handle this
 SEARCH_TAGS = ("artist", "albumartist", "album", "title")
 
+_SYNC_ON_TAG_CHANGE = settings.LiveOption('gui/sync_on_tag_change', True)
+_DISPLAY_TRACK_COUNTS = settings.LiveOption('gui/display_track_counts', True)
+_DRAW_SEPARATORS = settings.LiveOption('gui/draw_separators', True)
+
+# seconds spent adding rows of a loaded tree per main loop iteration
+_ROWS_BUDGET = 0.01
+# tracks grouped by the loading thread between checks for a newer load
+_LOAD_BATCH = 1000
+
 
 def first_meaningful_char(s):
     # Keep explicit str() conversion in case we ever end up receiving
@@ -118,6 +128,9 @@ class Order:
     def format_track(self, level, track):
         return self.__formatters[level].format(track)
 
+    def format_tracks(self, level, tracks):
+        return self.__formatters[level].format_many(tracks)
+
 
 DEFAULT_ORDERS = [
     # fmt: off
@@ -160,6 +173,203 @@ DEFAULT_ORDERS = [
 ]
 
 
+class CollectionTreeNode:
+    """
+    A node of a :class:`CollectionTree`, holding the tracks that have the
+    same values for the tags of its level and those of its parents
+    """
+
+    __slots__ = [
+        'parent',
+        'key',
+        'depth',
+        'label',
+        'match_query',
+        'sort_key',
+        'children',
+        'tracks',
+        'expand',
+        '_sorted',
+    ]
+
+    def __init__(self, parent, key, depth, label, match_query, sort_key):
+        self.parent = parent
+        self.key = key
+        self.depth = depth
+        #: the text to display
+        self.label = label
+        #: search terms matching the tracks of this level
+        self.match_query = match_query
+        #: the sort values of the first track, used to order the nodes
+        self.sort_key = sort_key
+        #: the child nodes, by key
+        self.children = {}
+        #: the tracks below this node, in the order they were added
+        self.tracks = {}
+        #: whether the tracks matched a search on tags of the levels below
+        self.expand = False
+        self._sorted = None
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def get_children(self):
+        """
+        :returns: the child nodes, in display order
+        """
+        if self._sorted is None:
+            children = list(self.children.values())
+            try:
+                children.sort(key=lambda node: (node.sort_key, node.label))
+            except TypeError:
+                # sort values of different types, see trax.sort_tracks
+                children.sort(
+                    key=lambda node: ([str(v) for v in node.sort_key], node.label)
+                )
+            self._sorted = children
+        return self._sorted
+
+
+class CollectionTree:
+    """
+    The tracks of a collection grouped by the levels of an :class:`Order`,
+    so that the children of a node and the number of tracks below it can
+    be looked up without searching the collection.
+
+    The nodes whose tracks changed are collected until they are taken
+    with :meth:`take_changes`, so that a view of the tree can update
+    only those.
+
+    :param order: the :class:`Order` to group the tracks by
+    :param tracks: :class:`xl.trax.Track` or
+        :class:`xl.trax.SearchResultTrack` objects to add
+    """
+
+    def __init__(self, order, tracks=()):
+        self.order = order
+        self.root = CollectionTreeNode(None, None, -1, None, None, ())
+        # location: nodes of the track, from the top level down
+        self._paths = {}
+        self._sort_tags = [order.get_sort_tags(level) for level in range(len(order))]
+        # tags of the levels below each level
+        self._lower_tags = [
+            set(itertools.chain(*self._sort_tags[level + 1 :]))
+            for level in range(len(order))
+        ]
+        self._changes = set()
+        self.add_tracks(tracks)
+        self._changes.clear()
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __contains__(self, loc):
+        return loc in self._paths
+
+    def take_changes(self):
+        """
+        :returns: the nodes that tracks were added to or removed from
+            since the last call, including those that were removed
+            from the tree
+        """
+        changes = self._changes
+        self._changes = set()
+        return changes
+
+    def _get_sort_key(self, level, track):
+        return tuple(track.get_tag_sort(tag) for tag in self._sort_tags[level])
+
+    def add_tracks(self, tracks):
+        """
+        Adds tracks to the tree, or moves them to the nodes matching
+        their current tags if they were added before
+
+        :param tracks: :class:`xl.trax.Track` or
+            :class:`xl.trax.SearchResultTrack` objects
+        """
+        matched_tags = []
+        plain_tracks = []
+        for track in tracks:
+            if isinstance(track, trax.SearchResultTrack):
+                matched_tags.append(track.on_tags)
+                track = track.track
+            else:
+                matched_tags.append(())
+            plain_tracks.append(track)
+        tracks = plain_tracks
+        locs = [track.get_loc_for_io() for track in tracks]
+        self.remove_tracks([loc for loc in locs if loc in self._paths])
+
+        bottom = len(self.order) - 1
+        labels = [
+            self.order.format_tracks(level, tracks) for level in range(len(self.order))
+        ]
+
+        for idx, track in enumerate(tracks):
+            loc = locs[idx]
+            node = self.root
+            node.tracks[track] = None
+            path = []
+            for level, tags in enumerate(self._sort_tags):
+                label = labels[level][idx]
+                match_query = " ".join(
+                    [track.get_tag_search(tag, format=True) for tag in tags]
+                )
+                if level == bottom:
+                    match_query += " " + track.get_tag_search("__loc", format=True)
+                    key = loc
+                else:
+                    key = (match_query, label)
+                child = node.children.get(key)
+                if child is None:
+                    child = node.children[key] = CollectionTreeNode(
+                        node,
+                        key,
+                        level,
+                        label,
+                        match_query,
+                        self._get_sort_key(level, track),
+                    )
+                    node._sorted = None
+                child.tracks[track] = None
+                if not child.expand and any(
+                    tag in self._lower_tags[level] for tag in matched_tags[idx]
+                ):
+                    child.expand = True
+                path.append(child)
+                node = child
+            self._paths[loc] = path
+            self._changes.update(path)
+
+        if tracks:
+            self._changes.add(self.root)
+
+    def remove_tracks(self, locs):
+        """
+        Removes tracks from the tree, ignoring those that are not in it
+
+        :param locs: the locations of the tracks
+        """
+        for loc in locs:
+            path = self._paths.pop(loc, None)
+            if path is None:
+                continue
+            track = next(iter(path[-1].tracks))
+            del self.root.tracks[track]
+            self._changes.add(self.root)
+            self._changes.update(path)
+            for node in path:
+                del node.tracks[track]
+                if not node.tracks:
+                    del node.parent.children[node.key]
+                    node.parent._sorted = None
+                    continue
+                sort_key = self._get_sort_key(node.depth, next(iter(node.tracks)))
+                if sort_key != node.sort_key:
+                    node.sort_key = sort_key
+                    node.parent._sorted = None
+
+
 class CollectionPanel(panel.Panel):
     """
     The collection panel
@@ -209,8 +419,25 @@ class CollectionPanel(panel.Panel):
         self._setup_images()
         self._connect_events()
         self.order = None
-        self.tracks = []
         self.sorted_tracks = []
+        # the tree shown, of the tracks matching the keyword
+        self.collection_tree = None
+        # the tree of all tracks, kept up to date with the collection
+        self._full_tree = None
+        # the keyword collection_tree was searched with, and whether it
+        # still has all the tracks matching it
+        self._tree_keyword = ''
+        self._tree_complete = False
+        # CollectionTreeNode: Gtk.TreeIter of the rows in the model
+        self._node_rows = {}
+        self._resort_needed = False
+        # number of the latest load_tree call, and of the last one whose
+        # rows were all added, and when the latest one started
+        self._load_count = 0
+        self._loaded_count = 0
+        self._load_started = 0.0
+        # (tracks, removed_locs) of changes made while building a tree
+        self._pending_updates = []
 
         event.add_ui_callback(
             self._check_collection_empty, 'libraries_modified', collection
@@ -267,7 +494,7 @@ class CollectionPanel(panel.Panel):
             }
         )
         self.tree.connect('key-release-event', self.on_key_released)
-        event.add_ui_callback(self.refresh_tags_in_tree, 'track_tags_changed')
+        event.add_ui_callback(self.refresh_tags_in_tree, 'tracks_tags_changed')
         event.add_ui_callback(
             self.refresh_tracks_in_tree, 'tracks_added', self.collection
         )
@@ -424,7 +651,8 @@ class CollectionPanel(panel.Panel):
             (lambda m, i, d: m.get_value(i, 1) is None), None
         )
 
-        self.model = Gtk.TreeStore(GdkPixbuf.Pixbuf, str, object)
+        # icon, text, search terms of the node, CollectionTreeNode
+        self.model = Gtk.TreeStore(GdkPixbuf.Pixbuf, str, object, object)
 
         self.tree.connect("row-expanded", self.on_expanded)
 
@@ -432,11 +660,10 @@ class CollectionPanel(panel.Panel):
         """
         finds tracks matching a given iter.
         """
-        self.load_subtree(iter)
-        search = self.get_node_search_terms(iter)
-        matcher = trax.TracksMatcher(search)
-        srtrs = trax.search_tracks(self.tracks, [matcher])
-        return [x.track for x in srtrs]
+        node = self.model.get_value(iter, 3)
+        if node is None:
+            return []
+        return list(node.tracks)
 
     def append_to_playlist(self, item=None, event=None, replace=False):
         """
@@ -485,77 +712,442 @@ class CollectionPanel(panel.Panel):
 
         return " ".join(queries)
 
-    def refresh_tags_in_tree(self, type, track, tags):
-        if (
-            settings.get_option('gui/sync_on_tag_change', True)
-            and bool(tags & self.order.all_sort_tags())
+    def refresh_tags_in_tree(self, type, obj, changes):
+        tree_tags = self.order.all_sort_tags()
+        tree_tags.update(self.order.all_search_tags())
+        if self._tree_keyword:
+            # tracks may start or stop matching the keyword
+            tree_tags.update(self._get_keyword_tags(self.order))
+        tracks = [
+            track
+            for track, tags in changes.items()
+            if tags & tree_tags
             and self.collection.loc_is_member(track.get_loc_for_io())
-        ):
-            self._refresh_tags_in_tree()
+        ]
+        if not tracks:
+            return
+        if not _SYNC_ON_TAG_CHANGE.value:
+            # rebuilt with the new tags when the tree is next loaded
+            self._full_tree = None
+            self._tree_complete = False
+            return
+        self._update_trees(tracks, ())
+
+    def refresh_tracks_in_tree(self, type, obj, locs):
+        if type == 'tracks_added':
+            tracks = [self.collection.get_track_by_loc(loc) for loc in locs]
+            self._update_trees([track for track in tracks if track is not None], ())
+        else:
+            self._update_trees((), locs)
 
-    def refresh_tracks_in_tree(self, type, obj, loc):
+    def _update_trees(self, tracks, removed_locs):
+        """
+        Updates the trees after tracks were added or removed, or their
+        tags changed, and schedules updating the rows shown
+
+        :param tracks: the added or changed tracks
+        :param removed_locs: the locations of the removed tracks
+        """
+        if self.collection_tree is None:
+            # replayed on the tree being built
+            self._pending_updates.append((tracks, removed_locs))
+        if self._full_tree is not None:
+            self._full_tree.remove_tracks(removed_locs)
+            self._full_tree.add_tracks(tracks)
+
+        tree = self.collection_tree
+        if tree is not None and tree is not self._full_tree:
+            if self._tree_keyword:
+                changed = tracks
+                tracks = list(
+                    trax.search_tracks_from_string(
+                        changed,
+                        self._tree_keyword,
+                        case_sensitive=False,
+                        keyword_tags=self._get_keyword_tags(self.order),
+                        index=self.collection.search_index,
+                    )
+                )
+                matched = {srtr.track for srtr in tracks}
+                removed_locs = list(removed_locs)
+                removed_locs.extend(
+                    track.get_loc_for_io() for track in changed if track not in matched
+                )
+            tree.remove_tracks(removed_locs)
+            tree.add_tracks(tracks)
+
+        self._resort_needed = True
         self._refresh_tags_in_tree()
 
     @common.glib_wait(500)
     def _refresh_tags_in_tree(self):
         """
-        Callback for when tags have changed and the tree
-        needs reloading.
+        Callback for when tracks or their tags have changed and the
+        rows of the tree need updating.
         """
-        # Trying to reload while we're rescanning is really inefficient,
-        # so we delay it until we're done scanning.
-        if self.collection._scanning:
+        # Trying to update while we're rescanning is really inefficient,
+        # so we delay it until we're done scanning, and the rows of a
+        # newly loaded tree are all there.
+        if self.collection._scanning or self._loaded_count != self._load_count:
             return True
-        self.resort_tracks()
-        self.load_tree()
+        self._apply_tree_changes()
         return False
 
+    def _apply_tree_changes(self):
+        """
+        Updates the rows of the nodes that changed in the tree shown,
+        leaving the other rows, and which of them are expanded, alone
+        """
+        if self.collection_tree is None:
+            return
+        root = self.collection_tree.root
+        for node in sorted(self.collection_tree.take_changes(), key=lambda n: n.depth):
+            if node is root:
+                self._update_child_rows(None, node)
+                continue
+            # None if not loaded yet, or removed along with its parent
+            iter = self._node_rows.get(node)
+            if iter is None:
+                continue
+            label = self._get_node_row(self.collection_tree, node)[1]
+            if self.model.get_value(iter, 1) != label:
+                self.model.set_value(iter, 1, label)
+            child = self.model.iter_children(iter)
+            if child is not None and self.model.get_value(child, 3) is not None:
+                self._update_child_rows(iter, node)
+
+    def _update_child_rows(self, parent, node):
+        """
+        Makes the loaded child rows of a row match the children of its
+        node, inserting and removing only the rows that differ
+        """
+        children = node.get_children()
+        wanted = set(children)
+
+        rows = []
+        iter = self.model.iter_children(parent)
+        while iter is not None:
+            next_iter = self.model.iter_next(iter)
+            row_node = self.model.get_value(iter, 3)
+            # separators are added again below
+            if row_node is None or row_node not in wanted:
+                self._remove_node_row(iter)
+            else:
+                rows.append((iter, row_node))
+            iter = next_iter
+
+        idx = 0
+        for child in children:
+            if idx < len(rows) and rows[idx][1] is child:
+                idx += 1
+                continue
+            iter = self._node_rows.get(child)
+            if iter is not None:
+                # moved, because the sort values of its first track changed
+                rows = [row for row in rows if row[1] is not child]
+                self._remove_node_row(iter)
+            sibling = rows[idx][0] if idx < len(rows) else None
+            self._insert_row(
+                parent, sibling, self._get_node_row(self.collection_tree, child)
+            )
+
+        if parent is None:
+            self._insert_separators()
+
+    def _get_node_row(self, tree, node):
+        """
+        :returns: the values of the row of a node in the model
+        """
+        tags = tree.order.get_sort_tags(node.depth)
+        image = getattr(self, "%s_image" % tags[-1], None)
+        label = node.label
+        if _DISPLAY_TRACK_COUNTS.value and node.children:
+            label = "%s (%s)" % (label, len(node))
+        return [image, label, node.match_query, node]
+
+    def _get_child_rows(self, tree, node):
+        """
+        Computes the rows for the children of a node, with separators
+        between top level rows that start with different characters if
+        enabled. Doesn't touch the model, so it can run in any thread.
+
+        :returns: a list of row values
+        """
+        draw_seps = node is tree.root and _DRAW_SEPARATORS.value
+        last_char = None
+        rows = []
+        for child in node.get_children():
+            if draw_seps:
+                char = first_meaningful_char(child.sort_key[0])
+                if last_char is not None and char != last_char:
+                    rows.append([None, None, None, None])
+                last_char = char
+            rows.append(self._get_node_row(tree, child))
+        return rows
+
+    def _insert_row(self, parent, sibling, row):
+        """
+        Adds a row before the row sibling, or after the last child row
+        of parent if sibling is None
+
+        :returns: the Gtk.TreeIter of the new row
+        """
+        iter = self.model.insert_before(parent, sibling, row)
+        node = row[3]
+        if node is not None:
+            self._node_rows[node] = iter
+            if node.children:
+                self.model.append(iter, [None, None, None, None])
+        return iter
+
+    def _remove_node_row(self, iter):
+        """
+        Removes a row along with its children
+        """
+        node = self.model.get_value(iter, 3)
+        if node is not None:
+            del self._node_rows[node]
+            child = self.model.iter_children(iter)
+            while child is not None:
+                next_child = self.model.iter_next(child)
+                self._remove_node_row(child)
+                child = next_child
+        self.model.remove(iter)
+
+    def _insert_separators(self):
+        """
+        Adds separators between top level rows that start with different
+        characters, if enabled
+        """
+        if not _DRAW_SEPARATORS.value:
+            return
+        last_char = None
+        iter = self.model.iter_children(None)
+        while iter is not None:
+            node = self.model.get_value(iter, 3)
+            char = first_meaningful_char(node.sort_key[0])
+            if last_char is not None and char != last_char:
+                self.model.insert_before(None, iter, [None, None, None, None])
+            last_char = char
+            iter = self.model.iter_next(iter)
+
     def resort_tracks(self):
         # import time
         # print("sorting...", time.clock())
         self.sorted_tracks = trax.sort_tracks(
             self.order.get_sort_tags(0), self.collection.get_tracks()
         )
+        self._resort_needed = False
         # print("sorted.", time.clock())
 
+    @staticmethod
+    def _get_keyword_tags(order):
+        tags = list(SEARCH_TAGS)
+        tags += order.all_search_tags()
+        return list(set(tags))  # uniquify list to speed up search
+
     def load_tree(self):
         """
         Loads the Gtk.TreeView for this collection panel.
 
         Loads tracks based on the current keyword, or all the tracks in
-        the collection associated with this panel
+        the collection associated with this panel. Searching and grouping
+        the tracks happens in a thread, and the rows are added a slice at
+        a time. Loading again cancels a load that is still running.
+
+        When the keyword narrows down the one the tree shown was searched
+        with, only the tracks of that tree are searched.
         """
         logger.debug("Reloading collection tree")
         self.current_start_count = self.start_count
+        self._load_count += 1
+        self._load_started = time.perf_counter()
+        previous_tree = self.collection_tree if self._tree_complete else None
+        self._tree_complete = False
         self.tree.set_model(None)
         self.model.clear()
+        self._node_rows.clear()
+        self.tree.set_model(self.model)
+        self.collection_tree = None
+        self._pending_updates = []
 
         self.root = None
         oldorder = self.order
         self.order = self.orders[self.choice.get_active()]
 
         if not oldorder or oldorder != self.order:
-            self.resort_tracks()
+            self._full_tree = None
+            self._resort_needed = True
 
         # save the active view setting
         settings.set_option('gui/collection_active_view', self.choice.get_active())
 
         keyword = self.keyword.strip()
-        tags = list(SEARCH_TAGS)
-        tags += self.order.all_search_tags()
-        tags = list(set(tags))  # uniquify list to speed up search
+        if previous_tree is not None and (
+            previous_tree.order is not self.order
+            or not trax.is_search_refinement(
+                self._tree_keyword, keyword, case_sensitive=False
+            )
+        ):
+            previous_tree = None
+
+        if not keyword and self._full_tree is not None:
+            # only the rows need creating
+            tree = self._full_tree
+            tree.take_changes()
+            self._on_tree_built(
+                self._load_count,
+                self.sorted_tracks,
+                tree,
+                keyword,
+                self._get_child_rows(tree, tree.root),
+            )
+        elif previous_tree is not None:
+            logger.debug(
+                "Searching the %d tracks matching %r",
+                len(previous_tree),
+                self._tree_keyword,
+            )
+            self._build_tree(
+                self._load_count,
+                self.order,
+                keyword,
+                self.sorted_tracks,
+                list(previous_tree.root.tracks),
+            )
+        else:
+            self._build_tree(
+                self._load_count,
+                self.order,
+                keyword,
+                None if self._resort_needed else self.sorted_tracks,
+            )
 
-        self.tracks = list(
-            trax.search_tracks_from_string(
-                self.sorted_tracks, keyword, case_sensitive=False, keyword_tags=tags
+    @common.threaded
+    def _build_tree(self, load_count, order, keyword, sorted_tracks, candidates=None):
+        """
+        Searches and groups the tracks for load_tree, and computes the
+        top level rows, without touching the model
+
+        :param load_count: the load this is for, stops when a newer one
+            started
+        :param sorted_tracks: the tracks sorted by the first level, or
+            None to sort them
+        :param candidates: the tracks to search instead of sorted_tracks
+        """
+        if sorted_tracks is None:
+            sorted_tracks = trax.sort_tracks(
+                order.get_sort_tags(0), self.collection.get_tracks()
+            )
+        tracks = sorted_tracks
+        if keyword:
+            if candidates is None:
+                candidates = sorted_tracks
+            tracks = trax.search_tracks_from_string(
+                self._iter_until_cancelled(load_count, candidates),
+                keyword,
+                case_sensitive=False,
+                keyword_tags=self._get_keyword_tags(order),
+                index=self.collection.search_index,
             )
+
+        tree = CollectionTree(order)
+        batch = []
+        for track in tracks:
+            batch.append(track)
+            if len(batch) == _LOAD_BATCH:
+                if load_count != self._load_count:
+                    return
+                tree.add_tracks(batch)
+                batch = []
+        tree.add_tracks(batch)
+        tree.take_changes()
+        if load_count != self._load_count:
+            return
+
+        rows = self._get_child_rows(tree, tree.root)
+        GLib.idle_add(
+            self._on_tree_built, load_count, sorted_tracks, tree, keyword, rows
         )
 
-        self.load_subtree(None)
+    def _iter_until_cancelled(self, load_count, tracks):
+        """
+        Yields the tracks, stopping early once a newer load started, so
+        that searches matching few tracks are cancelled too
+        """
+        for n, track in enumerate(tracks):
+            if n % _LOAD_BATCH == 0 and load_count != self._load_count:
+                return
+            yield track
 
-        self.tree.set_model(self.model)
+    def _on_tree_built(self, load_count, sorted_tracks, tree, keyword, rows):
+        """
+        Shows a tree built for load_tree, adding its top level rows a
+        slice at a time so that the UI stays responsive
+        """
+        if load_count != self._load_count:
+            return False
+
+        if sorted_tracks is not self.sorted_tracks:
+            self.sorted_tracks = sorted_tracks
+            self._resort_needed = False
+        if not keyword:
+            self._full_tree = tree
+        self.collection_tree = tree
+        self._tree_keyword = keyword
+        self._tree_complete = True
+        pending = self._pending_updates
+        self._pending_updates = []
+        for tracks, removed_locs in pending:
+            # the rows are updated once they are all added
+            self._update_trees(tracks, removed_locs)
 
-        self.emit('collection-tree-loaded')
+        to_expand = []
+        rows = iter(rows)
+
+        def add_rows():
+            if load_count != self._load_count:
+                return False
+            start = time.perf_counter()
+            first = not self._node_rows
+            done = True
+            for row in rows:
+                it = self._insert_row(None, None, row)
+                if row[3] is not None and row[3].expand:
+                    to_expand.append(it)
+                if time.perf_counter() - start >= _ROWS_BUDGET:
+                    done = False
+                    break
+            if first:
+                logger.debug(
+                    "First collection rows for %r after %.3fs",
+                    keyword,
+                    time.perf_counter() - self._load_started,
+                )
+            if not done:
+                return True
+            self._loaded_count = load_count
+            self._expand_rows(to_expand)
+            self.emit('collection-tree-loaded')
+            return False
+
+        if add_rows():
+            GLib.idle_add(add_rows)
+        return False
+
+    def _expand_rows(self, iters):
+        """
+        Expands the rows of nodes with tracks matching the keyword on
+        tags of lower levels, unless there are too many of them
+        """
+        if (
+            settings.get_option("gui/expand_enabled", True)
+            and len(iters) < settings.get_option("gui/expand_maximum_results", 100)
+            and len(self.keyword.strip())
+            >= settings.get_option("gui/expand_minimum_term_length", 2)
+        ):
+            for it in iters:
+                GLib.idle_add(self.tree.expand_row, self.model.get_path(it), False)
 
     def _expand_node_by_name(self, search_num, parent, name, rest=None):
         """
@@ -597,6 +1189,7 @@ class CollectionPanel(panel.Panel):
         iter_sep = None
         if parent is None:
             depth = 0
+            node = self.collection_tree.root
         else:
             if (
                 self.model.iter_n_children(parent) != 1
@@ -605,124 +1198,24 @@ class CollectionPanel(panel.Panel):
                 previously_loaded = True
             iter_sep = self.model.iter_children(parent)
             depth = self.model.iter_depth(parent) + 1
+            node = self.model.get_value(parent, 3)
         if previously_loaded:
             return
 
-        search = self.get_node_search_terms(parent)
-
-        try:
-            tags = self.order.get_sort_tags(depth)
-            matchers = [trax.TracksMatcher(search)]
-            srtrs = trax.search_tracks(self.tracks, matchers)
-            # sort only if we are not on top level, because tracks are
-            # already sorted by fist order
-            if depth > 0:
-                srtrs = trax.sort_result_tracks(tags, srtrs)
-        except IndexError:
+        if depth >= len(self.order):
             return  # at the bottom of the tree
-        try:
-            image = getattr(self, "%s_image" % tags[-1])
-        except Exception:
-            image = None
-        bottom = False
-        if depth == len(self.order) - 1:
-            bottom = True
-
-        display_counts = settings.get_option('gui/display_track_counts', True)
-        draw_seps = settings.get_option('gui/draw_separators', True)
-        last_char = ''
-        last_val = ''
-        last_dval = ''
-        last_matchq = ''
-        count = 0
-        first = True
-        path = None
-        expanded = False
-        to_expand = []
-
-        for srtr in srtrs:
-            # The value returned by get_tag_sort() may be of other
-            # typa than str (e.g., an int for track number), hence
-            # explicit conversion via str() is necessary.
-            stagvals = [str(srtr.track.get_tag_sort(x)) for x in tags]
-            stagval = " ".join(stagvals)
-            if last_val != stagval or bottom:
-                tagval = self.order.format_track(depth, srtr.track)
-                match_query = " ".join(
-                    [srtr.track.get_tag_search(t, format=True) for t in tags]
-                )
-                if bottom:
-                    match_query += " " + srtr.track.get_tag_search("__loc", format=True)
-
-                # Different *sort tags can cause stagval to not match
-                # but the below code will produce identical entries in
-                # the displayed tree.  This condition checks to ensure
-                # that new entries are added if and only if they will
-                # display different results, avoiding that problem.
-                if match_query != last_matchq or tagval != last_dval or bottom:
-                    if display_counts and path and not bottom:
-                        iter = self.model.get_iter(path)
-                        val = self.model.get_value(iter, 1)
-                        val = "%s (%s)" % (val, count)
-                        self.model.set_value(iter, 1, val)
-                        count = 0
-
-                    last_val = stagval
-                    last_dval = tagval
-                    if depth == 0 and draw_seps:
-                        val = srtr.track.get_tag_sort(tags[0])
-                        char = first_meaningful_char(val)
-                        if first:
-                            last_char = char
-                        else:
-                            if char != last_char and last_char != '':
-                                self.model.append(parent, [None, None, None])
-                            last_char = char
-                    first = False
-
-                    last_matchq = match_query
-                    iter = self.model.append(parent, [image, tagval, match_query])
-                    path = self.model.get_path(iter)
-                    expanded = False
-                    if not bottom:
-                        self.model.append(iter, [None, None, None])
-            count += 1
-            if not expanded:
-                alltags = []
-                for i in range(depth + 1, len(self.order)):
-                    alltags.extend(self.order.get_sort_tags(i))
-                for t in alltags:
-                    if t in srtr.on_tags:
-                        # keep original path intact for following block
-                        newpath = path
-                        if depth > 0:
-                            # for some reason, nested iters are always
-                            # off by one in the terminal entry.
-                            newpath = Gtk.TreePath.new_from_indices(
-                                newpath[:-1] + [newpath[-1] - 1]
-                            )
-                        to_expand.append(newpath)
-                        expanded = True
-
-        if display_counts and path and not bottom:
-            iter = self.model.get_iter(path)
-            val = self.model.get_value(iter, 1)
-            val = "%s (%s)" % (val, count)
-            self.model.set_value(iter, 1, val)
-            count = 0
 
-        if (
-            settings.get_option("gui/expand_enabled", True)
-            and len(to_expand) < settings.get_option("gui/expand_maximum_results", 100)
-            and len(self.keyword.strip())
-            >= settings.get_option("gui/expand_minimum_term_length", 2)
-        ):
-            for row in to_expand:
-                GLib.idle_add(self.tree.expand_row, row, False)
+        to_expand = []
+        for row in self._get_child_rows(self.collection_tree, node):
+            iter = self._insert_row(parent, None, row)
+            if row[3] is not None and row[3].expand:
+                to_expand.append(iter)
 
         if iter_sep is not None:
             self.model.remove(iter_sep)
 
+        self._expand_rows(to_expand)
+
 
 class CollectionDragTreeView(DragTreeView):
     """
@@ -791,10 +1284,9 @@ class CollectionDragTreeView(DragTreeView):
         :return: list of tracks [xl.trax.Track]
         """
         it = self.get_model().get_iter(path)
-        search = self.container.get_node_search_terms(it)
-        matcher = trax.TracksMatcher(search)
-        for i in trax.search_tracks(self.container.tracks, [matcher]):
-            yield i.track
+        node = self.get_model().get_value(it, 3)
+        if node is not None:
+            yield from node.tracks
 
 
 # vim: et sts=4 sw=4
@@ -67,7 +67,7 @@ class LyricsPanel(panel.Panel):
         self.__initialize_widgets()
 
         event.add_ui_callback(self.__on_playback_track_start, 'playback_track_start')
-        event.add_ui_callback(self.__on_track_tags_changed, 'track_tags_changed')
+        event.add_ui_callback(self.__on_tracks_tags_changed, 'tracks_tags_changed')
         event.add_ui_callback(self.__on_playback_player_end, 'playback_player_end')
         event.add_ui_callback(
             self.__on_lyrics_search_method_added, 'lyrics_search_method_added'
@@ -113,8 +113,9 @@ class LyricsPanel(panel.Panel):
     def __on_lyrics_search_method_added(self, _eventtype, _lyrics, _provider):
         self.__update_lyrics()
 
-    def __on_track_tags_changed(self, _eventtype, track, tags):
-        if player.PLAYER.current == track and tags & {"artist", "title"}:
+    def __on_tracks_tags_changed(self, _eventtype, _obj, changes):
+        tags = changes.get(player.PLAYER.current)
+        if tags is not None and tags & {"artist", "title"}:
             self.__update_lyrics()
 
     def __on_playback_track_start(self, _eventtype, _player, _data):
@@ -470,7 +470,7 @@ class PlaylistsPanel(panel.Panel, BasePlaylistPanelMixin):
         )
 
     def _connect_events(self):
-        event.add_ui_callback(self.refresh_playlists, 'track_tags_changed')
+        event.add_ui_callback(self.refresh_playlists, 'tracks_tags_changed')
         event.add_ui_callback(
             self._on_playlist_added, 'playlist_added', self.playlist_manager
         )
@@ -482,15 +482,14 @@ class PlaylistsPanel(panel.Panel, BasePlaylistPanelMixin):
         if isinstance(pl, SmartPlaylist):
             self.edit_selected_smart_playlist()
 
-    def refresh_playlists(self, type, track, tags):
+    def refresh_playlists(self, type, obj, changes):
         """
         wrapper so that multiple events dont cause multiple
         reloads in quick succession
         """
-        if settings.get_option('gui/sync_on_tag_change', True) and tags & {
-            'title',
-            'artist',
-        }:
+        if settings.get_option('gui/sync_on_tag_change', True) and any(
+            tags & {'title', 'artist'} for tags in changes.values()
+        ):
             self._refresh_playlists()
 
     @common.glib_wait(500)
@@ -200,55 +200,64 @@ class TrackPropertiesDialog(GObject.GObject):
         else:
             track.set_tag_disk(tag, value)
 
-    def _tags_write(self, data):
-        errors = []
-        dialog = SavingProgressWindow(self.dialog, len(data))
-        for n, trackdata in data:
-            track = self.tracks[n]
-            poplist = []
+    def _write_track_tags(self, track, trackdata):
+        """
+        Writes the tags edited in the dialog to a track
 
-            try:
-                for tag in trackdata:
-                    if not tag.startswith("__"):
-                        if tag in ("tracknumber", "discnumber") and trackdata[tag] == [
-                            "0/0"
-                        ]:
-                            poplist.append(tag)
-                            continue
-                        self._write_tag(track, tag, trackdata[tag])
-                    elif tag in ('__startoffset', '__stopoffset'):
-                        try:
-                            offset = int(trackdata[tag][0])
-                        except ValueError:
-                            poplist.append(tag)
-                        else:
-                            track.set_tag_raw(tag, offset)
-
-                # In case a tag has been removed..
-                for tag in track.list_tags():
-                    if tag in tag_data:
-                        if tag_data[tag] is not None:
-                            try:
-                                trackdata[tag]
-                            except KeyError:
-                                poplist.append(tag)
+        :returns: whether the tags could be written
+        """
+        poplist = []
+
+        try:
+            for tag in trackdata:
+                if not tag.startswith("__"):
+                    if tag in ("tracknumber", "discnumber") and trackdata[tag] == [
+                        "0/0"
+                    ]:
+                        poplist.append(tag)
+                        continue
+                    self._write_tag(track, tag, trackdata[tag])
+                elif tag in ('__startoffset', '__stopoffset'):
+                    try:
+                        offset = int(trackdata[tag][0])
+                    except ValueError:
+                        poplist.append(tag)
                     else:
+                        track.set_tag_raw(tag, offset)
+
+            # In case a tag has been removed..
+            for tag in track.list_tags():
+                if tag in tag_data:
+                    if tag_data[tag] is not None:
                         try:
                             trackdata[tag]
                         except KeyError:
                             poplist.append(tag)
+                else:
+                    try:
+                        trackdata[tag]
+                    except KeyError:
+                        poplist.append(tag)
 
-                for tag in poplist:
-                    self._write_tag(track, tag, None)
+            for tag in poplist:
+                self._write_tag(track, tag, None)
 
-                if not track.write_tags():
+            return track.write_tags()
+        except Exception:
+            logger.warning("Error saving track", exc_info=True)
+            return False
+
+    def _tags_write(self, data):
+        errors = []
+        dialog = SavingProgressWindow(self.dialog, len(data))
+        with trax.batch_tags_changed():
+            for n, trackdata in data:
+                track = self.tracks[n]
+                if not self._write_track_tags(track, trackdata):
                     errors.append(track.get_loc_for_io())
-            except Exception:
-                logger.warning("Error saving track", exc_info=True)
-                errors.append(track.get_loc_for_io())
 
-            trax.track._CACHER.remove(track)
-            dialog.step()
+                trax.track._CACHER.remove(track)
+                dialog.step()
         dialog.destroy()
 
         if len(errors) > 0:
@@ -122,7 +122,7 @@ class TrackInfoPane(Gtk.Bin):
                 'playback_toggle_pause',
                 'playback_error',
             ]
-            events = ['track_tags_changed', 'cover_set', 'cover_removed']
+            events = ['tracks_tags_changed', 'cover_set', 'cover_removed']
 
             if auto_update:
                 for e in p_evts:
@@ -304,16 +304,16 @@ class TrackInfoPane(Gtk.Bin):
         """
         self.clear()
 
-    def on_track_tags_changed(self, event, track, tags):
+    def on_tracks_tags_changed(self, event, obj, changes):
         """
         Updates the info pane on tag changes
         """
         if (
             self.__player is not None
             and not self.__player.is_stopped()
-            and track is self.__track
+            and self.__track in changes
         ):
-            self.set_track(track)
+            self.set_track(self.__track)
 
     def on_cover_set(self, event, covers, track):
         """
@@ -31,6 +31,7 @@ from gi.repository import GObject
 from gi.repository import Gtk
 from gi.repository import Pango
 
+import contextlib
 import logging
 import sys
 
@@ -45,6 +46,8 @@ from xlgui import guiutil, icons
 
 logger = logging.getLogger(__name__)
 
+_SYNC_ON_TAG_CHANGE = settings.LiveOption('gui/sync_on_tag_change', True)
+
 
 def default_get_playlist_func(parent, context):
     return player.QUEUE.current_playlist
@@ -1173,24 +1176,15 @@ class PlaylistView(AutoScrollTreeView, providers.ProviderHandler):
         self.queue_draw()
 
     def _setup_models(self):
+        # the model contains the tracks of the playlist right away, so this
+        # doesn't see the initial rows
         self.model = PlaylistModel(self.playlist, [], self.player, self)
-        self.__setup_model_hook = self.model.connect(
-            'data-loading', self._on_after_model_loading
-        )
+        self.model.connect('row-inserted', self.on_row_inserted)
 
         self.modelfilter = self.model.filter_new()
         self.modelfilter.set_visible_func(self._modelfilter_visible_func)
         self.set_model(self.modelfilter)
 
-    def _on_after_model_loading(self, ar1, now_loading):
-        """
-        This is necessary to ensure that row-insert is connected after the initial loading
-        due to threaded PlaylistModel::_load_data_thread and playlists greater than 500 tracks
-        """
-        if not now_loading:
-            self.model.connect('row-inserted', self.on_row_inserted)
-            self.model.disconnect(self.__setup_model_hook)
-
     def _modelfilter_visible_func(self, model, iter, data):
         if self._filter_matcher is not None:
             track = model.get_value(iter, 0)
@@ -1808,9 +1802,24 @@ class PlaylistView(AutoScrollTreeView, providers.ProviderHandler):
         )
 
 
-class PlaylistModel(Gtk.ListStore):
+def _consecutive_runs(tracks):
+    """
+    Groups (position, track) pairs by consecutive positions
+
+    :returns: a list of (first position, tracks) pairs
+    """
+    runs = []
+    for position, track in tracks:
+        if runs and runs[-1][0] + len(runs[-1][1]) == position:
+            runs[-1][1].append(track)
+        else:
+            runs.append((position, [track]))
+    return runs
+
+
+class PlaylistModel(GObject.Object, Gtk.TreeModel):
     """
-    This ListStore contains all the information needed to render a playlist
+    This TreeModel contains all the information needed to render a playlist
     via a PlaylistView. There are five columns:
 
     * xl.trax.Track
@@ -1819,6 +1828,10 @@ class PlaylistModel(Gtk.ListStore):
     * boolean (indicates whether row is sensitive)
     * Pango.Weight (indicates if row is the playing track or not)
 
+    The model only keeps a list of the tracks of the playlist. The values
+    of a row are computed when a view asks for them, so that a playlist
+    doesn't need one stored row per track before it can be shown.
+
     The cache keys correspond to the tags rendered by each column. When a
     track changes, the row's corresponding cache is cleared and the row
     change event is fired.
@@ -1841,18 +1854,35 @@ class PlaylistModel(Gtk.ListStore):
 
     PARAM_COLS = (COL_PIXBUF, COL_SENSITIVE, COL_WEIGHT)
 
+    COLUMN_TYPES = (
+        GObject.TYPE_PYOBJECT,
+        GObject.TYPE_PYOBJECT,
+        GdkPixbuf.Pixbuf.__gtype__,
+        GObject.TYPE_BOOLEAN,
+        Pango.Weight.__gtype__,
+    )
+
     def __init__(self, playlist, column_names, player, parent):
-        # columns: Track, Pixbuf, dict (cache)
-        Gtk.ListStore.__init__(
-            self, object, object, GdkPixbuf.Pixbuf, bool, Pango.Weight
-        )
+        GObject.Object.__init__(self)
         self.playlist = playlist
         self.player = player
 
         self._set_columns(column_names)
 
+        # The track of each row, and the tag cache and row params of the
+        # rows that were rendered. While rows are added or removed, the
+        # lists contain rows that views don't know about yet or anymore,
+        # see _insert_rows and _remove_rows.
+        self._tracks = list(playlist)
+        self._caches = [None] * len(self._tracks)
+        self._params = [None] * len(self._tracks)
+        self._hidden_start = 0
+        self._hidden_count = 0
+        self._stamp = 0
+        # track: its rows, see _get_track_rows
+        self._track_rows = None
+
         self.data_loading = False
-        self.data_load_queue = []
 
         self._redraw_timer = None
         self._redraw_queue = []
@@ -1903,15 +1933,15 @@ class PlaylistModel(Gtk.ListStore):
             destroy_with=parent,
         )
         event.add_ui_callback(
-            self.on_track_tags_changed, "track_tags_changed", destroy_with=parent
+            self.on_tracks_tags_changed, "tracks_tags_changed", destroy_with=parent
         )
 
         event.add_ui_callback(self.on_option_set, "gui_option_set", destroy_with=parent)
 
         self._setup_icons()
-        self.on_tracks_added(
-            None, self.playlist, list(enumerate(self.playlist))
-        )  # populate the list
+
+    def __len__(self):
+        return len(self._tracks) - self._hidden_count
 
     def _set_columns(self, column_names):
         self.column_names = set(column_names)
@@ -1960,12 +1990,8 @@ class PlaylistModel(Gtk.ListStore):
 
     def _refresh_icons(self):
         self._setup_icons()
-        itr = self.get_iter_first()
-        position = 0
-        while itr:
-            self.set(itr, self.PARAM_COLS, self._compute_row_params(position))
-            itr = self.iter_next(itr)
-            position += 1
+        self._params = [None] * len(self._tracks)
+        self._rows_changed(0, len(self))
 
     def on_option_set(self, typ, obj, data):
         if data == "gui/playlist_font":
@@ -2017,18 +2043,109 @@ class PlaylistModel(Gtk.ListStore):
         return pixbuf, sensitive, weight
 
     def update_row_params(self, position):
-        itr = self.iter_nth_child(None, position)
-        if itr is not None:
-            self.set(itr, self.PARAM_COLS, self._compute_row_params(position))
+        if 0 <= position < len(self):
+            self._params[self._to_index(position)] = None
+            self._rows_changed(position, position + 1)
+
+    ### Gtk.TreeModel implementation ###
+
+    def _to_index(self, row):
+        """
+        :returns: the index in the internal lists of a row of the views
+        """
+        if row >= self._hidden_start:
+            return row + self._hidden_count
+        return row
+
+    def _new_iter(self, row):
+        itr = Gtk.TreeIter()
+        itr.stamp = self._stamp
+        # 0 would be read back as None
+        itr.user_data = row + 1
+        return itr
+
+    def _rows_changed(self, start, stop):
+        for row in range(start, stop):
+            self.row_changed(Gtk.TreePath((row,)), self._new_iter(row))
+
+    def do_get_flags(self):
+        return Gtk.TreeModelFlags.LIST_ONLY
+
+    def do_get_n_columns(self):
+        return len(self.COLUMN_TYPES)
+
+    def do_get_column_type(self, column):
+        return self.COLUMN_TYPES[column]
+
+    def do_get_iter(self, path):
+        indices = path.get_indices()
+        if len(indices) == 1 and 0 <= indices[0] < len(self):
+            return True, self._new_iter(indices[0])
+        return False, None
+
+    def do_get_path(self, itr):
+        return Gtk.TreePath((itr.user_data - 1,))
+
+    def do_get_value(self, itr, column):
+        index = self._to_index(itr.user_data - 1)
+
+        if column == self.COL_TRACK:
+            return self._tracks[index]
+
+        if column == self.COL_CACHE:
+            cache = self._caches[index]
+            if cache is None:
+                cache = self._caches[index] = {}
+            return cache
+
+        params = self._params[index]
+        if params is None:
+            params = self._params[index] = self._compute_row_params(index)
+        return params[column - self.COL_PIXBUF]
+
+    def do_iter_next(self, itr):
+        # user_data is the row + 1, so this checks whether the next row exists
+        if itr.user_data < len(self):
+            itr.user_data += 1
+            return True, itr
+        return False, None
+
+    def do_iter_previous(self, itr):
+        if itr.user_data > 1:
+            itr.user_data -= 1
+            return True, itr
+        return False, None
+
+    def do_iter_children(self, parent):
+        return self.do_iter_nth_child(parent, 0)
+
+    def do_iter_has_child(self, itr):
+        return False
+
+    def do_iter_n_children(self, itr):
+        if itr is None:
+            return len(self)
+        return 0
+
+    def do_iter_nth_child(self, parent, n):
+        if parent is None and 0 <= n < len(self):
+            return True, self._new_iter(n)
+        return False, None
+
+    def do_iter_parent(self, child):
+        return False, None
 
     ### Event callbacks to keep the model in sync with the playlist ###
 
     def on_tracks_added(self, event_type, playlist, tracks):
-        self._load_data(tracks)
+        with self._loading(len(tracks)):
+            for position, run in _consecutive_runs(tracks):
+                self._insert_rows(position, run)
 
     def on_tracks_removed(self, event_type, playlist, tracks):
-        for position, track in reversed(tracks):
-            self.remove(self.iter_nth_child(None, position))
+        with self._loading(len(tracks)):
+            for position, run in reversed(_consecutive_runs(tracks)):
+                self._remove_rows(position, len(run))
 
     def on_current_position_changed(self, event_type, playlist, positions):
         for position in positions:
@@ -2037,18 +2154,9 @@ class PlaylistModel(Gtk.ListStore):
             self.update_row_params(position)
 
     def on_spat_position_changed(self, event_type, playlist, positions):
-        pos = min(positions)
-
-        if pos < 0:
-            pos = 0
-            itr = self.get_iter_first()
-        else:
-            itr = self.iter_nth_child(None, pos)
-
-        while itr:
-            self.set(itr, self.PARAM_COLS, self._compute_row_params(pos))
-            itr = self.iter_next(itr)
-            pos += 1
+        pos = max(min(positions), 0)
+        self._params[pos:] = [None] * (len(self._params) - pos)
+        self._rows_changed(pos, len(self))
 
     def on_playback_state_change(self, event_type, player_obj, track):
         position = self.playlist.current_position
@@ -2056,17 +2164,19 @@ class PlaylistModel(Gtk.ListStore):
             return
         self.update_row_params(position)
 
-    def on_track_tags_changed(self, type, track, tags):
-        if (
-            not track
-            or not settings.get_option('gui/sync_on_tag_change', True)
-            or not (tags & self.column_names)
-        ):
+    def on_tracks_tags_changed(self, type, obj, changes):
+        if not _SYNC_ON_TAG_CHANGE.value:
+            return
+        column_names = self.column_names
+        tracks = [
+            track for track, tags in changes.items() if track and tags & column_names
+        ]
+        if not tracks:
             return
 
         if self._redraw_timer:
             GLib.source_remove(self._redraw_timer)
-        self._redraw_queue.append(track)
+        self._redraw_queue.extend(tracks)
         self._redraw_timer = GLib.timeout_add(100, self._on_track_tags_changed)
 
     def _on_track_tags_changed(self):
@@ -2074,64 +2184,104 @@ class PlaylistModel(Gtk.ListStore):
         redraw_queue = set(self._redraw_queue)
         self._redraw_queue = []
 
-        COL_TRACK = self.COL_TRACK
-        COL_CACHE = self.COL_CACHE
+        track_rows = self._get_track_rows()
+        for track in redraw_queue:
+            for row in track_rows.get(track, ()):
+                cache = self._caches[row]
+                if cache is not None:
+                    cache.clear()
+                self._rows_changed(row, row + 1)
+
+    def _get_track_rows(self):
+        """
+        :returns: a dictionary of the rows of each track
+        """
+        track_rows = self._track_rows
+        if track_rows is None:
+            track_rows = self._track_rows = {}
+            for row, track in enumerate(self._tracks):
+                rows = track_rows.get(track)
+                if rows is None:
+                    track_rows[track] = [row]
+                else:
+                    rows.append(row)
+        return track_rows
+
+    def _update_track_rows(self, position, tracks, added):
+        """
+        Updates the rows of the tracks when rows are added or removed at
+        the end of the model, which doesn't move other rows. Other changes
+        drop the rows, to be found again when they are needed.
+        """
+        track_rows = self._track_rows
+        if track_rows is None:
+            return
+
+        if position + (0 if added else len(tracks)) != len(self._tracks):
+            self._track_rows = None
+            return
 
-        for row in self:
-            if row[COL_TRACK] in redraw_queue:
-                row[COL_CACHE].clear()
-                self.row_changed(row.path, row.iter)
+        for row, track in enumerate(tracks, position):
+            if added:
+                track_rows.setdefault(track, []).append(row)
+            else:
+                rows = track_rows[track]
+                rows.remove(row)
+                if not rows:
+                    del track_rows[track]
 
     #
-    # Loading data into the playlist:
+    # Adding and removing rows:
     #
-    # - Profiler reveals that most of the playlist loading time is spent in two
-    #   places
-    #   - Formatting values
-    #   - Converting them to GValue objects for insert into the treeview
+    # Views expect to be told about each added or removed row separately,
+    # and query the model in between. The internal lists are changed once
+    # for a run of rows, and the rows not announced yet are hidden from the
+    # views by _to_index.
     #
-    # Now, the program is annoyingly blocked when this happens, so we need to
-    # process new tracks on a different thread, and show some kind of loading
-    # indicator instead. That's what these four functions help us do.
+    # Views are detached while many rows change, which is much faster than
+    # updating them for every row.
     #
 
-    def _load_data(self, tracks):
-        # Don't allow race condition between adds.. there's probably a race
-        # condition for removal
-        if self.data_loading:
-            self.data_load_queue.extend(tracks)
+    @contextlib.contextmanager
+    def _loading(self, count):
+        if count <= 500 or self.data_loading:
+            yield
             return
 
         self.data_loading = True
         self.emit('data-loading', True)
-
-        if len(tracks) > 500:
-            self._load_data_thread(tracks)
-        else:
-            render_data = self._load_data_fn(tracks)
-            self._load_data_done(render_data)
-
-    @common.threaded
-    def _load_data_thread(self, tracks):
-        render_data = self._load_data_fn(tracks)
-        GLib.idle_add(self._load_data_done, render_data)
-
-    def _load_data_fn(self, tracks):
-        indices = (0, 1, 2, 3, 4)
-        return [
-            (position, indices, (track, {}) + self._compute_row_params(position))
-            for position, track in tracks
-        ]
-
-    def _load_data_done(self, render_data):
-        for args in render_data:
-            self.insert_with_valuesv(*args)
-
-        self.data_loading = False
-        self.emit('data-loading', False)
-
-        if self.data_load_queue:
-            tracks = self.data_load_queue
-            self.data_load_queue = []
-
-            self._load_data(tracks)
+        try:
+            yield
+        finally:
+            self.data_loading = False
+            self.emit('data-loading', False)
+
+    def _insert_rows(self, position, tracks):
+        self._update_track_rows(position, tracks, True)
+        count = len(tracks)
+        self._tracks[position:position] = tracks
+        self._caches[position:position] = [None] * count
+        self._params[position:position] = [None] * count
+        self._stamp += 1
+
+        self._hidden_count = count
+        for row in range(position, position + count):
+            self._hidden_start = row + 1
+            self._hidden_count -= 1
+            self.row_inserted(Gtk.TreePath((row,)), self._new_iter(row))
+        self._hidden_start = 0
+
+    def _remove_rows(self, position, count):
+        self._stamp += 1
+
+        end = position + count
+        for row in reversed(range(position, end)):
+            self._hidden_start = row
+            self._hidden_count = end - row
+            self.row_deleted(Gtk.TreePath((row,)))
+
+        self._update_track_rows(position, self._tracks[position:end], False)
+        del self._tracks[position:end]
+        del self._caches[position:end]
+        del self._params[position:end]
+        self._hidden_start = self._hidden_count = 0